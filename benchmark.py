@@ -0,0 +1,243 @@
+"""
+Benchmark of the indexes over several table sizes and key distributions.
+
+Every trial builds the index anew and measures build, point look-ups, a batch look-up, insertions,
+updates and deletions. Timings of all trials are reported as percentiles, peak memory of the build
+is traced with tracemalloc in a separate run, as tracing slows the code down.
+Results are printed and written into a JSON file, so runs can be compared with each other.
+
+Usage example:
+    python benchmark.py --sizes 1000 10000 50000 --trials 7 --output results.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from functools import partial
+
+import tables.list_generators as lstgen
+from indexes.naive_index import NaiveIndex
+from indexes.bitmap_index import BitmapIndex
+from indexes.bitsliced_index import BitSlicedIndex
+from indexes.btree import BTree
+from indexes.bplus_tree import BPlusTree
+from indexes.hash_index import HashIndex
+from indexes.paged_btree import PagedBTree
+from indexes.roaring_bitmap import RoaringBitmap
+
+# index name -> (index constructor, whether only integer keys are supported)
+INDEXES = {
+    'Naive': (partial(NaiveIndex, vectorized=True), False),
+    'NaiveLoop': (NaiveIndex, False),
+    'Bitmap': (BitmapIndex, False),
+    'Roaring': (partial(BitmapIndex, bitmap_class=RoaringBitmap), False),
+    'BitSliced': (BitSlicedIndex, True),
+    'BTree': (BTree, False),
+    'BPlusTree': (BPlusTree, False),
+    'Hash': (HashIndex, False),
+    'PagedBTree': (PagedBTree, False),
+}
+
+# distribution name -> generator of a list of items
+DISTRIBUTIONS = {
+    'sequential': lstgen.get_list_of_items,
+    # about ten rows per key
+    'random': lambda size: lstgen.get_list_of_random_items(size, max_number=max(1, size // 10)),
+    'uuid': lstgen.get_list_with_string_keys,
+}
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(samples, q):
+    """
+    Computes a percentile with linear interpolation between the closest ranks.
+    :param samples:     sorted list of samples
+    :param q:           percentile, from 0 to 100
+    :return:            value of the percentile
+    """
+    position = (len(samples) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(samples) - 1)
+    return samples[lower] + (samples[upper] - samples[lower]) * (position - lower)
+
+
+def summarize(samples, operations):
+    """
+    Summarizes timings of an operation.
+    :param samples:     list of timings in seconds
+    :param operations:  number of operations measured by all the timings together
+    :return:            dictionary of statistics
+    """
+    samples = sorted(samples)
+    total = sum(samples)
+    summary = {'samples': len(samples), 'operations': operations, 'total_s': total,
+               'mean_s': total / len(samples), 'min_s': samples[0], 'max_s': samples[-1]}
+    for q in PERCENTILES:
+        summary['p{}_s'.format(q)] = percentile(samples, q)
+    summary['ops_per_s'] = operations / total if total > 0 else None
+    return summary
+
+
+def timed_calls(call, arguments):
+    """
+    Times every call separately.
+    :param call:        function to call
+    :param arguments:   list of arguments, one call per argument
+    :return:            list of timings in seconds
+    """
+    timer = time.perf_counter
+    timings = []
+    for argument in arguments:
+        if isinstance(argument, tuple):
+            start = timer()
+            call(*argument)
+        else:
+            start = timer()
+            call(argument)
+        timings.append(timer() - start)
+    return timings
+
+
+def run_trial(factory, table, extra_keys, args, rng):
+    """
+    Builds the index and measures all operations on it.
+    :param factory:     index constructor
+    :param table:       list of items
+    :param extra_keys:  keys for inserted and updated rows
+    :param args:        benchmark options
+    :param rng:         random generator choosing the keys and rows
+    :return:            dictionary of operation -> (timings, number of operations)
+    """
+    size = len(table)
+    lookup_keys = [table[rng.randrange(size)].key() for _ in range(args.lookups)]
+    batch_keys = [table[rng.randrange(size)].key() for _ in range(args.batch)]
+    mutations = min(args.mutations, size, len(extra_keys) // 2)
+    updated = [(rid, key) for rid, key in zip(rng.sample(range(size), mutations), extra_keys[mutations:])]
+    deleted = rng.sample(range(size + mutations), mutations)
+
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        index = factory(table)
+        build = time.perf_counter() - start
+        results = {
+            'build': ([build], 1),
+            'look_up': (timed_calls(index.look_up, lookup_keys), len(lookup_keys)),
+        }
+        start = time.perf_counter()
+        index.look_up_many(batch_keys)
+        results['look_up_many'] = ([time.perf_counter() - start], len(batch_keys))
+        results['insert'] = (timed_calls(index.insert, extra_keys[:mutations]), mutations)
+        results['update'] = (timed_calls(index.update, updated), mutations)
+        results['delete'] = (timed_calls(index.delete, deleted), mutations)
+    finally:
+        gc.enable()
+    if hasattr(index, 'close'):
+        index.close()
+    return results
+
+
+def measure_memory(factory, table):
+    """
+    Traces the peak memory allocated while building the index.
+    :param factory:     index constructor
+    :param table:       list of items
+    :return:            peak memory in bytes
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        index = factory(table)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if hasattr(index, 'close'):
+        index.close()
+    return peak
+
+
+def run(args):
+    """
+    Runs the benchmark for all combinations of the options.
+    :param args:    benchmark options
+    :return:        list of result records
+    """
+    records = []
+    for distribution in args.distributions:
+        for size in args.sizes:
+            random.seed(args.seed)
+            items = DISTRIBUTIONS[distribution](size + 2 * args.mutations)
+            table = items[:size]
+            extra_keys = [item.key() for item in items[size:]]
+            string_keys = type(table[0].key()) is str
+
+            for index_name in args.indexes:
+                factory, int_only = INDEXES[index_name]
+                if int_only and string_keys:
+                    continue
+                rng = random.Random(args.seed)
+                timings = {}
+                for _ in range(args.trials):
+                    for operation, (samples, operations) in run_trial(factory, table, extra_keys, args, rng).items():
+                        all_samples, all_operations = timings.get(operation, ([], 0))
+                        timings[operation] = (all_samples + samples, all_operations + operations)
+
+                peak = measure_memory(factory, table)
+                for operation, (samples, operations) in timings.items():
+                    record = {'index': index_name, 'distribution': distribution, 'size': size,
+                              'operation': operation}
+                    record.update(summarize(samples, operations))
+                    if operation == 'build':
+                        record['peak_memory_bytes'] = peak
+                    records.append(record)
+                report(records[-len(timings):])
+    return records
+
+
+def report(records):
+    """ Prints the records of one index """
+    for record in records:
+        line = "{index:>10} {distribution:>10} {size:>8} {operation:>12}: p50 {p50_s:.7f} s, p90 {p90_s:.7f} s, " \
+               "p99 {p99_s:.7f} s".format(**record)
+        if record['ops_per_s'] is not None and record['operation'] != 'build':
+            line += ", {:.0f} ops/s".format(record['ops_per_s'])
+        if 'peak_memory_bytes' in record:
+            line += ", peak memory {:.1f} KiB".format(record['peak_memory_bytes'] / 1024)
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the database indexes")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help="table sizes")
+    parser.add_argument('--distributions', nargs='+', default=list(DISTRIBUTIONS), choices=list(DISTRIBUTIONS),
+                        help="key distributions")
+    parser.add_argument('--indexes', nargs='+', default=list(INDEXES), choices=list(INDEXES), help="indexes")
+    parser.add_argument('--trials', type=int, default=5, help="number of trials, each on a new index")
+    parser.add_argument('--lookups', type=int, default=200, help="point look-ups per trial")
+    parser.add_argument('--batch', type=int, default=1000, help="keys of the batch look-up per trial")
+    parser.add_argument('--mutations', type=int, default=200, help="insertions, updates and deletions per trial")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the generated tables and queries")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file for the results")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    records = run(args)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version,
+            'platform': platform.platform(),
+            'options': vars(args),
+            'results': records,
+        }, f, indent=2)
+    print("\nResults are written into {}".format(args.output))
@@ -1,4 +1,6 @@
 import timeit
+from functools import partial
+from statistics import median
 
 import tables.list_generators as lstgen
 from tables.item import Item
@@ -7,6 +9,9 @@ from indexes.bitmap_index import BitmapIndex
 from indexes.btree import BTree
 from indexes.hash_index import HashIndex
 
+# number of timed look-ups per index, a single look-up is too noisy to compare indexes
+SEARCH_REPEATS = 25
+
 
 def build_indexes(table, index_classes):
     """
@@ -47,12 +52,12 @@ def test_search(indexes, table, item_of_interest):
 
         index = indexes[index_name]
 
-        # measuring search time
-        start = timeit.default_timer()
+        # measuring search time as the median of repeated look-ups
         row_ids = index.look_up(item_of_interest.key())
-        search_time = timeit.default_timer() - start
+        search_time = median(timeit.repeat(lambda: index.look_up(item_of_interest.key()),
+                                           number=1, repeat=SEARCH_REPEATS))
 
-        print("Elapsed time for {}: {:.7f} s".format(index_name, search_time))
+        print("Median time of {} searches for {}: {:.7f} s".format(SEARCH_REPEATS, index_name, search_time))
 
         if isinstance(index, NaiveIndex):
             naive_index_time = search_time
@@ -171,7 +176,8 @@ if __name__ == "__main__":
     print("Random item: ({0}, {1})\n".format(item_of_interest.key(), item_of_interest.value()))
 
     indexes_classes = {
-        'Naive': NaiveIndex,
+        # indexes are compared with a vectorized sequential scan, use NaiveIndex for the for-loop search
+        'Naive': partial(NaiveIndex, vectorized=True),
         'Bitmap': BitmapIndex,
         'BTree': BTree,
         'Hash': HashIndex
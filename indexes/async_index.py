@@ -0,0 +1,123 @@
+"""
+asyncio front-end of the indexes.
+
+Index calls run in an executor, so they do not block the event loop. Look-ups of the same key
+requested while an earlier one is waiting or running share its result, and distinct keys
+requested at once are probed together by a single look_up_many() call.
+"""
+
+import asyncio
+from itertools import chain
+
+
+class AsyncIndex:
+    """
+    Wraps any index with look_up_many() for use from coroutines.
+    Calls of the index are executed one at a time, so the index needs no thread safety;
+    look-ups arriving while a batch runs are collected into the next batch.
+    """
+
+    def __init__(self, index, executor=None, max_batch=1024):
+        """
+        Async index constructor.
+        :param index:       index with look_up_many(), e.g. BTree, HashIndex or BitmapIndex
+        :param executor:    concurrent.futures executor running the index calls, the default one of the loop if None
+        :param max_batch:   maximum number of distinct keys probed by one look_up_many() call
+        """
+        self.index = index
+        self.executor = executor
+        self.max_batch = max_batch
+        # futures of the keys waiting for the next batch and of the keys of the running batch
+        self._pending = dict()
+        self._running = dict()
+        self._flush_task = None
+        self._lock = None
+        self.batch_count = 0
+        self.coalesced_count = 0
+        if hasattr(index, 'range'):
+            self.range = self._range
+
+    async def look_up(self, key):
+        """
+        Returns a list of row ids in the table matching the key
+        :param key:     interest of search
+        :return:        list of row ids matching items
+        """
+        future = self._running.get(key) or self._pending.get(key)
+        if future is not None:
+            self.coalesced_count += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            if self._flush_task is None:
+                self._flush_task = loop.create_task(self._flush())
+        # a cancelled caller does not cancel the look-up shared with others
+        result = await asyncio.shield(future)
+        return list(result) if result is not None else None
+
+    async def look_up_many(self, keys):
+        """
+        Returns lists of row ids for many keys at once.
+        :param keys:    keys of interest
+        :return:        list of results of look_up aligned with the keys
+        """
+        return list(await asyncio.gather(*(self.look_up(key) for key in keys)))
+
+    async def _range(self, lo=None, hi=None, inclusive=True):
+        """ Returns a list of row ids of the range, set as range() of indexes wrapping a BPlusTree """
+        return await self._call(lambda: list(self.index.range(lo, hi, inclusive)))
+
+    async def insert(self, *keys):
+        await self._call(self.index.insert_many, keys)
+
+    async def insert_many(self, keys):
+        await self._call(self.index.insert_many, keys)
+
+    async def update(self, rid, key):
+        await self._call(self.index.update, rid, key)
+
+    async def delete(self, rid):
+        await self._call(self.index.delete, rid)
+
+    async def delete_many(self, rids):
+        await self._call(self.index.delete_many, rids)
+
+    async def _call(self, function, *args):
+        """
+        Runs a call of the index in the executor after the running one completes.
+        :param function:    function calling the index
+        :param args:        arguments of the function
+        :return:            result of the function
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def _flush(self):
+        """ Probes the pending keys batch by batch until no keys are left """
+        try:
+            while self._pending:
+                keys = list(self._pending)[:self.max_batch]
+                self._running = {key: self._pending.pop(key) for key in keys}
+                self.batch_count += 1
+                try:
+                    results = await self._call(self.index.look_up_many, keys)
+                except Exception as e:
+                    for future in self._running.values():
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for future, result in zip(self._running.values(), results):
+                        if not future.done():
+                            future.set_result(result)
+                self._running = dict()
+        finally:
+            # a cancelled flush cancels the look-ups left without a result, so their callers do not wait forever
+            for future in chain(self._running.values(), self._pending.values()):
+                if not future.done():
+                    future.cancel()
+            self._running = dict()
+            self._pending = dict()
+            self._flush_task = None
@@ -1,16 +1,32 @@
+import sys
+from array import array
 from ctypes import *
+from itertools import compress
 from math import ceil
+from tables.columnar import key_column, append_key, set_key, shares_keys
+from indexes.storage import MappedIndex, group_rows, read_index, write_index
+from indexes.bits import bit_positions, popcount
+
+# words of Bitmap are little-endian on every platform, so the bytes of a bit array are its bits in order
+_WORD = c_uint32.__ctype_le__
 
 
 class BitmapIndex:
     """Implements Uncompressed Bitmap Index."""
-    def __init__(self, table):
+    def __init__(self, table, bitmap_class=None):
         """
-        Hash Index constructor.
+        Bitmap Index constructor.
         :param table:           table with items (rows) upon which index is built
+        :param bitmap_class:    bitmap implementation, Bitmap (default) or IntBitmap
         """
+        self.bitmap_class = bitmap_class or Bitmap
         self.bitmap_table = dict()
-        self.keys = [item.key() for item in table]
+        self.keys = key_column(table)
+        self.keys_shared = shares_keys(table)
+        # number of rows shared by all bitmaps, which are extended up to it lazily
+        self.row_count = len(self.keys)
+        # rows present in the index, deleted rows are cleared here to be masked in bulk
+        self.existence = self.bitmap_class(self.row_count)
         self.build_index(table)
 
     def look_up(self, key):
@@ -23,19 +39,171 @@ class BitmapIndex:
             return None
         return self.bitmap_table[key].get_row_ids()
 
+    def look_up_many(self, keys):
+        """
+        Returns lists of row ids for many keys at once, the bitmap of every distinct key is decoded once.
+        :param keys:    keys of interest
+        :return:        list of results of look_up aligned with the keys
+        """
+        found = {}
+        for key in keys:
+            if key not in found:
+                bitmap = self.bitmap_table.get(key)
+                found[key] = bitmap.get_row_ids() if bitmap is not None else None
+        return [list(found[key]) if found[key] is not None else None for key in keys]
+
+    def query(self, expression):
+        """
+        Returns a list of row ids in the table matching a boolean expression over keys
+        built from bitmap_query predicates, e.g. In(a, b, c) & ~Eq(d)
+        :param expression:  bitmap_query.Expression
+        :return:            list of row ids matching items
+        """
+        bitmap = expression.evaluate(self)
+        return bitmap.get_row_ids() if bitmap is not None else []
+
+    def all_rows(self):
+        """
+        Returns a bitmap of all rows present in the index. It is owned by the index and should not be modified.
+        :return:    bitmap
+        """
+        return self.existence
+
+    @classmethod
+    def from_batches(cls, batches, bitmap_class=None):
+        """
+        Builds the index from batches of items, e.g. streamed from a file, without keeping the items.
+        :param batches:         iterable of lists of items (rows)
+        :param bitmap_class:    bitmap implementation, Bitmap (default) or IntBitmap
+        :return:                Bitmap Index
+        """
+        index = cls([], bitmap_class)
+        for batch in batches:
+            start = index.row_count
+            index.keys.extend(item.key() for item in batch)
+            index.row_count = len(index.keys)
+            index._index_rows(start)
+        return index
+
+    def save(self, path):
+        """
+        Saves the keys and the rows of every key into a binary file, see indexes.storage.
+        :param path:    path to the file
+        :return:
+        """
+        # rows of the keys are grouped from the existence bitmap instead of decoding every bitmap
+        postings = group_rows(self.keys, self.existence.get_row_ids())
+        write_index(path, self.keys[:self.row_count], postings)
+
+    @classmethod
+    def load(cls, path, mapped=False, bitmap_class=None):
+        """
+        Loads the index from a file saved by any index.
+        :param path:            path to the file
+        :param mapped:          return a read-only MappedIndex serving look-ups from the memory-mapped file instead
+        :param bitmap_class:    bitmap implementation, Bitmap (default) or IntBitmap
+        :return:                Bitmap Index or MappedIndex
+        """
+        if mapped:
+            return MappedIndex(path)
+        keys, postings = read_index(path)
+        return cls.from_postings(keys, postings, bitmap_class)
+
+    @classmethod
+    def from_postings(cls, keys, postings, bitmap_class=None):
+        """
+        Builds the index from the key column and the row ids of every key.
+        :param keys:            keys of all rows
+        :param postings:        iterable of (key, row ids) pairs
+        :param bitmap_class:    bitmap implementation, Bitmap (default) or IntBitmap
+        :return:                Bitmap Index
+        """
+        index = cls([], bitmap_class)
+        index.keys = keys
+        index.row_count = len(keys)
+        posting_lists = []
+        for key, key_rids in postings:
+            index.bitmap_table[key] = index.bitmap_class(index.row_count)
+            index.bitmap_table[key].set_bits(key_rids)
+            posting_lists.append(key_rids)
+        if sum(map(len, posting_lists)) == index.row_count:
+            # every row has its key, e.g. in a parallel build
+            index.existence.set_bits(range(index.row_count))
+        else:
+            index.existence.set_bits(sorted(rid for rids in posting_lists for rid in rids))
+        index.existence.extend(index.row_count)
+        return index
+
+    @classmethod
+    def build_partition(cls, keys, start, plan, bitmap_class=None):
+        """
+        Builds the bits of every key over a slice of the key column, done by a worker of build_parallel().
+        :param keys:            keys of the slice
+        :param start:           row id of the first row of the slice
+        :param plan:            None, the slices need no plan
+        :param bitmap_class:    bitmap implementation, Bitmap (default) or IntBitmap
+        :return:                (distinct keys of the slice, parts of their bitmaps)
+        """
+        rids_by_key = dict()
+        for rid, key in enumerate(keys):
+            if key in rids_by_key:
+                rids_by_key[key].append(rid)
+            else:
+                rids_by_key[key] = [rid]
+        part_of = (bitmap_class or Bitmap).part_of
+        return list(rids_by_key), [part_of(rids, start) for rids in rids_by_key.values()]
+
+    @classmethod
+    def from_partitions(cls, keys, partitions, bitmap_class=None):
+        """
+        Builds the index from the parts of the bitmaps over consecutive slices of the key column.
+        :param keys:            keys of all rows
+        :param partitions:      results of build_partition() of all slices
+        :param bitmap_class:    bitmap implementation, Bitmap (default) or IntBitmap
+        :return:                Bitmap Index
+        """
+        index = cls([], bitmap_class)
+        index.keys = keys
+        index.row_count = len(keys)
+        bitmap_table = index.bitmap_table
+        for part_keys, parts in partitions:
+            for key, part in zip(part_keys, parts):
+                bitmap = bitmap_table.get(key)
+                if bitmap is None:
+                    bitmap = bitmap_table[key] = index.bitmap_class(index.row_count)
+                bitmap.join_part(part)
+        # the slices cover all rows
+        index.existence.set_mask((1 << index.row_count) - 1)
+        return index
+
     def build_index(self, table):
         """
         Takes table/list/attribute and builds index
         :param table:   table with items (rows) upon which index is built
         :return:
         """
-        attribute_cardinality = len(table)
-        for rid, element in enumerate(table):
-            if element.key() in self.bitmap_table:
-                self.bitmap_table[element.key()].set_bit(rid)
+        self._index_rows(0)
+
+    def _index_rows(self, start):
+        """
+        Sets the bits of the rows from start up to the row count, in one pass over the row ids of every key.
+        :param start:   row id of the first row to be indexed
+        :return:
+        """
+        rids_by_key = dict()
+        for rid in range(start, self.row_count):
+            key = self.keys[rid]
+            if key in rids_by_key:
+                rids_by_key[key].append(rid)
             else:
-                self.bitmap_table[element.key()] = Bitmap(attribute_cardinality)
-                self.bitmap_table[element.key()].set_bit(rid)
+                rids_by_key[key] = [rid]
+
+        for key, rids in rids_by_key.items():
+            bitmap = self.bitmap_table.get(key)
+            if bitmap is None:
+                bitmap = self.bitmap_table[key] = self.bitmap_class(self.row_count)
+            bitmap.set_bits(rids)
+        self.existence.set_bits(range(start, self.row_count))
 
     def insert(self, *keys):
         """
@@ -43,22 +211,20 @@ class BitmapIndex:
         :param keys:    key of inserted item
         :return:
         """
-        for key in keys:
-            self.keys.append(key)
-            ref_key = self.keys[0]
-            if len(self.keys) == (len(self.bitmap_table[ref_key].bit_array) * self.bitmap_table[ref_key].word_size)+1:
-                for bitmap in self.bitmap_table.values():
-                    bitmap.cardinality += 1
-                    bitmap.resize()
-            else:
-                for bitmap in self.bitmap_table.values():
-                    bitmap.cardinality += 1
+        self.insert_many(keys)
 
-            if key in self.bitmap_table:
-                self.bitmap_table[key].set_bit(len(self.keys)-1)
-            else:
-                self.bitmap_table[key] = Bitmap(len(self.keys))
-                self.bitmap_table[key].set_bit(len(self.keys)-1)
+    def insert_many(self, keys):
+        """
+        Inserts information about a batch of new items, setting the bits of every key in one pass.
+        :param keys:    keys of inserted items
+        :return:
+        """
+        start = self.row_count
+        for key in keys:
+            append_key(self.keys, self.row_count, key)
+            self.row_count += 1
+        # only the bitmaps of the keys in the batch are touched, they grow to the new rows by themselves
+        self._index_rows(start)
 
     def delete(self, rid):
         """
@@ -66,17 +232,31 @@ class BitmapIndex:
         :param rid:     row id of table that we want to update
         :return:
         """
-        old_key = self.keys[rid]
-
-        flag = Bitmap(len(self.keys))
-        flag.set_bit(rid)
+        self._clear_row(self.keys[rid], rid)
+        self.existence.clear_bit(rid)
 
-        if old_key in self.bitmap_table:
-            xor = self.bitmap_table[old_key] ^ flag
-            if xor.is_empty():
-                del self.bitmap_table[old_key]
+    def delete_many(self, rids):
+        """
+        Delete information about a batch of elements, clearing the bits of every key in one pass
+        :param rids:    row ids of table that we want to delete
+        :return:
+        """
+        rids = list(rids)
+        rids_by_key = dict()
+        for rid in rids:
+            key = self.keys[rid]
+            if key in rids_by_key:
+                rids_by_key[key].append(rid)
             else:
-                self.bitmap_table[old_key] = xor
+                rids_by_key[key] = [rid]
+
+        for key, key_rids in rids_by_key.items():
+            bitmap = self.bitmap_table.get(key)
+            if bitmap is not None:
+                bitmap.clear_bits(key_rids)
+                if bitmap.is_empty():
+                    del self.bitmap_table[key]
+        self.existence.clear_bits(rids)
 
     def update(self, rid, key):
         """
@@ -86,23 +266,37 @@ class BitmapIndex:
         :return:
         """
         old_key = self.keys[rid]
-        if old_key == key:
-            self.keys[rid] = key
+        if old_key != key:
+            self._clear_row(old_key, rid)
+            self._set_row(key, rid)
+            set_key(self, rid, key)
+
+    def _set_row(self, key, rid):
+        """
+        Sets the bit of the row in the bitmap of the key in place, creating the bitmap for a new key.
+        :param key:     key of the row
+        :param rid:     row id
+        :return:
+        """
+        if key in self.bitmap_table:
+            self.bitmap_table[key].set_bit(rid)
         else:
-            flag = Bitmap(len(self.keys))
-            flag.set_bit(rid)
+            self.bitmap_table[key] = self.bitmap_class(self.row_count)
+            self.bitmap_table[key].set_bit(rid)
+        self.existence.set_bit(rid)
 
-            xor = self.bitmap_table[old_key] ^ flag
-            if xor.is_empty():
-                del self.bitmap_table[old_key]
-            else:
-                self.bitmap_table[old_key] = xor
-            if key in self.keys:
-                self.bitmap_table[key] |= flag
-            else:
-                self.bitmap_table[key] = Bitmap(len(self.keys))
-                self.bitmap_table[key] |= flag
-            self.keys[rid] = key
+    def _clear_row(self, key, rid):
+        """
+        Clears the bit of the row in the bitmap of the key in place, dropping the bitmap once it gets empty.
+        :param key:     key of the row
+        :param rid:     row id
+        :return:
+        """
+        bitmap = self.bitmap_table.get(key)
+        if bitmap is not None:
+            bitmap.clear_bit(rid)
+            if bitmap.is_empty():
+                del self.bitmap_table[key]
 
 
 class Bitmap:
@@ -114,22 +308,24 @@ class Bitmap:
         """
         self.word_size = 32
         self.cardinality = cardinality  # number of rows of input table/list
-        self.bit_array = (c_uint32 * ceil(cardinality / self.word_size))()  # define array of 32-bit unsigned integers
+        self.bit_array = (_WORD * ceil(cardinality / self.word_size))()  # define array of 32-bit unsigned integers
+        self.popcount = 0  # number of bits set to 1
 
     def get_row_ids(self):
         """
         Get Row ID's where bit is set to 1.
         :return:    list of row_ids retrieved from bitmap index table
         """
+        if self.popcount >= len(self.bit_array):
+            return bit_positions(self._to_int(len(self.bit_array)))
+        # a sparse bitmap decodes only its non-zero 64-bit blocks, found by compress() in C
+        data = string_at(addressof(self.bit_array), sizeof(self.bit_array))
+        blocks = array('Q', data + bytes(-len(data) % 8))
+        if sys.byteorder == 'big':
+            blocks.byteswap()
         rids = []
-        for i in range(0, len(self.bit_array)):
-            word = self.bit_array[i]
-            if word == 0:
-                continue
-            for b in range(0, self.word_size):
-                if (word & 1) != 0:
-                    rids.append(self.word_size*i+b)
-                word = word >> 1
+        for i in compress(range(len(blocks)), blocks):
+            rids.extend(64 * i + b for b in bit_positions(blocks[i]))
         return rids
 
     # Bit manipulation in bit array
@@ -142,10 +338,77 @@ class Bitmap:
         i = k // 32  # index in actual array of 32-bit unsigned integers
         pos = k % 32  # position of k-th bit relative to c_uint32 array element
 
+        # rows appended after the bitmap was created extend it lazily
+        if i >= len(self.bit_array):
+            self._grow(max(i + 1, 2 * len(self.bit_array)))
+        if k >= self.cardinality:
+            self.cardinality = k + 1
+
         flag = 1
         flag = flag << pos  # set flag bit to k-th bit relative position
 
-        self.bit_array[i] = self.bit_array[i] | flag
+        if not self.bit_array[i] & flag:
+            self.bit_array[i] = self.bit_array[i] | flag
+            self.popcount += 1
+
+    def set_bits(self, ks):
+        """
+        Set all bits in ks to 1.
+        :param ks:  iterable of bit positions
+        :return:
+        """
+        for k in ks:
+            self.set_bit(k)
+
+    @staticmethod
+    def part_of(rids, offset):
+        """
+        Returns the bits of row ids of a slice of the rows as a part of a bitmap, done by a worker of
+        a parallel build.
+        :param rids:    list of row ids relative to the start of the slice
+        :param offset:  row id of the first row of the slice
+        :return:        part for join_part()
+        """
+        return _mask_of(rids)[0], offset
+
+    def join_part(self, part):
+        """
+        Set the bits of a part built by part_of().
+        :param part:    result of part_of()
+        :return:
+        """
+        self.set_mask(*part)
+
+    def set_mask(self, mask, offset=0):
+        """
+        Set the bits of an int mask shifted by the offset, copying only the words it covers.
+        :param mask:    int with the bits to set
+        :param offset:  position of the lowest bit of the mask
+        :return:
+        """
+        if not mask:
+            return
+        first, shift = divmod(offset, self.word_size)
+        mask <<= shift
+        count = -(-mask.bit_length() // self.word_size)
+        if first + count > len(self.bit_array):
+            self._grow(max(first + count, 2 * len(self.bit_array)))
+        if offset + mask.bit_length() - shift > self.cardinality:
+            self.cardinality = offset + mask.bit_length() - shift
+
+        address = addressof(self.bit_array) + 4 * first
+        words = int.from_bytes(string_at(address, 4 * count), 'little')
+        self.popcount += popcount(mask & ~words)
+        memmove(address, (words | mask).to_bytes(4 * count, 'little'), 4 * count)
+
+    def clear_bits(self, ks):
+        """
+        Set all bits in ks to 0.
+        :param ks:  iterable of bit positions
+        :return:
+        """
+        for k in ks:
+            self.clear_bit(k)
 
     def clear_bit(self, k):
         """
@@ -155,12 +418,15 @@ class Bitmap:
         """
         i = k // 32
         pos = k % 32
+        if i >= len(self.bit_array):
+            return
 
         flag = 1
         flag = flag << pos
-        flag = ~flag
 
-        self.bit_array[i] = self.bit_array[i] & flag
+        if self.bit_array[i] & flag:
+            self.bit_array[i] = self.bit_array[i] & ~flag
+            self.popcount -= 1
 
     def test_bit(self, k):
         """
@@ -170,6 +436,8 @@ class Bitmap:
         """
         i = k // 32
         pos = k % 32
+        if i >= len(self.bit_array):
+            return 0
 
         flag = 1
         flag = flag << pos
@@ -179,16 +447,34 @@ class Bitmap:
         else:
             return 0
 
-    # Bitwise logical operations for bitmap
+    # Bitwise logical operations for bitmap, done on the words of both bitmaps as single ints
+    def _to_int(self, count):
+        """
+        Returns the first count words of the bit array as an int, rows the bitmap did not reach are zeros.
+        :param count:   number of words
+        :return:        int with the bits of the words
+        """
+        return int.from_bytes(string_at(addressof(self.bit_array), 4 * min(count, len(self.bit_array))), 'little')
+
+    def _set_int(self, value):
+        """
+        Replaces the bits of the bit array by the bits of an int fitting into it.
+        :param value:   non-negative int
+        :return:
+        """
+        size = sizeof(self.bit_array)
+        memmove(self.bit_array, value.to_bytes(size, 'little'), size)
+        self.popcount = popcount(value)
+
     def __or__(self, other):
         """
         Define logical OR(|) operator for objects of type Bitmap.
         :param other:   other bitmap to which you want to apply operation
         :return:        product of operation
         """
-        product = Bitmap(self.cardinality)
-        for i in range(0, len(self.bit_array)):
-            product.bit_array[i] = self.bit_array[i] | other.bit_array[i]
+        product = Bitmap(max(self.cardinality, other.cardinality))
+        count = len(product.bit_array)
+        product._set_int(self._to_int(count) | other._to_int(count))
         return product
 
     def __xor__(self, other):
@@ -197,9 +483,9 @@ class Bitmap:
         :param other:   other bitmap to which you want to apply operation
         :return:        product of operation
         """
-        product = Bitmap(self.cardinality)
-        for i in range(0, len(self.bit_array)):
-            product.bit_array[i] = self.bit_array[i] ^ other.bit_array[i]
+        product = Bitmap(max(self.cardinality, other.cardinality))
+        count = len(product.bit_array)
+        product._set_int(self._to_int(count) ^ other._to_int(count))
         return product
 
     def __and__(self, other):
@@ -208,9 +494,20 @@ class Bitmap:
         :param other:   other bitmap to which you want to apply operation
         :return:        product of operation
         """
+        product = Bitmap(max(self.cardinality, other.cardinality))
+        count = len(product.bit_array)
+        product._set_int(self._to_int(count) & other._to_int(count))
+        return product
+
+    def __sub__(self, other):
+        """
+        Define difference(-) operator for objects of type Bitmap, bits of self not set in other.
+        :param other:   other bitmap to which you want to apply operation
+        :return:        product of operation
+        """
         product = Bitmap(self.cardinality)
-        for i in range(0, len(self.bit_array)):
-            product.bit_array[i] = self.bit_array[i] & other.bit_array[i]
+        count = len(product.bit_array)
+        product._set_int(self._to_int(count) & ~other._to_int(count))
         return product
 
     def __invert__(self):
@@ -219,8 +516,8 @@ class Bitmap:
         :return:        product of operation
         """
         product = Bitmap(self.cardinality)
-        for i in range(0, len(self.bit_array)):
-            product.bit_array[i] = ~self.bit_array[i]
+        # bits past the cardinality in the last word do not correspond to rows
+        product._set_int(~self._to_int(len(product.bit_array)) & ((1 << self.cardinality) - 1))
         return product
 
     def resize(self):
@@ -229,23 +526,43 @@ class Bitmap:
         :return:
         """
         temp = Bitmap(self.cardinality)
-        for i in range(0, len(self.bit_array)):
-            temp.bit_array[i] = self.bit_array[i] | temp.bit_array[i]
+        memmove(temp.bit_array, self.bit_array, min(sizeof(self.bit_array), sizeof(temp.bit_array)))
         self.bit_array = temp.bit_array
         del temp
 
+    def extend(self, cardinality):
+        """
+        Extend the bitmap to the given number of rows, resizing the array only when it has no free bits left.
+        :param cardinality:     new number of rows
+        :return:
+        """
+        self.cardinality = cardinality
+        if cardinality > len(self.bit_array) * self.word_size:
+            self.resize()
+
+    def _grow(self, words):
+        """
+        Reallocate the bit array with the given number of words keeping its bits.
+        :param words:   new number of words
+        :return:
+        """
+        bit_array = (_WORD * words)()
+        memmove(bit_array, self.bit_array, sizeof(self.bit_array))
+        self.bit_array = bit_array
+
+    def count(self):
+        """
+        Returns the number of bits set to 1.
+        :return:    number of set bits
+        """
+        return self.popcount
+
     def is_empty(self):
         """
         Checks whether Bitmap is empty or not.
         :return:    whether bitmap empty or not
         """
-        check = 0
-        for i in range(0, len(self.bit_array)):
-            if self.bit_array[i] == 0:
-                check += 1
-        if check == len(self.bit_array):
-            return True
-        return False
+        return self.popcount == 0
 
     def __str__(self):
         """
@@ -256,3 +573,223 @@ class Bitmap:
         for i in range(0, self.cardinality):
             acc = str(self.test_bit(i)) + acc
         return acc
+
+
+class IntBitmap:
+    """
+    Bitmap kept in a single Python int used as a bitset, so operations run over all bits at once.
+    An int is immutable, so changing even a single bit builds a new int of all bits, O(n) in the number of rows:
+    rows should be set and cleared in batches with set_bits and clear_bits, which build the int once per batch.
+    """
+    def __init__(self, cardinality):
+        """
+        Bitmap constructor.
+        :param cardinality:     Number of rows in attribute/table
+        """
+        self.cardinality = cardinality
+        self.value = 0
+        self.popcount = 0  # number of bits set to 1
+
+    def get_row_ids(self):
+        """
+        Get Row ID's where bit is set to 1.
+        :return:    list of row_ids retrieved from bitmap index table
+        """
+        return bit_positions(self.value)
+
+    def set_bit(self, k):
+        """
+        Set k-th bit to 1, building a new int of all bits in O(n).
+        :param k:   k-th bit
+        :return:
+        """
+        if not (self.value >> k) & 1:
+            self.value |= 1 << k
+            self.popcount += 1
+        if k >= self.cardinality:
+            self.cardinality = k + 1
+
+    def set_bits(self, ks):
+        """
+        Set all bits in ks to 1 building the mask in a single pass, the int is rebuilt once.
+        :param ks:  list of bit positions
+        :return:
+        """
+        if not ks:
+            return
+        mask, count = _mask_of(ks)
+        overlap = mask & self.value
+        self.value |= mask
+        self.popcount += count - (popcount(overlap) if overlap else 0)
+        if mask.bit_length() > self.cardinality:
+            self.cardinality = mask.bit_length()
+
+    @staticmethod
+    def part_of(rids, offset):
+        """
+        Returns the bits of row ids of a slice of the rows as a part of a bitmap, done by a worker of
+        a parallel build.
+        :param rids:    list of row ids relative to the start of the slice
+        :param offset:  row id of the first row of the slice
+        :return:        part for join_part()
+        """
+        return _mask_of(rids)[0], offset
+
+    def join_part(self, part):
+        """
+        Set the bits of a part built by part_of().
+        :param part:    result of part_of()
+        :return:
+        """
+        self.set_mask(*part)
+
+    def set_mask(self, mask, offset=0):
+        """
+        Set the bits of an int mask shifted by the offset, the int is rebuilt once.
+        :param mask:    int with the bits to set
+        :param offset:  position of the lowest bit of the mask
+        :return:
+        """
+        if not mask:
+            return
+        mask <<= offset
+        self.popcount += popcount(mask & ~self.value)
+        self.value |= mask
+        if mask.bit_length() > self.cardinality:
+            self.cardinality = mask.bit_length()
+
+    def clear_bits(self, ks):
+        """
+        Set all bits in ks to 0 building the mask in a single pass, the int is rebuilt once.
+        :param ks:  list of bit positions
+        :return:
+        """
+        if not ks:
+            return
+        mask, _ = _mask_of(ks)
+        cleared = mask & self.value
+        if cleared:
+            self.value ^= cleared
+            self.popcount -= popcount(cleared)
+
+    def clear_bit(self, k):
+        """
+        Set k-th bit to 0, building a new int of all bits in O(n).
+        :param k:   k-th bit
+        :return:
+        """
+        if (self.value >> k) & 1:
+            self.value &= ~(1 << k)
+            self.popcount -= 1
+
+    def test_bit(self, k):
+        """
+        Return k-th bit value.
+        :param k:   k-th bit
+        :return:
+        """
+        return (self.value >> k) & 1
+
+    def _product(self, value, cardinality):
+        """
+        Wraps the result of an operation into a new bitmap.
+        :param value:           bits of the result
+        :param cardinality:     number of rows of the result
+        :return:                product of operation
+        """
+        product = IntBitmap(cardinality)
+        product.value = value
+        product.popcount = popcount(value)
+        return product
+
+    def __or__(self, other):
+        """
+        Define logical OR(|) operator for objects of type IntBitmap.
+        :param other:   other bitmap to which you want to apply operation
+        :return:        product of operation
+        """
+        return self._product(self.value | other.value, max(self.cardinality, other.cardinality))
+
+    def __xor__(self, other):
+        """
+        Define logical Exclusive OR(^) operator for objects of type IntBitmap.
+        :param other:   other bitmap to which you want to apply operation
+        :return:        product of operation
+        """
+        return self._product(self.value ^ other.value, max(self.cardinality, other.cardinality))
+
+    def __and__(self, other):
+        """
+        Define logical AND(&) operator for objects of type IntBitmap.
+        :param other:   other bitmap to which you want to apply operation
+        :return:        product of operation
+        """
+        return self._product(self.value & other.value, max(self.cardinality, other.cardinality))
+
+    def __sub__(self, other):
+        """
+        Define difference(-) operator for objects of type IntBitmap, bits of self not set in other.
+        :param other:   other bitmap to which you want to apply operation
+        :return:        product of operation
+        """
+        return self._product(self.value & ~other.value, self.cardinality)
+
+    def __invert__(self):
+        """
+        Define logical NOT(~) operator for objects of type IntBitmap.
+        :return:        product of operation
+        """
+        return self._product(~self.value & ((1 << self.cardinality) - 1), self.cardinality)
+
+    def resize(self):
+        """
+        Nothing to resize, an int grows on demand.
+        :return:
+        """
+
+    def extend(self, cardinality):
+        """
+        Extend the bitmap to the given number of rows.
+        :param cardinality:     new number of rows
+        :return:
+        """
+        self.cardinality = cardinality
+
+    def is_empty(self):
+        """
+        Checks whether Bitmap is empty or not.
+        :return:    whether bitmap empty or not
+        """
+        return self.popcount == 0
+
+    def count(self):
+        """
+        Returns the number of bits set to 1.
+        :return:    number of set bits
+        """
+        return self.popcount
+
+    def __str__(self):
+        """
+        Returns a string representation of a bit array.
+        :return:
+        """
+        return format(self.value, '0{}b'.format(self.cardinality)) if self.cardinality else ''
+
+
+def _mask_of(ks):
+    """
+    Builds an int with the bits of the positions set.
+    :param ks:  list or range of bit positions
+    :return:    int mask, number of distinct positions
+    """
+    if isinstance(ks, range) and ks.step == 1:
+        return ((1 << len(ks)) - 1) << ks.start, len(ks)
+    mask = bytearray(max(ks) // 8 + 1)
+    count = 0
+    for k in ks:
+        bit = 1 << (k & 7)
+        if not mask[k >> 3] & bit:
+            mask[k >> 3] |= bit
+            count += 1
+    return int.from_bytes(mask, 'little'), count
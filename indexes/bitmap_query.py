@@ -0,0 +1,156 @@
+from abc import ABC, abstractmethod
+
+
+class Expression(ABC):
+    """
+    Boolean predicate over the keys of a Bitmap Index, evaluated directly over its bitmaps.
+    Expressions are combined with &, | and ~, e.g. In('a', 'b', 'c') & ~Eq('d').
+    """
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    @abstractmethod
+    def estimate(self, index):
+        """
+        Estimates the number of rows matching the expression.
+        :param index:   Bitmap Index
+        :return:        upper bound of the number of matching rows
+        """
+
+    @abstractmethod
+    def evaluate(self, index):
+        """
+        Evaluates the expression over the bitmaps of the index.
+        The result may be a bitmap owned by the index, so it should not be modified.
+        :param index:   Bitmap Index
+        :return:        bitmap of matching rows, None if no rows match
+        """
+
+
+class Eq(Expression):
+    """ key = value """
+
+    def __init__(self, key):
+        self.key = key
+
+    def estimate(self, index):
+        bitmap = index.bitmap_table.get(self.key)
+        return bitmap.count() if bitmap is not None else 0
+
+    def evaluate(self, index):
+        bitmap = index.bitmap_table.get(self.key)
+        return bitmap if bitmap is not None and not bitmap.is_empty() else None
+
+
+class In(Expression):
+    """ key IN (values) """
+
+    def __init__(self, *keys):
+        self.keys = keys
+
+    def estimate(self, index):
+        return sum(Eq(key).estimate(index) for key in self.keys)
+
+    def evaluate(self, index):
+        return _union(Eq(key).evaluate(index) for key in self.keys)
+
+
+class Not(Expression):
+    """ NOT expression, relative to the rows present in the index """
+
+    def __init__(self, expression):
+        self.expression = expression
+
+    def estimate(self, index):
+        return max(0, index.row_count - self.expression.estimate(index))
+
+    def evaluate(self, index):
+        return _subtract(index.all_rows(), [self.expression], index)
+
+
+class Or(Expression):
+    """ expression OR expression ... """
+
+    def __init__(self, *expressions):
+        self.expressions = expressions
+
+    def estimate(self, index):
+        return min(index.row_count, sum(expression.estimate(index) for expression in self.expressions))
+
+    def evaluate(self, index):
+        return _union(expression.evaluate(index) for expression in self.expressions)
+
+
+class And(Expression):
+    """
+    expression AND expression ...
+    Operands are intersected from the most selective one, negated operands are subtracted afterwards,
+    and the evaluation stops as soon as the intermediate result gets empty.
+    """
+
+    def __init__(self, *expressions):
+        self.expressions = expressions
+
+    def estimate(self, index):
+        return min(expression.estimate(index) for expression in self.expressions)
+
+    def evaluate(self, index):
+        positives = [expression for expression in self.expressions if not isinstance(expression, Not)]
+        negatives = [expression.expression for expression in self.expressions if isinstance(expression, Not)]
+
+        if not positives:
+            return _subtract(index.all_rows(), negatives, index)
+
+        estimates = [(expression.estimate(index), i) for i, expression in enumerate(positives)]
+        estimates.sort()
+        if estimates[0][0] == 0:
+            return None
+
+        result = None
+        for _, i in estimates:
+            bitmap = positives[i].evaluate(index)
+            if bitmap is None:
+                return None
+            result = bitmap if result is None else result & bitmap
+            if result.is_empty():
+                return None
+        return _subtract(result, negatives, index)
+
+
+def _union(bitmaps):
+    """
+    Returns the union of bitmaps skipping the empty (None) ones.
+    :param bitmaps:     iterable of bitmaps or None values
+    :return:            bitmap or None if all bitmaps are empty
+    """
+    result = None
+    for bitmap in bitmaps:
+        if bitmap is not None:
+            result = bitmap if result is None else result | bitmap
+    return result
+
+
+def _subtract(result, expressions, index):
+    """
+    Removes rows matching any of the expressions from the result, the largest ones first.
+    :param result:          bitmap or None
+    :param expressions:     expressions to subtract
+    :param index:           Bitmap Index
+    :return:                bitmap or None if no rows are left
+    """
+    if result is None or result.is_empty():
+        return None
+    for expression in sorted(expressions, key=lambda e: e.estimate(index), reverse=True):
+        bitmap = expression.evaluate(index)
+        if bitmap is not None:
+            result = result - bitmap
+            if result.is_empty():
+                return None
+    return result
@@ -0,0 +1,30 @@
+"""
+Bit counting and bit position helpers over Python ints shared by the bitmaps and the index files.
+"""
+
+from itertools import compress
+
+# translates '0'/'1' characters of a binary string into falsy/truthy bytes
+_BIT_SELECTORS = bytes.maketrans(b'01', b'\x00\x01')
+# int.bit_count() counts the bits in C without a binary string, Python >= 3.10
+_HAS_BIT_COUNT = hasattr(int, 'bit_count')
+
+
+def popcount(x):
+    """
+    Returns the number of set bits of a non-negative int.
+    :param x:   int
+    :return:    number of set bits
+    """
+    return x.bit_count() if _HAS_BIT_COUNT else bin(x).count('1')
+
+
+def bit_positions(x):
+    """
+    Returns positions of the set bits of a non-negative int.
+    :param x:   int
+    :return:    sorted list of positions
+    """
+    # least significant bit first, as a sequence of 0/1 selectors over the positions
+    selectors = bin(x)[:1:-1].encode().translate(_BIT_SELECTORS)
+    return list(compress(range(len(selectors)), selectors))
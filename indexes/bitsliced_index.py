@@ -0,0 +1,329 @@
+from indexes.bitmap_index import IntBitmap
+from tables.columnar import key_column, append_key, set_key, shares_keys
+from indexes.storage import MappedIndex, group_rows, live_rows, read_index, write_index
+
+
+class BitSlicedIndex:
+    """
+    Implements Bit-Sliced Index over integer keys.
+    Keys are stored as (key - offset) in binary, one bitmap (slice) per bit, so range predicates
+    and aggregates take a number of bitmap operations proportional to the key width,
+    not to the number of distinct keys.
+    """
+
+    def __init__(self, table, bitmap_class=None):
+        """
+        Bit-Sliced Index constructor.
+        :param table:           table with items (rows) with integer keys upon which index is built
+        :param bitmap_class:    bitmap implementation, IntBitmap (default), Bitmap or RoaringBitmap
+        """
+        self.bitmap_class = bitmap_class or IntBitmap
+        self.keys = key_column(table)
+        self.keys_shared = shares_keys(table)
+        self.row_count = len(self.keys)
+        self.build_index(table)
+
+    @classmethod
+    def from_batches(cls, batches, bitmap_class=None):
+        """
+        Builds the index from batches of items, e.g. streamed from a file, without keeping the items.
+        Keys are collected first, as their minimum defines the offset of the slices.
+        :param batches:         iterable of lists of items (rows)
+        :param bitmap_class:    bitmap implementation, IntBitmap (default), Bitmap or RoaringBitmap
+        :return:                Bit-Sliced Index
+        """
+        index = cls([], bitmap_class)
+        for batch in batches:
+            index.keys.extend(item.key() for item in batch)
+        index.row_count = len(index.keys)
+        index.build_index(None)
+        return index
+
+    def save(self, path):
+        """
+        Saves the keys and the rows of every key into a binary file, see indexes.storage.
+        :param path:    path to the file
+        """
+        write_index(path, self.keys[:self.row_count], group_rows(self.keys, self.existence.get_row_ids()))
+
+    @classmethod
+    def load(cls, path, mapped=False, bitmap_class=None):
+        """
+        Loads the index from a file saved by any index.
+        :param path:            path to the file
+        :param mapped:          return a read-only MappedIndex serving look-ups from the memory-mapped file instead
+        :param bitmap_class:    bitmap implementation, IntBitmap (default), Bitmap or RoaringBitmap
+        :return:                Bit-Sliced Index or MappedIndex
+        """
+        if mapped:
+            return MappedIndex(path)
+        keys, postings = read_index(path)
+        index = cls([], bitmap_class)
+        index.keys = keys
+        index.row_count = len(keys)
+        index.build_index(None)
+        # slices keep the bits of deleted rows, which are masked by the existence bitmap
+        live = live_rows(postings, index.row_count)
+        index.existence = index.bitmap_class(index.row_count)
+        index.existence.set_bits([rid for rid in range(index.row_count) if live[rid]])
+        return index
+
+    def build_index(self, table):
+        """
+        Builds slices from the table of key-value items.
+        :param table:   table with items (rows)
+        """
+        keys = self.keys[:self.row_count]
+        for key in keys:
+            if not isinstance(key, int):
+                raise TypeError("Bit-sliced index supports integer keys only, got {!r}".format(key))
+
+        # the smallest key is stored as 0, so negative keys need no sign slice
+        self.offset = min(keys) if keys else 0
+        width = max(key - self.offset for key in keys).bit_length() if keys else 0
+
+        rids_by_slice = [[] for _ in range(width)]
+        for rid, key in enumerate(keys):
+            value = key - self.offset
+            i = 0
+            while value:
+                if value & 1:
+                    rids_by_slice[i].append(rid)
+                value >>= 1
+                i += 1
+
+        self.slices = []
+        for rids in rids_by_slice:
+            bitmap = self.bitmap_class(self.row_count)
+            bitmap.set_bits(rids)
+            self.slices.append(bitmap)
+        self.existence = self.bitmap_class(self.row_count)
+        self.existence.set_bits(range(self.row_count))
+
+    def look_up(self, key):
+        """
+        Returns a list of row ids in the table matching the key
+        :param key:     interest of search
+        :return:        list of row ids matching items
+        """
+        _, equal = self._compare(key)
+        rids = equal.get_row_ids()
+        return rids if rids else None
+
+    def look_up_many(self, keys):
+        """
+        Returns lists of row ids for many keys at once.
+        :param keys:    keys of interest
+        :return:        list of results of look_up aligned with the keys
+        """
+        return [self.look_up(key) for key in keys]
+
+    def range(self, lo=None, hi=None, inclusive=True):
+        """
+        Returns row ids of the items with keys between lo and hi, e.g. range(hi=c, inclusive=False) for key < c.
+        :param lo:          lower bound of the keys, None for no bound
+        :param hi:          upper bound of the keys, None for no bound
+        :param inclusive:   whether the bounds are included, a bool or a pair of bools for (lo, hi)
+        :return:            list of row ids in the ascending order
+        """
+        return self.range_bitmap(lo, hi, inclusive).get_row_ids()
+
+    def range_bitmap(self, lo=None, hi=None, inclusive=True):
+        """
+        Returns a bitmap of the rows with keys between lo and hi.
+        :param lo:          lower bound of the keys, None for no bound
+        :param hi:          upper bound of the keys, None for no bound
+        :param inclusive:   whether the bounds are included, a bool or a pair of bools for (lo, hi)
+        :return:            bitmap
+        """
+        lo_inclusive, hi_inclusive = inclusive if isinstance(inclusive, tuple) else (inclusive, inclusive)
+        result = self.existence
+        if hi is not None:
+            less, equal = self._compare(hi)
+            result = result & (less | equal if hi_inclusive else less)
+        if lo is not None:
+            less, equal = self._compare(lo)
+            result = result - (less if lo_inclusive else less | equal)
+        return result
+
+    def count(self, lo=None, hi=None, inclusive=True):
+        """
+        Returns the number of items with keys between lo and hi.
+        :param lo:          lower bound of the keys, None for no bound
+        :param hi:          upper bound of the keys, None for no bound
+        :param inclusive:   whether the bounds are included, a bool or a pair of bools for (lo, hi)
+        :return:            number of items
+        """
+        return self.range_bitmap(lo, hi, inclusive).count()
+
+    def sum(self, lo=None, hi=None, inclusive=True):
+        """
+        Returns the sum of keys between lo and hi, computed from the counts of the slices.
+        :param lo:          lower bound of the keys, None for no bound
+        :param hi:          upper bound of the keys, None for no bound
+        :param inclusive:   whether the bounds are included, a bool or a pair of bools for (lo, hi)
+        :return:            sum of keys
+        """
+        rows = self.range_bitmap(lo, hi, inclusive)
+        total = self.offset * rows.count()
+        for i, bitmap in enumerate(self.slices):
+            total += (bitmap & rows).count() << i
+        return total
+
+    def histogram(self, bounds):
+        """
+        Returns the numbers of items with keys in [bounds[i], bounds[i + 1]) for consecutive bounds.
+        :param bounds:  ascending list of bucket bounds
+        :return:        list of counts, one less than the number of bounds
+        """
+        # counts of keys below every bound, each costs one pass over the slices
+        below = [self.count(hi=bound, inclusive=False) for bound in bounds]
+        return [below[i + 1] - below[i] for i in range(len(bounds) - 1)]
+
+    def insert(self, *keys):
+        """
+        Inserts information about new items in the table to the index.
+        :param keys:     key of inserted item
+        """
+        self.insert_many(keys)
+
+    def insert_many(self, keys):
+        """
+        Inserts information about a batch of new items setting the bits of every slice in one pass.
+        :param keys:    keys of inserted items
+        """
+        start = self.row_count
+        for key in keys:
+            if not isinstance(key, int):
+                raise TypeError("Bit-sliced index supports integer keys only, got {!r}".format(key))
+            append_key(self.keys, self.row_count, key)
+            self.row_count += 1
+        rids = range(start, self.row_count)
+        if not rids:
+            return
+
+        if min(self.keys[rid] for rid in rids) < self.offset:
+            existence = self.existence
+            self.build_index(None)
+            existence.set_bits(rids)
+            self.existence = existence
+            return
+
+        rids_by_slice = self._rids_by_slice(rids)
+        while len(self.slices) < len(rids_by_slice):
+            self.slices.append(self.bitmap_class(self.row_count))
+        for bitmap, slice_rids in zip(self.slices, rids_by_slice):
+            bitmap.set_bits(slice_rids)
+        self.existence.set_bits(rids)
+
+    def update(self, rid, key):
+        """
+        Updates values of item at rid in the table and the index.
+        :param rid:     row id
+        :param key:     key of the item to be updated
+        """
+        old_key = self.keys[rid]
+        if old_key != key:
+            self._clear_row(rid, old_key)
+            set_key(self, rid, key)
+            self._set_row(rid, key)
+
+    def delete(self, rid):
+        """
+        Deletes the item information from the index.
+        :param rid:     row id
+        """
+        self._clear_row(rid, self.keys[rid])
+        self.existence.clear_bit(rid)
+
+    def delete_many(self, rids):
+        """
+        Deletes the information about a batch of items clearing the bits of every slice in one pass.
+        :param rids:    row ids
+        """
+        rids = list(rids)
+        for bitmap, slice_rids in zip(self.slices, self._rids_by_slice(rids)):
+            bitmap.clear_bits(slice_rids)
+        self.existence.clear_bits(rids)
+
+    def _rids_by_slice(self, rids):
+        """
+        Groups the rows by the slices having their bits set.
+        :param rids:    row ids
+        :return:        list of lists of row ids, one per slice
+        """
+        rids_by_slice = []
+        for rid in rids:
+            value = self.keys[rid] - self.offset
+            i = 0
+            while value:
+                if value & 1:
+                    while len(rids_by_slice) <= i:
+                        rids_by_slice.append([])
+                    rids_by_slice[i].append(rid)
+                value >>= 1
+                i += 1
+        return rids_by_slice
+
+    def _compare(self, key):
+        """
+        Compares all stored keys with the key walking the slices from the most significant one.
+        :param key:     integer key
+        :return:        bitmaps of the rows with keys less than and equal to the key
+        """
+        value = key - self.offset
+        if value < 0:
+            return self.bitmap_class(self.row_count), self.bitmap_class(self.row_count)
+        if value.bit_length() > len(self.slices):
+            return self.existence, self.bitmap_class(self.row_count)
+
+        less = self.bitmap_class(self.row_count)
+        equal = self.existence
+        for i in range(len(self.slices) - 1, -1, -1):
+            if (value >> i) & 1:
+                less = less | (equal - self.slices[i])
+                equal = equal & self.slices[i]
+            else:
+                equal = equal - self.slices[i]
+        return less, equal
+
+    def _set_row(self, rid, key):
+        """
+        Sets the bits of the key in the slices for the row.
+        :param rid:     row id
+        :param key:     integer key
+        """
+        if not isinstance(key, int):
+            raise TypeError("Bit-sliced index supports integer keys only, got {!r}".format(key))
+        if key < self.offset:
+            # keys are stored relative to the smallest one, so slices are rebuilt for a new minimum
+            existence = self.existence
+            self.build_index(None)
+            existence.set_bit(rid)
+            self.existence = existence
+            return
+
+        value = key - self.offset
+        while value.bit_length() > len(self.slices):
+            self.slices.append(self.bitmap_class(self.row_count))
+        i = 0
+        while value:
+            if value & 1:
+                self.slices[i].set_bit(rid)
+            value >>= 1
+            i += 1
+        self.existence.set_bit(rid)
+
+    def _clear_row(self, rid, key):
+        """
+        Clears the bits of the key in the slices for the row.
+        :param rid:     row id
+        :param key:     integer key
+        """
+        value = key - self.offset
+        i = 0
+        while value:
+            if value & 1:
+                self.slices[i].clear_bit(rid)
+            value >>= 1
+            i += 1
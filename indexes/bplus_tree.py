@@ -0,0 +1,469 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from operator import itemgetter
+from tables.columnar import key_column, append_key, set_key, shares_keys
+from indexes.storage import MappedIndex, merge_runs, read_index, run_postings, sample_splitters, sorted_run, \
+    split_run, write_index
+
+
+class BPlusTree:
+    """ Implements B+Tree index: row ids are kept only in the leaves, which are linked into a list. """
+
+    def __init__(self, table, degree=64, fill_factor=1.0):
+        """
+        B+Tree constructor.
+        :param table:           table with items (rows) upon which index is built
+        :param degree:          maximum number of children of an internal node
+        :param fill_factor:     fraction of a node filled by the bulk load
+        """
+        if degree < 3:
+            raise ValueError("B+Tree degree should be at least 3, got {}".format(degree))
+        self.degree = degree
+        self.fill_factor = fill_factor
+        self.root = LeafNode()
+        self.height = 0
+        self.keys = key_column(table)
+        self.keys_shared = shares_keys(table)
+        self.row_count = len(self.keys)
+        self.build_index(table)
+
+    @classmethod
+    def from_batches(cls, batches, **options):
+        """
+        Builds the tree from batches of items, e.g. streamed from a file, without keeping the items.
+        Keys are collected first, so the tree is still bulk loaded once.
+        :param batches:     iterable of lists of items (rows)
+        :param options:     keyword arguments of the constructor, e.g. degree
+        :return:            B+Tree
+        """
+        index = cls([], **options)
+        for batch in batches:
+            index.keys.extend(item.key() for item in batch)
+        index.row_count = len(index.keys)
+        index.build_index(None)
+        return index
+
+    def build_index(self, table):
+        """
+        Builds the tree bottom-up from the table of key-value items.
+        :param table:   table with items (rows)
+        """
+        pairs = sorted(zip(self.keys, range(self.row_count)), key=itemgetter(0))
+        postings = []
+        for key, rid in pairs:
+            if postings and postings[-1][0] == key:
+                postings[-1][1].append(rid)
+            else:
+                postings.append((key, array('q', [rid])))
+        self._pack(postings)
+
+    def _pack(self, postings):
+        """
+        Builds the tree bottom-up from the posting lists.
+        :param postings:    list of (key, array of row ids) pairs sorted by key
+        """
+        leaf_capacity = max(1, min(self.degree - 1, int((self.degree - 1) * self.fill_factor)))
+        leaves = [LeafNode()]
+        for key, rids in postings:
+            leaf = leaves[-1]
+            if len(leaf.keys) >= leaf_capacity:
+                leaf = LeafNode()
+                leaves[-1].next_leaf = leaf
+                leaves.append(leaf)
+            leaf.keys.append(key)
+            leaf.rids.append(rids)
+
+        # every level is described by its nodes and the smallest key of each of them
+        fan_out = max(3, min(self.degree, int(self.degree * self.fill_factor)))
+        nodes = leaves
+        low_keys = [leaf.keys[0] if leaf.keys else None for leaf in leaves]
+        self.height = 0
+        while len(nodes) > 1:
+            parent_count = -(-len(nodes) // fan_out)
+            size, extra = divmod(len(nodes), parent_count)
+            parents = []
+            parent_low_keys = []
+            start = 0
+            for i in range(parent_count):
+                end = start + size + (1 if i < extra else 0)
+                parent = InternalNode()
+                parent.keys = low_keys[start + 1:end]
+                parent.children = nodes[start:end]
+                for child in parent.children:
+                    child.parent = parent
+                parents.append(parent)
+                parent_low_keys.append(low_keys[start])
+                start = end
+            nodes = parents
+            low_keys = parent_low_keys
+            self.height += 1
+        self.root = nodes[0]
+        self.root.parent = None
+
+    def save(self, path):
+        """
+        Saves the keys and the posting lists into a binary file, see indexes.storage.
+        :param path:    path to the file
+        """
+        write_index(path, self.keys[:self.row_count], self._scan(None, True))
+
+    @classmethod
+    def load(cls, path, mapped=False, **options):
+        """
+        Loads the tree from a file saved by any index.
+        :param path:        path to the file
+        :param mapped:      return a read-only MappedIndex serving look-ups from the memory-mapped file instead
+        :param options:     keyword arguments of the constructor, e.g. degree
+        :return:            B+Tree or MappedIndex
+        """
+        if mapped:
+            return MappedIndex(path)
+        keys, postings = read_index(path)
+        return cls.from_postings(keys, postings, **options)
+
+    @classmethod
+    def from_postings(cls, keys, postings, **options):
+        """
+        Builds the tree bottom-up from the key column and the posting lists.
+        :param keys:        keys of all rows
+        :param postings:    list of (key, array of row ids) pairs sorted by key
+        :param options:     keyword arguments of the constructor, e.g. degree
+        :return:            B+Tree
+        """
+        index = cls([], **options)
+        index.keys = keys
+        index.row_count = len(keys)
+        index._pack(postings)
+        return index
+
+    @classmethod
+    def plan_partitions(cls, keys, partitions, **options):
+        """
+        Chooses the keys splitting the key domain into ranges merged by the workers of build_parallel().
+        :param keys:        keys of all rows
+        :param partitions:  number of slices of the rows
+        :param options:     keyword arguments of the constructor, e.g. degree
+        :return:            sorted keys starting the key ranges after the first one
+        """
+        return sample_splitters(keys, partitions)
+
+    @classmethod
+    def build_partition(cls, keys, start, splitters, **options):
+        """
+        Sorts the rows of a slice of the key column into runs of the key ranges, done by a worker of build_parallel().
+        :param keys:        keys of the slice
+        :param start:       row id of the first row of the slice
+        :param splitters:   keys starting the key ranges, see plan_partitions()
+        :param options:     keyword arguments of the constructor, e.g. degree
+        :return:            list of runs of the slice, one per key range, see indexes.storage.sorted_run()
+        """
+        return split_run(sorted_run(keys, start), splitters)
+
+    @classmethod
+    def build_segment(cls, runs, segment, splitters, **options):
+        """
+        Merges the runs of a key range from all slices into one, done by a worker of build_parallel().
+        :param runs:        runs of the key range in the order of the slices
+        :param segment:     number of the key range
+        :param splitters:   keys starting the key ranges, see plan_partitions()
+        :param options:     keyword arguments of the constructor, e.g. degree
+        :return:            merged run
+        """
+        return merge_runs(runs)
+
+    @classmethod
+    def from_partitions(cls, keys, runs, **options):
+        """
+        Builds the tree from the merged runs of consecutive key ranges, concatenating their posting lists.
+        :param keys:        keys of all rows
+        :param runs:        runs made by build_segment() in the order of the key ranges
+        :param options:     keyword arguments of the constructor, e.g. degree
+        :return:            B+Tree
+        """
+        return cls.from_postings(keys, chain.from_iterable(map(run_postings, runs)), **options)
+
+    def look_up(self, key):
+        """
+        Returns a list of row ids in the table matching the key
+        :param key:     interest of search
+        :return:        list of row ids matching items
+        """
+        leaf = self._find_leaf(key)
+        index = bisect_left(leaf.keys, key)
+        if index < len(leaf.keys) and leaf.keys[index] == key:
+            return list(leaf.rids[index])
+        return None
+
+    def look_up_many(self, keys):
+        """
+        Returns lists of row ids for many keys at once.
+        Probes are sorted, so the ones falling into the same subtree share the descent into it.
+        :param keys:    keys of interest
+        :return:        list of results of look_up aligned with the keys
+        """
+        probes = sorted(set(keys))
+        found = {}
+        stack = [(self.root, 0, len(probes))]
+        while stack:
+            node, lo, hi = stack.pop()
+            if isinstance(node, LeafNode):
+                for i in range(lo, hi):
+                    index = bisect_left(node.keys, probes[i])
+                    if index < len(node.keys) and node.keys[index] == probes[i]:
+                        found[probes[i]] = node.rids[index]
+                continue
+            i = lo
+            while i < hi:
+                index = bisect_right(node.keys, probes[i])
+                # probes below the next separator go down to the same child
+                end = bisect_left(probes, node.keys[index], i, hi) if index < len(node.keys) else hi
+                stack.append((node.children[index], i, end))
+                i = end
+        return [list(found[key]) if key in found else None for key in keys]
+
+    def range(self, lo=None, hi=None, inclusive=True):
+        """
+        Yields row ids of the items with keys between lo and hi in the key order.
+        :param lo:          lower bound of the keys, None for no bound
+        :param hi:          upper bound of the keys, None for no bound
+        :param inclusive:   whether the bounds are included, a bool or a pair of bools for (lo, hi)
+        :return:            generator of row ids
+        """
+        lo_inclusive, hi_inclusive = inclusive if isinstance(inclusive, tuple) else (inclusive, inclusive)
+        for key, rids in self._scan(lo, lo_inclusive):
+            if hi is not None and (key > hi or (key == hi and not hi_inclusive)):
+                return
+            yield from rids
+
+    def prefix(self, prefix):
+        """
+        Yields row ids of the items with string keys starting with the prefix.
+        :param prefix:  prefix of the keys
+        :return:        generator of row ids
+        """
+        for key, rids in self._scan(prefix, True):
+            if not key.startswith(prefix):
+                return
+            yield from rids
+
+    def insert(self, *keys):
+        """
+        Inserts information about new items in the table to the index.
+        :param keys:     key of inserted item
+        """
+        self.insert_many(keys)
+
+    def insert_many(self, keys):
+        """
+        Inserts information about a batch of new items.
+        Keys are inserted in the key order with one descent per distinct key.
+        :param keys:    keys of inserted items
+        """
+        start = self.row_count
+        for key in keys:
+            append_key(self.keys, self.row_count, key)
+            self.row_count += 1
+        rids_by_key = {}
+        for rid in range(start, self.row_count):
+            key = self.keys[rid]
+            if key in rids_by_key:
+                rids_by_key[key].append(rid)
+            else:
+                rids_by_key[key] = array('q', [rid])
+
+        for key in sorted(rids_by_key):
+            leaf = self._find_leaf(key)
+            index = bisect_left(leaf.keys, key)
+            if index < len(leaf.keys) and leaf.keys[index] == key:
+                leaf.rids[index].extend(rids_by_key[key])
+                continue
+            leaf.keys.insert(index, key)
+            leaf.rids.insert(index, rids_by_key[key])
+            if len(leaf.keys) >= self.degree:
+                self._split_leaf(leaf)
+
+    def update(self, rid, key):
+        """
+        Updates values of item at rid in the table and the index.
+        :param rid:     row id
+        :param key:     key of the item to be updated
+        """
+        old_key = self.keys[rid]
+        if old_key != key:
+            self._remove(old_key, rid)
+            set_key(self, rid, key)
+            self._insert(key, rid)
+
+    def delete(self, rid):
+        """
+        Deletes the item information from the index.
+        Leaves are not merged, emptied ones are skipped by the scans.
+        :param rid:     row id
+        """
+        self._remove(self.keys[rid], rid)
+
+    def delete_many(self, rids):
+        """
+        Deletes the information about a batch of items filtering the posting list of every key once.
+        A batch of at least three quarters of the rows rebuilds the tree, dropping the emptied leaves.
+        :param rids:    row ids
+        """
+        deleted = set(rids)
+        if len(deleted) * 4 >= self.row_count * 3:
+            postings = []
+            for key, key_rids in self._scan(None, True):
+                kept = array('q', [rid for rid in key_rids if rid not in deleted])
+                if kept:
+                    postings.append((key, kept))
+            self._pack(postings)
+            return
+
+        for key in sorted({self.keys[rid] for rid in deleted}):
+            leaf = self._find_leaf(key)
+            index = bisect_left(leaf.keys, key)
+            if index < len(leaf.keys) and leaf.keys[index] == key:
+                leaf.rids[index] = array('q', [rid for rid in leaf.rids[index] if rid not in deleted])
+                if not leaf.rids[index]:
+                    del leaf.keys[index]
+                    del leaf.rids[index]
+
+    def _find_leaf(self, key):
+        """
+        Returns the leaf which may contain the key.
+        :param key:     key
+        :return:        leaf node
+        """
+        node = self.root
+        while isinstance(node, InternalNode):
+            node = node.children[bisect_right(node.keys, key)]
+        return node
+
+    def _scan(self, lo, lo_inclusive):
+        """
+        Yields (key, row ids) pairs of the leaves in the key order starting from lo.
+        :param lo:              lower bound of the keys, None for no bound
+        :param lo_inclusive:    whether lo is included
+        :return:                generator of pairs
+        """
+        if lo is None:
+            leaf = self.root
+            while isinstance(leaf, InternalNode):
+                leaf = leaf.children[0]
+            index = 0
+        else:
+            leaf = self._find_leaf(lo)
+            index = bisect_left(leaf.keys, lo) if lo_inclusive else bisect_right(leaf.keys, lo)
+
+        while leaf is not None:
+            for i in range(index, len(leaf.keys)):
+                yield leaf.keys[i], leaf.rids[i]
+            leaf = leaf.next_leaf
+            index = 0
+
+    def _insert(self, key, rid):
+        """
+        Inserts a key with its row id into the leaf level, splitting the overflown nodes.
+        :param key:     key of the item
+        :param rid:     row id of the item
+        """
+        leaf = self._find_leaf(key)
+        index = bisect_left(leaf.keys, key)
+        if index < len(leaf.keys) and leaf.keys[index] == key:
+            leaf.rids[index].append(rid)
+            return
+
+        leaf.keys.insert(index, key)
+        leaf.rids.insert(index, array('q', [rid]))
+        if len(leaf.keys) >= self.degree:
+            self._split_leaf(leaf)
+
+    def _remove(self, key, rid):
+        """
+        Removes the row id of the key from the leaf level.
+        :param key:     key of the item
+        :param rid:     row id of the item
+        """
+        leaf = self._find_leaf(key)
+        index = bisect_left(leaf.keys, key)
+        if index < len(leaf.keys) and leaf.keys[index] == key and rid in leaf.rids[index]:
+            leaf.rids[index].remove(rid)
+            if not leaf.rids[index]:
+                del leaf.keys[index]
+                del leaf.rids[index]
+
+    def _split_leaf(self, leaf):
+        """
+        Splits the leaf in two halves and links the right one after it.
+        :param leaf:    overflown leaf
+        """
+        middle = len(leaf.keys) // 2
+        right = LeafNode()
+        right.keys = leaf.keys[middle:]
+        right.rids = leaf.rids[middle:]
+        del leaf.keys[middle:]
+        del leaf.rids[middle:]
+
+        right.next_leaf = leaf.next_leaf
+        leaf.next_leaf = right
+        self._insert_in_parent(leaf, right.keys[0], right)
+
+    def _split_internal(self, node):
+        """
+        Splits the internal node in two halves moving the middle key up.
+        :param node:    overflown internal node
+        """
+        middle = len(node.keys) // 2
+        separator = node.keys[middle]
+        right = InternalNode()
+        right.keys = node.keys[middle + 1:]
+        right.children = node.children[middle + 1:]
+        for child in right.children:
+            child.parent = right
+        del node.keys[middle:]
+        del node.children[middle + 1:]
+        self._insert_in_parent(node, separator, right)
+
+    def _insert_in_parent(self, node, separator, right):
+        """
+        Links the right part of a split node into the parent of the node.
+        :param node:        left part of the split node
+        :param separator:   smallest key of the right part
+        :param right:       right part of the split node
+        """
+        parent = node.parent
+        if parent is None:
+            parent = InternalNode()
+            parent.keys = [separator]
+            parent.children = [node, right]
+            node.parent = parent
+            right.parent = parent
+            self.root = parent
+            self.height += 1
+            return
+
+        index = bisect_right(parent.keys, separator)
+        parent.keys.insert(index, separator)
+        parent.children.insert(index + 1, right)
+        right.parent = parent
+        if len(parent.children) > self.degree:
+            self._split_internal(parent)
+
+
+class InternalNode:
+    """ Internal node: keys[i] is the smallest key reachable through children[i + 1]. """
+
+    def __init__(self):
+        self.keys = []
+        self.children = []
+        self.parent = None
+
+
+class LeafNode:
+    """ Leaf node: keys with posting lists of row ids, linked to the next leaf. """
+
+    def __init__(self):
+        self.keys = []
+        self.rids = []
+        self.parent = None
+        self.next_leaf = None
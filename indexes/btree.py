@@ -7,6 +7,13 @@ Created on Sat Feb 10 12:41:28 2018
 """
 
 import math
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from operator import itemgetter
+from tables.columnar import key_column, append_key, set_key, shares_keys
+from indexes.storage import MappedIndex, merge_runs, read_index, run_postings, sample_splitters, sorted_run, \
+    split_run, write_index
 
 
 def index_of(a_list, value):
@@ -19,12 +26,18 @@ def index_of(a_list, value):
 
 class BTree:
     """ Main class of BTree index, takes list of items as a parameter and build an index on this list """
-    def __init__(self, table):
-        self.degree = 3
+    def __init__(self, table, degree=64, fill_factor=1.0):
+        if degree < 3:
+            raise ValueError("BTree degree should be at least 3, got {}".format(degree))
+        self.degree = degree
+        self.min_entries = math.ceil(degree / 2) - 1
+        self.fill_factor = fill_factor
         self.root = Node()
         self.height = 0
-        self.keys = [item.key() for item in table]
-        self.build_index(table)
+        self.keys = key_column(table)
+        self.keys_shared = shares_keys(table)
+        self.row_count = len(self.keys)
+        self.bulk_load()
 
     def split(self, node):
         """ Splitting the node if full """
@@ -49,13 +62,12 @@ class BTree:
             left_node.right_most = middle_entry.left
 
         middle_entry.left = left_node
-        parent_node.add_entry(middle_entry)
+        index = parent_node.add_entry(middle_entry)
 
-        right_entry = parent_node.right_entry(middle_entry)
-        if right_entry is None:
-            parent_node.right_most = right_node
+        if index + 1 < parent_node.entry_size():
+            parent_node.entries[index + 1].left = right_node
         else:
-            right_entry.left = right_node
+            parent_node.right_most = right_node
 
         for e in left_node.entries:
             if e.left is not None:
@@ -75,187 +87,378 @@ class BTree:
             self.split(parent_node)
 
     def _insert(self, key, value, node):
-        """ Inserts a key-value pair into the tree"""
-        if node.right_most is None:
-            node.add_entry(Entry(key, value, node))
-
-            if node.entry_size() >= self.degree:
-                self.split(node)
-        else:
-            index = 0
-            for entry in node.entries:
-                if key > entry.key:
-                    index += 1
-                    continue
-                elif key == entry.key:
-                    return
-                elif key < entry.key:
-                    self._insert(key, value, entry.left)
-                    return
-
-            if index >= node.entry_size():
-                self._insert(key, value, node.right_most)
+        """ Inserts a key-value pair into the tree, appending the value to the posting list of an existing key """
+        while True:
+            index = bisect_left(node.keys, key)
+            if index < node.entry_size() and node.keys[index] == key:
+                node.entries[index].rids.append(value)
+                return
+            if node.right_most is None:
+                break
+            node = node.child(index)
+
+        node.insert_entry(index, Entry(key, array('q', [value]), node))
+        if node.entry_size() >= self.degree:
+            self.split(node)
 
     def _delete(self, entry):
         """ Deletes given entry from tree and rebalance it then """
         node = self.get_entry_node(entry, self.root)
         if node.right_most is None:
             node.remove_entry(entry)
-            if node.entry_size() < math.ceil(self.degree / 2) and self.height is not 0:
-                self.rebalance(node, entry)
+            self.rebalance(node)
         else:
+            # replacing the entry with its in-order predecessor from the leaves
             right_most = entry.left
             while right_most.right_most is not None:
                 right_most = right_most.right_most
             left_largest = right_most.last_entry()
             right_most.remove_entry(left_largest)
-            entry.key = left_largest.key
-            entry.value = left_largest.value
-            self.rebalance(right_most, left_largest)
+            left_largest.left = entry.left
+            node.replace_entry(node.index_of_entry(entry), left_largest)
+            self.rebalance(right_most)
 
     def get_entry_node(self, e, node):
         """ Returns a node that should be removed """
-        if node is None:
-            return None
-        else:
-            index = 0
-            for entry in node.entries:
-                if e.key > entry.key:
-                    index += 1
-                    continue
-                elif e.key == entry.key:
-                    return node
-                elif e.key < entry.key:
-                    return self.get_entry_node(e, entry.left)
-            if index >= node.entry_size():
-                return self.get_entry_node(e, node.right_most)
+        while node is not None:
+            index = bisect_left(node.keys, e.key)
+            if index < node.entry_size() and node.keys[index] == e.key:
+                return node
+            node = node.child(index)
         return None
 
     def search(self, key, node):
         """ Searches given key in a tree """
-        if node is None:
-            return None
-        else:
-            index = 0
-            for entry in node.entries:
-                if key > entry.key:
-                    index += 1
-                    continue
-                elif key == entry.key:
-                    return entry
-                elif key < entry.key:
-                    return self.search(key, entry.left)
-            if index >= node.entry_size():
-                return self.search(key, node.right_most)
+        while node is not None:
+            index = bisect_left(node.keys, key)
+            if index < node.entry_size() and node.keys[index] == key:
+                return node.entries[index]
+            node = node.child(index)
         return None
 
-    def rebalance(self, node, deleted_node, ):
+    def rebalance(self, node):
         """ Rebalances tree after deletion """
-        separator = None
         parent_node = node.parent
-        children = []
-        for entry in parent_node.entries:
-            if entry.left == node:
-                separator = entry
-            children.append(entry.left)
-        if parent_node.right_most == node:
-            separator = parent_node.last_entry()
-
-        children.append(parent_node.right_most)
-        index = index_of(children, node)
-        if index < len(children) - 1 and children[index + 1].entry_size() > math.ceil((self.degree / 2)):
-            right_siblings = children[index + 1]
-            right_sibling = right_siblings.first_entry()
-            right_sibling.left = separator.left
-            separator.left = deleted_node.left
-            node.add_entry(separator)
-            parent_node.remove_entry(separator)
-            parent_node.add_entry(right_sibling)
-            right_siblings.remove_entry(right_sibling)
+        if parent_node is None:
+            # the root is allowed to underflow until it gets empty
+            if node.entry_size() == 0 and node.right_most is not None:
+                self.root = node.right_most
+                self.root.parent = None
+                self.height -= 1
             return
-        elif index > 0 and children[index - 1].entry_size() > math.ceil((self.degree / 2)):
-            separator = parent_node.left_entry(separator)
-            left_siblings = children[index - 1]
-            left_sibling = left_siblings.last_entry()
-            left_sibling.left = separator.left
-            separator.left = deleted_node.left
-            node.add_entry(separator)
-            parent_node.remove_entry(separator)
-            parent_node.add_entry(left_sibling)
-            left_siblings.remove_entry(left_sibling)
+
+        if node.entry_size() >= self.min_entries:
             return
+
+        index = parent_node.index_of_child(node)
+        left_sibling = parent_node.child(index - 1) if index > 0 else None
+        right_sibling = parent_node.child(index + 1) if index < parent_node.entry_size() else None
+
+        if left_sibling is not None and left_sibling.entry_size() > self.min_entries:
+            # rotating the largest entry of the left sibling through the parent
+            separator = parent_node.entries[index - 1]
+            borrowed = left_sibling.last_entry()
+            left_sibling.remove_entry(borrowed)
+            separator.left = left_sibling.right_most
+            left_sibling.right_most = borrowed.left
+            node.insert_entry(0, separator)
+            if separator.left is not None:
+                separator.left.parent = node
+            borrowed.left = left_sibling
+            parent_node.replace_entry(index - 1, borrowed)
+        elif right_sibling is not None and right_sibling.entry_size() > self.min_entries:
+            # rotating the smallest entry of the right sibling through the parent
+            separator = parent_node.entries[index]
+            borrowed = right_sibling.first_entry()
+            right_sibling.remove_entry(borrowed)
+            separator.left = node.right_most
+            node.insert_entry(node.entry_size(), separator)
+            node.right_most = borrowed.left
+            if node.right_most is not None:
+                node.right_most.parent = node
+            borrowed.left = node
+            parent_node.replace_entry(index, borrowed)
         else:
-            new_node = Node()
-            new_node.add_entries(node.entries)
-            if index < len(children) - 1:
-                right_siblings = children[index + 1]
-                new_node.add_entries(right_siblings.entries)
-                separator.left = node.right_most
-                new_node.right_most = right_siblings.right_most
-            elif index > 0:
-                left_siblings = children[index - 1]
-                new_node.add_entries(left_siblings.entries)
-                separator.left = left_siblings.right_most
-                if node.entry_size() > 0:
-                    new_node.right_most = node.first_entry().left
-                else:
-                    new_node.right_most = node.right_most
-            new_node.add_entry(separator)
-            for e in new_node.entries:
-                if e.left is not None:
-                    e.left.parent = new_node
-            if new_node.right_most is not None:
-                new_node.right_most.parent = new_node
-            new_node.parent = parent_node
-            right_entry = parent_node.right_entry(separator)
-            if right_entry is not None:
-                right_entry.left = new_node
+            if left_sibling is not None:
+                self.merge(parent_node, index - 1)
             else:
-                parent_node.right_most = new_node
-            parent_node.remove_entry(separator)
-
-            if parent_node.entry_size() < math.ceil(self.degree / 2):
-                if parent_node.parent is None:
-                    new_node.parent = None
-                    self.root = new_node
-                    self.height -= 1
-                else:
-                    self.rebalance(parent_node, separator)
+                self.merge(parent_node, index)
+            self.rebalance(parent_node)
+
+    def merge(self, parent_node, index):
+        """ Merges children of the parent around the separator at index into the left child """
+        separator = parent_node.entries[index]
+        left_node = separator.left
+        right_node = parent_node.child(index + 1)
+
+        separator.left = left_node.right_most
+        left_node.insert_entry(left_node.entry_size(), separator)
+        left_node.add_entries(right_node.entries)
+        left_node.right_most = right_node.right_most
+
+        for e in right_node.entries:
+            if e.left is not None:
+                e.left.parent = left_node
+        if right_node.right_most is not None:
+            right_node.right_most.parent = left_node
+
+        parent_node.remove_entry(separator)
+        if index < parent_node.entry_size():
+            parent_node.entries[index].left = left_node
+        else:
+            parent_node.right_most = left_node
 
     def look_up(self, key):
         """ Search preparation """
-        rid = self.search(key, self.root)
-        return [rid.value] if rid is not None else None
+        entry = self.search(key, self.root)
+        return list(entry.rids) if entry is not None else None
+
+    @classmethod
+    def from_batches(cls, batches, **options):
+        """ Building index from batches of items keeping only their keys, the tree is bulk loaded once at the end """
+        index = cls([], **options)
+        for batch in batches:
+            index.keys.extend(item.key() for item in batch)
+        index.row_count = len(index.keys)
+        index.bulk_load()
+        return index
+
+    def save(self, path):
+        """ Saving the keys and the posting lists into a binary file, see indexes.storage """
+        write_index(path, self.keys[:self.row_count], self._postings())
+
+    @classmethod
+    def load(cls, path, mapped=False, **options):
+        """ Loading index from a file saved by any index, or a read-only MappedIndex over the file if mapped """
+        if mapped:
+            return MappedIndex(path)
+        keys, postings = read_index(path)
+        return cls.from_postings(keys, postings, **options)
+
+    @classmethod
+    def from_postings(cls, keys, postings, **options):
+        """ Building index from the key column and the (key, array of row ids) pairs sorted by key, bulk loading it """
+        index = cls([], **options)
+        index.keys = keys
+        index.row_count = len(keys)
+        index._pack([Entry(key, rids, None) for key, rids in postings])
+        return index
+
+    @classmethod
+    def plan_partitions(cls, keys, partitions, **options):
+        """ Choosing the keys splitting the key domain into ranges merged by the workers of build_parallel() """
+        return sample_splitters(keys, partitions)
+
+    @classmethod
+    def build_partition(cls, keys, start, splitters, **options):
+        """ Sorting the rows of a slice of the key column into runs of the key ranges, done by a worker """
+        return split_run(sorted_run(keys, start), splitters)
+
+    @classmethod
+    def build_segment(cls, runs, segment, splitters, **options):
+        """ Merging the runs of a key range from all slices into one, done by a worker """
+        return merge_runs(runs)
+
+    @classmethod
+    def from_partitions(cls, keys, runs, **options):
+        """ Building index from the merged runs of consecutive key ranges, concatenating their posting lists """
+        return cls.from_postings(keys, chain.from_iterable(map(run_postings, runs)), **options)
+
+    def _postings(self):
+        """ Yields keys with posting lists of all entries of the tree """
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            for entry in node.entries:
+                yield entry.key, entry.rids
+                if entry.left is not None:
+                    nodes.append(entry.left)
+            if node.right_most is not None:
+                nodes.append(node.right_most)
+
+    def look_up_many(self, keys):
+        """ Search of many keys at once, sorted probes going to the same subtree share the descent into it """
+        probes = sorted(set(keys))
+        found = {}
+        stack = [(self.root, 0, len(probes))]
+        while stack:
+            node, lo, hi = stack.pop()
+            i = lo
+            while i < hi:
+                index = bisect_left(node.keys, probes[i])
+                if index < node.entry_size() and node.keys[index] == probes[i]:
+                    found[probes[i]] = node.entries[index].rids
+                    i += 1
+                    continue
+                # probes below the next key of the node go down to the same child
+                end = bisect_left(probes, node.keys[index], i, hi) if index < node.entry_size() else hi
+                child = node.child(index)
+                if child is not None:
+                    stack.append((child, i, end))
+                i = end
+        return [list(found[key]) if key in found else None for key in keys]
 
     def build_index(self, table):
         """ Building index from table """
-        for rid, item in enumerate(table):
-            self._insert(item.key(), rid, self.root)
+        for rid in range(self.row_count):
+            self._insert(self.keys[rid], rid, self.root)
+
+    def bulk_load(self):
+        """ Building index from the key column bottom-up, sorting (key, rid) pairs once """
+        pairs = sorted(zip(self.keys, range(self.row_count)), key=itemgetter(0))
+
+        # rows with the same key share a single posting list
+        entries = []
+        for key, rid in pairs:
+            if entries and entries[-1].key == key:
+                entries[-1].rids.append(rid)
+            else:
+                entries.append(Entry(key, array('q', [rid]), None))
+        self._pack(entries)
+
+    def _pack(self, entries):
+        """ Building the levels of the tree bottom-up from the entries sorted by key """
+        capacity = max(1, min(self.degree - 1, int((self.degree - 1) * self.fill_factor)))
+        children = None
+        self.height = 0
+        nodes, separators = self._pack_level(entries, children, capacity, self.min_entries)
+        while len(nodes) > 1:
+            entries, children = separators, nodes
+            nodes, separators = self._pack_level(entries, children, capacity, self.min_entries)
+            self.height += 1
+        self.root = nodes[0]
+
+    @staticmethod
+    def _pack_level(entries, children, capacity, min_entries):
+        """ Packs sorted entries into nodes of one level, returns the nodes and the separators between them """
+        node_count = -(-(len(entries) + 1) // (capacity + 1))
+        # below the full capacity the entries may be spread too thin, fewer nodes keep all of them at the minimum
+        node_count = max(1, min(node_count, (len(entries) + 1) // (min_entries + 1)))
+        size, extra = divmod(len(entries) - (node_count - 1), node_count)
+
+        nodes = []
+        separators = []
+        position = 0
+        for i in range(node_count):
+            end = position + size + (1 if i < extra else 0)
+            node = Node()
+            node.add_entries(entries[position:end])
+            if children is not None:
+                for entry, child in zip(node.entries, children[position:end]):
+                    entry.left = child
+                    child.parent = node
+                node.right_most = children[end]
+                node.right_most.parent = node
+            nodes.append(node)
+            if end < len(entries):
+                separators.append(entries[end])
+            position = end + 1
+        return nodes, separators
 
     def insert(self, *keys):
         """ Insert preparation """
+        self.insert_many(keys)
+
+    def insert_many(self, keys):
+        """ Inserting a batch of keys in the key order with one search per distinct key, a large batch rebuilds the tree """
+        start = self.row_count
         for key in keys:
-            self.keys.append(key)
-            self._insert(key, len(self.keys) - 1, self.root)
+            append_key(self.keys, self.row_count, key)
+            self.row_count += 1
+        rids_by_key = {}
+        for rid in range(start, self.row_count):
+            key = self.keys[rid]
+            if key in rids_by_key:
+                rids_by_key[key].append(rid)
+            else:
+                rids_by_key[key] = array('q', [rid])
+
+        if self._should_rebuild(self.row_count - start):
+            postings = dict(self._postings())
+            for key, rids in rids_by_key.items():
+                if key in postings:
+                    postings[key].extend(rids)
+                else:
+                    postings[key] = rids
+            self._pack([Entry(key, postings[key], None) for key in sorted(postings)])
+            return
+
+        for key in sorted(rids_by_key):
+            rids = rids_by_key[key]
+            entry = self.search(key, self.root)
+            if entry is not None:
+                entry.rids.extend(rids)
+                continue
+            self._insert(key, rids[0], self.root)
+            if len(rids) > 1:
+                self.search(key, self.root).rids.extend(rids[1:])
+
+    def update(self, rid, key):
+        """ Update preparation """
+        old_key = self.keys[rid]
+        if old_key != key:
+            self.delete(rid)
+            set_key(self, rid, key)
+            self._insert(key, rid, self.root)
 
     def delete(self, rid):
-        """ Delete preparation """
+        """ Delete preparation, the entry is removed with the last row id of its key """
         old_key = self.keys[rid]
         entry = self.search(old_key, self.root)
-        self._delete(entry)
+        if entry is not None and rid in entry.rids:
+            entry.rids.remove(rid)
+            if len(entry.rids) == 0:
+                self._delete(entry)
+
+    def delete_many(self, rids):
+        """ Deleting a batch of rows filtering the posting list of every key once, a large batch rebuilds the tree """
+        deleted = set(rids)
+        if self._should_rebuild(len(deleted)):
+            entries = []
+            for key, key_rids in self._postings():
+                kept = array('q', [rid for rid in key_rids if rid not in deleted])
+                if kept:
+                    entries.append(Entry(key, kept, None))
+            entries.sort(key=lambda entry: entry.key)
+            self._pack(entries)
+            return
+
+        for key in sorted({self.keys[rid] for rid in deleted}):
+            entry = self.search(key, self.root)
+            if entry is None:
+                continue
+            entry.rids = array('q', [rid for rid in entry.rids if rid not in deleted])
+            if len(entry.rids) == 0:
+                self._delete(entry)
+
+    def _should_rebuild(self, batch_size):
+        """ Checks whether a batch changes so many rows that packing the tree anew is cheaper than updating it """
+        return batch_size * 2 >= self.row_count
 
 
 class Node:
     """ Node class, contains all entries getting methods """
     def __init__(self):
         self.entries = []
+        self.keys = []
         self.parent = None
         self.right_most = None
 
     def add_entry(self, entry):
-        """ Adds an entry into the list of entries """
-        self.entries.append(entry)
-        self.entries.sort(key=entry.compare_to, reverse=True)
+        """ Adds an entry into the list of entries keeping it sorted, returns its position """
+        index = bisect_right(self.keys, entry.key)
+        self.insert_entry(index, entry)
+        return index
+
+    def insert_entry(self, index, entry):
+        """ Inserts an entry at the given position of the list of entries """
+        self.entries.insert(index, entry)
+        self.keys.insert(index, entry.key)
+
+    def replace_entry(self, index, entry):
+        """ Replaces an entry at the given position of the list of entries """
+        self.entries[index] = entry
+        self.keys[index] = entry.key
 
     def first_entry(self):
         """ Returns first entry from list of entries """
@@ -271,11 +474,14 @@ class Node:
 
     def remove_entry(self, entry):
         """ Deletes an entry from list of entries """
-        self.entries.remove(entry)
+        index = self.index_of_entry(entry)
+        del self.entries[index]
+        del self.keys[index]
 
     def add_entries(self, entries):
         """ Adds new entries into the list of entries """
         self.entries.extend(entries)
+        self.keys.extend(entry.key for entry in entries)
 
     def entries(self):
         """ Returns list of entries """
@@ -285,6 +491,26 @@ class Node:
         """ Returns the size of list of entries """
         return len(self.entries)
 
+    def index_of_entry(self, entry):
+        """ Returns the position of the entry in the list of entries """
+        index = bisect_left(self.keys, entry.key)
+        while self.entries[index] is not entry:
+            index += 1
+        return index
+
+    def child(self, index):
+        """ Returns the index-th child of the node """
+        if index < self.entry_size():
+            return self.entries[index].left
+        return self.right_most
+
+    def index_of_child(self, node):
+        """ Returns the position of the child among the children of the node """
+        for index, entry in enumerate(self.entries):
+            if entry.left is node:
+                return index
+        return self.entry_size()
+
     def get_left_entries(self):
         """ Returns left half of list of entries """
         return self.entries[0: self.entry_size() // 2]
@@ -321,10 +547,10 @@ class Node:
 
 
 class Entry:
-    """ Entry class """
-    def __init__(self, key, value, cont):
+    """ Entry class, keeps a key with the posting list (array) of row ids of the key """
+    def __init__(self, key, rids, cont):
         self.key = key
-        self.value = value
+        self.rids = rids
         self.left = None
 
     """ Custom comparing function to compare int and strings """
@@ -333,4 +559,4 @@ class Entry:
 
     """ Returns entry """
     def __str__(self):
-        return "({0},{1},{2})".format(self.key, self.value, self.left)
+        return "({0},{1},{2})".format(self.key, list(self.rids), self.left)
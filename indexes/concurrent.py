@@ -0,0 +1,430 @@
+"""
+Indexes safe to use from many threads.
+
+Readers never wait for each other: trees are read optimistically and validated by a version number,
+hash tables are split into stripes with reader-writer locks, bitmaps are copied on write
+so readers see a complete version of every bitmap without locking.
+"""
+
+from contextlib import contextmanager
+from threading import Condition, Lock
+from tables.columnar import append_key, set_key
+from indexes.bitmap_index import BitmapIndex
+from indexes.hash_index import HashIndex, HashTable
+from indexes.storage import group_rows
+
+
+class ReadWriteLock:
+    """
+    Lock held by any number of readers at once or by a single writer.
+    A waiting writer keeps new readers out, so a stream of readers cannot starve it.
+    """
+
+    def __init__(self):
+        self._condition = Condition(Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def reading(self):
+        """ Holds the lock shared with other readers within the with block """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        """ Holds the lock exclusively within the with block """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class OptimisticIndex:
+    """
+    Wraps an in-memory tree index, e.g. BTree or BPlusTree, for concurrent use.
+    Writers are serialised by a lock and make the version odd while they change the tree.
+    Readers take no lock: a read is repeated if the version changed while it ran, and only after
+    several failed attempts it takes the lock, shared with other readers. Reads failing on a tree changed
+    under them are repeated too, reads finding a writer at work wait for it on the lock instead of spinning.
+    Indexes whose look-ups modify them, like the buffer pool of PagedBTree, cannot be read optimistically.
+    """
+
+    def __init__(self, index, retries=3):
+        """
+        Optimistic index constructor.
+        :param index:       tree index
+        :param retries:     number of optimistic attempts of a read before it takes the lock
+        """
+        self.index = index
+        self.retries = retries
+        self.version = 0
+        self._lock = ReadWriteLock()
+        if hasattr(index, 'range'):
+            self.range = self._range
+
+    def read(self, function, *args):
+        """
+        Runs a read-only function of the tree validating that no writer interfered.
+        :param function:    function returning a result not sharing state with the tree
+        :param args:        arguments of the function
+        :return:            result of the function
+        """
+        for _ in range(self.retries):
+            version = self.version
+            if version & 1:
+                # a writer is changing the tree, repeating the read at once would fail again
+                break
+            try:
+                result = function(*args)
+            except Exception:
+                # a writer may have left the nodes inconsistent for a moment, the locked attempt raises real errors
+                continue
+            if self.version == version:
+                return result
+        with self._lock.reading():
+            return function(*args)
+
+    @contextmanager
+    def writing(self):
+        """ Excludes other writers and locked readers and invalidates the running reads within the with block """
+        with self._lock.writing():
+            self.version += 1
+            try:
+                yield self.index
+            finally:
+                self.version += 1
+
+    def look_up(self, key):
+        return self.read(self.index.look_up, key)
+
+    def look_up_many(self, keys):
+        return self.read(self.index.look_up_many, keys)
+
+    def _range(self, lo=None, hi=None, inclusive=True):
+        """ Returns a list of row ids of the range, set as range() of indexes wrapping a BPlusTree """
+        return self.read(lambda: list(self.index.range(lo, hi, inclusive)))
+
+    def insert(self, *keys):
+        self.insert_many(keys)
+
+    def insert_many(self, keys):
+        with self.writing() as index:
+            index.insert_many(keys)
+
+    def update(self, rid, key):
+        with self.writing() as index:
+            index.update(rid, key)
+
+    def delete(self, rid):
+        with self.writing() as index:
+            index.delete(rid)
+
+    def delete_many(self, rids):
+        with self.writing() as index:
+            index.delete_many(rids)
+
+    def save(self, path):
+        with self._lock.reading():
+            self.index.save(path)
+
+
+class StripedHashTable:
+    """
+    Hash table split into stripes by the high bits of the hash code of a key.
+    Every stripe is a separate hash table behind its own reader-writer lock and is resized on its own,
+    so a writer blocks only the stripe of its key and readers do not block each other.
+    """
+
+    def __init__(self, stripes=16, stripe_class=None, **options):
+        """
+        Striped Hash Table constructor.
+        :param stripes:         number of stripes, a power of two
+        :param stripe_class:    hash table class of a stripe, HashTable (default) or OpenAddressingHashTable
+        :param options:         keyword arguments of the hash table of every stripe
+        """
+        if stripes <= 0 or stripes & (stripes - 1):
+            raise ValueError("Number of stripes should be a power of two, got {}".format(stripes))
+        self.tables = [(stripe_class or HashTable)(**options) for _ in range(stripes)]
+        self.locks = [ReadWriteLock() for _ in range(stripes)]
+        # the buckets of a stripe are chosen by the low bits, so the stripe is chosen by the high bits of a mix
+        self.shift = 65 - stripes.bit_length()
+
+    @property
+    def size(self):
+        return sum(table.size for table in self.tables)
+
+    def stripe_of(self, key):
+        """
+        Returns the stripe number of the key.
+        :param key:     key
+        :return:        stripe number
+        """
+        h = hash(key) if key is not None else 0
+        return ((h * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+
+    def put(self, key, value):
+        stripe = self.stripe_of(key)
+        with self.locks[stripe].writing():
+            self.tables[stripe].put(key, value)
+
+    def put_many(self, keys, values):
+        """
+        Puts many key-value pairs, holding the lock of every touched stripe once.
+        :param keys:    keys of the items
+        :param values:  values
+        """
+        for stripe, (stripe_keys, stripe_values) in self._group(keys, values).items():
+            with self.locks[stripe].writing():
+                self.tables[stripe].put_many(stripe_keys, stripe_values)
+
+    def put_values(self, key, values):
+        stripe = self.stripe_of(key)
+        with self.locks[stripe].writing():
+            self.tables[stripe].put_values(key, values)
+
+    def get_values(self, key):
+        stripe = self.stripe_of(key)
+        with self.locks[stripe].reading():
+            return self.tables[stripe].get_values(key)
+
+    def get_values_many(self, keys):
+        """
+        Returns lists of values for many keys, holding the lock of every touched stripe once.
+        :param keys:    keys
+        :return:        list of results of get_values aligned with the keys
+        """
+        result = [None] * len(keys)
+        for stripe, (stripe_keys, positions) in self._group(keys, range(len(keys))).items():
+            with self.locks[stripe].reading():
+                values = self.tables[stripe].get_values_many(stripe_keys)
+            for position, key_values in zip(positions, values):
+                result[position] = key_values
+        return result
+
+    def remove(self, key, value):
+        stripe = self.stripe_of(key)
+        with self.locks[stripe].writing():
+            self.tables[stripe].remove(key, value)
+
+    def remove_many(self, keys, values):
+        """
+        Removes many key-value pairs, holding the lock of every touched stripe once.
+        :param keys:    keys of the nodes
+        :param values:  values of the nodes
+        """
+        for stripe, (stripe_keys, stripe_values) in self._group(keys, values).items():
+            with self.locks[stripe].writing():
+                self.tables[stripe].remove_many(stripe_keys, stripe_values)
+
+    def reserve(self, rows):
+        """
+        Grows every stripe in advance for its share of the rows.
+        :param rows:    expected number of stored key-value pairs
+        """
+        share = rows // len(self.tables) + 1
+        for table, lock in zip(self.tables, self.locks):
+            with lock.writing():
+                table.reserve(share)
+
+    def _group(self, keys, values):
+        """
+        Groups the key-value pairs by the stripes of the keys.
+        :param keys:    keys
+        :param values:  values aligned with the keys
+        :return:        dict of stripe number -> (list of keys, list of values)
+        """
+        groups = dict()
+        for key, value in zip(keys, values):
+            stripe = self.stripe_of(key)
+            if stripe in groups:
+                groups[stripe][0].append(key)
+                groups[stripe][1].append(value)
+            else:
+                groups[stripe] = ([key], [value])
+        return groups
+
+    def __str__(self):
+        return "".join("Stripe {}:\n{}".format(i, table) for i, table in enumerate(self.tables))
+
+
+class ConcurrentHashIndex(HashIndex):
+    """ Hash Index over a StripedHashTable, row ids of inserted rows are allocated under a lock. """
+
+    def __init__(self, table, engine=None, presize=True, stripes=16, **options):
+        """
+        Concurrent Hash Index constructor.
+        :param table:       table with items (rows) upon which index is built
+        :param engine:      hash table class of a stripe, HashTable (default) or OpenAddressingHashTable
+        :param presize:     size the stripes for the rows of the table so that the build never resizes them
+        :param stripes:     number of stripes, a power of two
+        :param options:     keyword arguments of the hash table of every stripe
+        """
+        self._rows_lock = Lock()
+        super().__init__(table, StripedHashTable, presize, stripes=stripes, stripe_class=engine, **options)
+
+    # the stripes are separate tables, which build_parallel() does not split into segments
+    plan_partitions = build_partition = build_segment = from_partitions = None
+
+    def build_index(self, table):
+        """
+        Builds a index from the table of key-value items, the lock of every stripe is taken once.
+        :param table:   table with items (rows)
+        """
+        self.hash_table.put_many(self.keys[:self.row_count], range(self.row_count))
+
+    def insert_many(self, keys):
+        """
+        Inserts information about a batch of new items, only the stripes of the keys are locked for the puts.
+        :param keys:    keys of inserted items
+        """
+        keys = list(keys)
+        with self._rows_lock:
+            start = self.row_count
+            for key in keys:
+                append_key(self.keys, self.row_count, key)
+                self.row_count += 1
+            end = self.row_count
+        self.hash_table.put_many(keys, range(start, end))
+
+    def update(self, rid, key):
+        """
+        Updates values of item at rid in the table and the index.
+        The key column is changed under the lock of the rows, as a shared column is replaced by a copy.
+        :param rid:     row id
+        :param key:     key of the item to be updated
+        """
+        with self._rows_lock:
+            old_key = self.keys[rid]
+            if old_key == key:
+                return
+            set_key(self, rid, key)
+        self.hash_table.remove(old_key, rid)
+        self.hash_table.put(key, rid)
+
+
+class CopyOnWriteBitmapIndex(BitmapIndex):
+    """
+    Bitmap Index whose bitmaps are never changed once published.
+    A writer changes a copy of every bitmap it touches and replaces the bitmap with it,
+    so readers take no lock and always see a complete version of each bitmap.
+    Writers are serialised by a lock.
+    """
+
+    def __init__(self, table, bitmap_class=None):
+        """
+        Copy-on-write Bitmap Index constructor.
+        :param table:           table with items (rows) upon which index is built
+        :param bitmap_class:    bitmap implementation, Bitmap (default), IntBitmap or RoaringBitmap
+        """
+        self._write_lock = Lock()
+        super().__init__(table, bitmap_class)
+
+    def look_up(self, key):
+        """
+        Returns a list of row ids in the table matching the key
+        :param key:     interest of search
+        :return:        list of row ids matching items
+        """
+        bitmap = self.bitmap_table.get(key)
+        return bitmap.get_row_ids() if bitmap is not None else None
+
+    def insert_many(self, keys):
+        with self._write_lock:
+            super().insert_many(keys)
+
+    def update(self, rid, key):
+        with self._write_lock:
+            super().update(rid, key)
+
+    def delete(self, rid):
+        self.delete_many([rid])
+
+    def delete_many(self, rids):
+        """
+        Deletes the information about a batch of items, every touched bitmap is copied once.
+        :param rids:    row ids
+        """
+        rids = list(rids)
+        with self._write_lock:
+            for key, key_rids in group_rows(self.keys, rids):
+                bitmap = self.bitmap_table.get(key)
+                if bitmap is None:
+                    continue
+                bitmap = self._copy(bitmap)
+                bitmap.clear_bits(key_rids)
+                if bitmap.is_empty():
+                    self.bitmap_table.pop(key, None)
+                else:
+                    self.bitmap_table[key] = bitmap
+            existence = self._copy(self.existence)
+            existence.clear_bits(rids)
+            self.existence = existence
+
+    def _index_rows(self, start):
+        """
+        Sets the bits of the rows from start up to the row count in copies of the bitmaps of their keys.
+        :param start:   row id of the first row to be indexed
+        """
+        for key, rids in group_rows(self.keys, range(start, self.row_count)):
+            bitmap = self.bitmap_table.get(key)
+            bitmap = self._copy(bitmap) if bitmap is not None else self.bitmap_class(self.row_count)
+            bitmap.set_bits(rids)
+            self.bitmap_table[key] = bitmap
+        existence = self._copy(self.existence)
+        existence.set_bits(range(start, self.row_count))
+        self.existence = existence
+
+    def _set_row(self, key, rid):
+        bitmap = self.bitmap_table.get(key)
+        bitmap = self._copy(bitmap) if bitmap is not None else self.bitmap_class(self.row_count)
+        bitmap.set_bit(rid)
+        self.bitmap_table[key] = bitmap
+        existence = self._copy(self.existence)
+        existence.set_bit(rid)
+        self.existence = existence
+
+    def _clear_row(self, key, rid):
+        bitmap = self.bitmap_table.get(key)
+        if bitmap is None:
+            return
+        bitmap = self._copy(bitmap)
+        bitmap.clear_bit(rid)
+        if bitmap.is_empty():
+            self.bitmap_table.pop(key, None)
+        else:
+            self.bitmap_table[key] = bitmap
+
+    def _copy(self, bitmap):
+        """ Returns a new bitmap with the bits of the given one """
+        return bitmap | self.bitmap_class(0)
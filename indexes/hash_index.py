@@ -1,22 +1,161 @@
+from array import array
+from operator import itemgetter
+from tables.columnar import key_column, append_key, set_key, shares_keys
+from indexes.storage import HASHED, MappedIndex, read_index, write_index
+
+# str hashed by the workers of a parallel build and by the parent to check that their hash codes agree
+_HASH_PROBE = 'hash probe'
+
+
 class HashIndex:
     """ Implements Hash Index. """
 
-    def __init__(self, table):
+    def __init__(self, table, engine=None, presize=True, **options):
         """
         Hash Index constructor.
         :param table:           table with items (rows) upon which index is built
+        :param engine:          hash table class storing the rids, HashTable (default) or OpenAddressingHashTable
+        :param presize:         size the hash table for the rows of the table so that the build never resizes it
+        :param options:         keyword arguments of the hash table, e.g. load_factor or incremental
         """
-        self.hash_table = HashTable()
-        self.keys = [item.key() for item in table]
+        self.hash_table = (engine or HashTable)(**options)
+        self.keys = key_column(table)
+        self.keys_shared = shares_keys(table)
+        self.row_count = len(self.keys)
+        if presize:
+            self.hash_table.reserve(self.row_count)
         self.build_index(table)
 
+    @classmethod
+    def from_batches(cls, batches, engine=None, **options):
+        """
+        Builds the index from batches of items, e.g. streamed from a file, without keeping the items.
+        Every batch is put into the hash table as soon as it is read.
+        :param batches:     iterable of lists of items (rows)
+        :param engine:      hash table class storing the rids, HashTable (default) or OpenAddressingHashTable
+        :param options:     keyword arguments of the hash table, e.g. load_factor or incremental
+        :return:            Hash Index
+        """
+        index = cls([], engine, **options)
+        for batch in batches:
+            index.insert(*[item.key() for item in batch])
+        return index
+
+    def save(self, path):
+        """
+        Saves the keys and the rids of every key into a binary file with a hashed directory, see indexes.storage.
+        :param path:    path to the file
+        """
+        keys = self.keys[:self.row_count]
+        postings = ((key, self.look_up(key)) for key in set(keys))
+        write_index(path, keys, (pair for pair in postings if pair[1]), HASHED)
+
+    @classmethod
+    def load(cls, path, mapped=False, engine=None, **options):
+        """
+        Loads the index from a file saved by any index.
+        :param path:        path to the file
+        :param mapped:      return a read-only MappedIndex serving look-ups from the memory-mapped file instead
+        :param engine:      hash table class storing the rids, HashTable (default) or OpenAddressingHashTable
+        :param options:     keyword arguments of the hash table, e.g. load_factor or incremental
+        :return:            Hash Index or MappedIndex
+        """
+        if mapped:
+            return MappedIndex(path)
+        keys, postings = read_index(path)
+        return cls.from_postings(keys, postings, engine, **options)
+
+    @classmethod
+    def from_postings(cls, keys, postings, engine=None, **options):
+        """
+        Builds the index from the key column and the row ids of every key.
+        :param keys:        keys of all rows
+        :param postings:    iterable of (key, row ids) pairs
+        :param engine:      hash table class storing the rids, HashTable (default) or OpenAddressingHashTable
+        :param options:     keyword arguments of the hash table, e.g. load_factor or incremental
+        :return:            Hash Index
+        """
+        index = cls([], engine, **options)
+        index.keys = keys
+        index.row_count = len(keys)
+        index.hash_table.reserve(index.row_count)
+        put_values = index.hash_table.put_values
+        for key, rids in postings:
+            put_values(key, rids)
+        return index
+
+    @classmethod
+    def plan_partitions(cls, keys, partitions, engine=None, presize=True, **options):
+        """
+        Sizes the hash table for all rows, its slots are split into a segment per worker of build_parallel().
+        :param keys:        keys of all rows
+        :param partitions:  number of slices of the rows, the table is split into as many segments
+        :param engine:      hash table class storing the rids, HashTable (default) or OpenAddressingHashTable
+        :param presize:     ignored, the table is always sized for all rows
+        :param options:     keyword arguments of the hash table, e.g. load_factor
+        :return:            (number of slots of the table, number of segments)
+        """
+        return (engine or HashTable)(**options).capacity_for(len(keys)), partitions
+
+    @classmethod
+    def build_partition(cls, keys, start, plan, engine=None, presize=True, **options):
+        """
+        Hashes the rows of a slice of the key column and splits them by the segment of the hash table
+        they fall into, done by a worker of build_parallel().
+        :param keys:        keys of the slice
+        :param start:       row id of the first row of the slice
+        :param plan:        (number of slots of the table, number of segments), see plan_partitions()
+        :param engine:      hash table class storing the rids, HashTable (default) or OpenAddressingHashTable
+        :param presize:     ignored, the table is always sized for all rows
+        :param options:     keyword arguments of the hash table, e.g. load_factor
+        :return:            list of (keys, hash codes, row ids) of the rows of every segment
+        """
+        capacity, segments = plan
+        return (engine or HashTable)(**options).split_rows(keys, start, capacity, segments)
+
+    @classmethod
+    def build_segment(cls, pieces, segment, plan, engine=None, presize=True, **options):
+        """
+        Builds a segment of the hash table from its rows of all slices, done by a worker of build_parallel().
+        :param pieces:      rows of the segment split from every slice by build_partition()
+        :param segment:     number of the segment
+        :param plan:        (number of slots of the table, number of segments), see plan_partitions()
+        :param engine:      hash table class storing the rids, HashTable (default) or OpenAddressingHashTable
+        :param presize:     ignored, the table is always sized for all rows
+        :param options:     keyword arguments of the hash table, e.g. load_factor
+        :return:            (hash code of a probe str in the worker, segment of the hash table)
+        """
+        capacity, segments = plan
+        return hash(_HASH_PROBE), (engine or HashTable)(**options).build_segment(pieces, capacity, segment, segments)
+
+    @classmethod
+    def from_partitions(cls, keys, segments, engine=None, presize=True, **options):
+        """
+        Builds the index from the segments of the hash table built by build_segment(), joining them.
+        :param keys:        keys of all rows
+        :param segments:    results of build_segment() in the order of the segments
+        :param engine:      hash table class storing the rids, HashTable (default) or OpenAddressingHashTable
+        :param presize:     ignored, the table is always sized for all rows
+        :param options:     keyword arguments of the hash table, e.g. load_factor
+        :return:            Hash Index
+        """
+        if keys and type(keys[0]) is str and any(probe != hash(_HASH_PROBE) for probe, _ in segments):
+            raise RuntimeError("The workers hash str keys differently from this process, "
+                               "start the pool by fork or set PYTHONHASHSEED")
+        index = cls([], engine, **options)
+        index.keys = keys
+        index.row_count = len(keys)
+        index.hash_table.join_segments([segment for _, segment in segments], index.row_count)
+        return index
+
     def build_index(self, table):
         """
         Builds a index from the table of key-value items.
         :param table:   table with items (rows)
         """
-        for rid, item in enumerate(table):
-            self.hash_table.put(item.key(), rid)
+        put = self.hash_table.put
+        for rid in range(self.row_count):
+            put(self.keys[rid], rid)
 
     def look_up(self, key):
         """
@@ -24,26 +163,50 @@ class HashIndex:
         :param key:     interest of search
         :return:        list of row ids matching items
         """
-        nodes = self.hash_table.get(key)
+        rids = self.hash_table.get_values(key)
 
-        if nodes is not None:
+        if rids is not None:
             result = []
-            for node in nodes:
-                # checking that node's key is the needed one by referencing the list of keys
-                if self.keys[node.value] == key:
-                    result.append(node.value)
+            for rid in rids:
+                # checking that rid's key is the needed one by referencing the list of keys
+                if self.keys[rid] == key:
+                    result.append(rid)
             return result
         else:
             return None
 
+    def look_up_many(self, keys):
+        """
+        Returns lists of row ids for many keys at once, the distinct keys are hashed in one pass.
+        :param keys:    keys of interest
+        :return:        list of results of look_up aligned with the keys
+        """
+        distinct = list(dict.fromkeys(keys))
+        found = {}
+        row_keys = self.keys
+        for key, rids in zip(distinct, self.hash_table.get_values_many(distinct)):
+            if rids is not None:
+                found[key] = [rid for rid in rids if row_keys[rid] == key]
+        return [list(found[key]) if key in found else None for key in keys]
+
     def insert(self, *keys):
         """
         Inserts information about new items in the table to the index.
         :param keys:     key of inserted item
         """
+        self.insert_many(keys)
+
+    def insert_many(self, keys):
+        """
+        Inserts information about a batch of new items, the hash table is resized at most once.
+        :param keys:    keys of inserted items
+        """
+        keys = list(keys)
+        start = self.row_count
         for key in keys:
-            self.keys.append(key)
-            self.hash_table.put(key, len(self.keys) - 1)
+            append_key(self.keys, self.row_count, key)
+            self.row_count += 1
+        self.hash_table.put_many(keys, range(start, self.row_count))
 
     def update(self, rid, key):
         """
@@ -52,11 +215,10 @@ class HashIndex:
         :param key:     key of the item to be updated
         """
         old_key = self.keys[rid]
-        if old_key == key:
-            self.keys[rid] = key
-        else:
+        if old_key != key:
             self.hash_table.remove(old_key, rid)
             self.hash_table.put(key, rid)
+            set_key(self, rid, key)
 
     def delete(self, rid):
         """
@@ -67,6 +229,14 @@ class HashIndex:
         old_key = self.keys[rid]
         self.hash_table.remove(old_key, rid)
 
+    def delete_many(self, rids):
+        """
+        Deletes the information about a batch of items, the hash table is shrunk at most once.
+        :param rids:    row ids
+        """
+        rids = list(rids)
+        self.hash_table.remove_many([self.keys[rid] for rid in rids], rids)
+
     def __str__(self):
         """
         Returns a string representation of the Hash Index
@@ -77,15 +247,32 @@ class HashIndex:
 
 class HashTable:
 
-    def __init__(self, capacity=16, load_factor=0.75):
+    def __init__(self, capacity=16, load_factor=0.75, incremental=False, migration_step=4,
+                 shrink_threshold=0.25, min_capacity=None):
         """
         Hash Table constructor.
-        :param capacity:        initial number of buckets used to store the keys
-        :param load_factor:     load factor based on which hash table is resized
+        :param capacity:            initial number of buckets used to store the keys
+        :param load_factor:         load factor based on which hash table is resized
+        :param incremental:         resize by migrating a few buckets per operation instead of all at once
+        :param migration_step:      number of old buckets migrated per operation in incremental mode
+        :param shrink_threshold:    the table is halved when its load drops below load_factor * shrink_threshold
+        :param min_capacity:        the table is never shrunk below this number of buckets (initial capacity by default)
         """
+        if not 0 <= shrink_threshold < 0.5:
+            raise ValueError("shrink_threshold should be in [0, 0.5) to avoid resize thrashing, "
+                             "got {}".format(shrink_threshold))
         self.buckets = [None for i in range(capacity)]
         self.load_factor = load_factor
         self.size = 0
+        self.shrink_threshold = shrink_threshold
+        self.min_capacity = capacity if min_capacity is None else min_capacity
+        self.grow_count = 0
+        self.shrink_count = 0
+        self.incremental = incremental
+        self.migration_step = migration_step
+        # buckets of the previous version of the table being migrated in incremental mode
+        self.old_buckets = None
+        self.migrated = 0
 
     class Node:
         """ Stores the hash values with corresponding rid numbers (row id in the table). """
@@ -114,8 +301,8 @@ class HashTable:
             h = hash(key)
             return h ^ (h >> 16)
 
-    def index_for(self, h):
-        return h & (len(self.buckets) - 1)
+    def index_for(self, h, buckets=None):
+        return h & (len(self.buckets if buckets is None else buckets) - 1)
 
     def put(self, key, value, transfer=False):
         """
@@ -124,6 +311,9 @@ class HashTable:
         :param value:       value
         :param transfer:    is data being transferred from old version (used in resize())
         """
+        if not transfer and self.old_buckets is not None:
+            self._migrate(self.migration_step)
+
         hash_code = self.hash_code(key)
         index = self.index_for(hash_code)
         node = self._get_node(hash_code)
@@ -142,6 +332,49 @@ class HashTable:
             if self.size >= len(self.buckets) * self.load_factor:
                 self.resize()
 
+    def put_many(self, keys, values):
+        """
+        Puts many key-value pairs, deciding on the growth of the table once for the whole batch.
+        :param keys:    keys of the items
+        :param values:  values
+        """
+        if self.old_buckets is not None:
+            self._migrate(len(self.old_buckets))
+        self.reserve(self.size + len(keys))
+        if self.old_buckets is not None:
+            self._migrate(len(self.old_buckets))
+
+        for key, value in zip(keys, values):
+            self.put(key, value, transfer=True)
+        self.size += len(keys)
+
+    def put_values(self, key, values):
+        """
+        Puts many values of one key, hashing the key and finding its place in the bucket once.
+        :param key:     key of the items
+        :param values:  values
+        """
+        if not values:
+            return
+        if self.old_buckets is not None:
+            self._migrate(len(self.old_buckets))
+        self.reserve(self.size + len(values))
+        if self.old_buckets is not None:
+            self._migrate(len(self.old_buckets))
+
+        hash_code = self.hash_code(key)
+        node = self._get_node(hash_code)
+        # the new nodes are chained together and linked in where put() would link a single one
+        next_node = node.next_node if node is not None else None
+        node_class = self.Node
+        for value in values:
+            next_node = node_class(hash_code, key, value, next_node)
+        if node is not None:
+            node.next_node = next_node
+        else:
+            self.buckets[self.index_for(hash_code)] = next_node
+        self.size += len(values)
+
     def get(self, key):
         """
         Returns a list of nodes matching the hash code of the key.
@@ -149,71 +382,270 @@ class HashTable:
         :return:        a list of nodes
         """
         hash_code = self.hash_code(key)
-        node = self._get_node(hash_code)
+        first_nodes = [self._get_node(hash_code)]
+        if self.old_buckets is not None:
+            # not yet migrated nodes are still in the old version of the table
+            first_nodes.append(self._get_node(hash_code, buckets=self.old_buckets))
 
-        if node is not None:
+        if any(node is not None for node in first_nodes):
             result = []
-            while node is not None and node.hash_code == hash_code:
-                result.append(node)
-                node = node.next_node
+            for node in first_nodes:
+                while node is not None and node.hash_code == hash_code:
+                    result.append(node)
+                    node = node.next_node
             return result
         else:
             return None
 
+    def get_values(self, key):
+        """
+        Returns a list of values of the nodes matching the hash code of the key.
+        :param key:     key
+        :return:        a list of values
+        """
+        nodes = self.get(key)
+        return [node.value for node in nodes] if nodes is not None else None
+
+    def get_values_many(self, keys):
+        """
+        Returns lists of values for many keys, computing the hash codes in one pass.
+        :param keys:    keys
+        :return:        list of results of get_values aligned with the keys
+        """
+        if self.old_buckets is not None:
+            return [self.get_values(key) for key in keys]
+
+        hash_codes = [hash(key) if key is not None else 0 for key in keys]
+        buckets = self.buckets
+        mask = len(buckets) - 1
+        result = []
+        for h in hash_codes:
+            h ^= h >> 16
+            node = buckets[h & mask]
+            while node is not None and node.hash_code != h:
+                node = node.next_node
+            if node is None:
+                result.append(None)
+                continue
+            values = []
+            while node is not None and node.hash_code == h:
+                values.append(node.value)
+                node = node.next_node
+            result.append(values)
+        return result
+
     def remove(self, key, value):
         """
         Removes the node from the Hash Table.
         :param key:     key of the node
         :param value:   value of the node
         """
-        hash_code = self.hash_code(key)
-        index = self.index_for(hash_code)
-        prev_node, node = self._get_node(hash_code, return_prev=True)
+        if self.old_buckets is not None:
+            self._migrate(self.migration_step)
 
-        if node is not None:
-            while node is not None and node.hash_code == hash_code:
-                if node.value == value:
-                    if prev_node is None:
-                        # deletion of first node in the bucket
-                        self.buckets[index] = node.next_node
-                    else:
-                        prev_node.next_node = node.next_node
-                    node = None
-                    self.size -= 1
-                else:
-                    prev_node = node
-                    node = node.next_node
+        hash_code = self.hash_code(key)
+        removed = self._remove_node(hash_code, value, self.buckets)
+        if not removed and self.old_buckets is not None:
+            removed = self._remove_node(hash_code, value, self.old_buckets)
 
         # resize if load of buckets has become low
-        if self.size - 1 < len(self.buckets) * self.load_factor / 2:
+        if removed and self._should_shrink(len(self.buckets)):
             self.resize(factor=0.5)
 
         return
 
+    def remove_many(self, keys, values):
+        """
+        Removes many key-value pairs, deciding on the shrinking of the table once for the whole batch.
+        :param keys:    keys of the nodes
+        :param values:  values of the nodes
+        """
+        if self.old_buckets is not None:
+            self._migrate(len(self.old_buckets))
+
+        for key, value in zip(keys, values):
+            self._remove_node(self.hash_code(key), value, self.buckets)
+
+        capacity = self._shrunk_capacity(len(self.buckets))
+        if capacity < len(self.buckets):
+            self.resize(factor=capacity / len(self.buckets))
+
+    def reserve(self, rows):
+        """
+        Grows the table in advance so that putting the given number of rows does not resize it.
+        :param rows:    expected number of stored key-value pairs
+        """
+        capacity = self.capacity_for(rows)
+        if capacity > len(self.buckets):
+            self.resize(factor=capacity / len(self.buckets))
+
+    def capacity_for(self, rows):
+        """
+        Returns the number of buckets holding the given number of rows without a resize.
+        :param rows:    expected number of stored key-value pairs
+        :return:        number of buckets, at least the current one
+        """
+        capacity = len(self.buckets)
+        while rows >= capacity * self.load_factor:
+            capacity *= 2
+        return capacity
+
+    def split_rows(self, keys, start, capacity, segments):
+        """
+        Hashes the rows of a slice of the table and splits them by segment, done by a worker of a parallel build.
+        Chains of different buckets do not interact, so a segment takes every segments-th bucket:
+        hash codes of int keys are the keys themselves and are not spread over a range of buckets.
+        :param keys:        keys of the slice
+        :param start:       row id of the first row of the slice
+        :param capacity:    number of buckets of the table
+        :param segments:    number of segments
+        :return:            list of (keys, hash codes, row ids) of the rows of every segment
+        """
+        pieces = [([], array('q'), array('q')) for _ in range(segments)]
+        hash_code = self.hash_code
+        mask = capacity - 1
+        for rid, key in enumerate(keys, start):
+            h = hash_code(key)
+            piece_keys, hash_codes, rids = pieces[(h & mask) % segments]
+            piece_keys.append(key)
+            hash_codes.append(h)
+            rids.append(rid)
+        return pieces
+
+    def build_segment(self, pieces, capacity, segment, segments):
+        """
+        Orders the rows of a segment of buckets as they are chained, done by a worker of a parallel build.
+        :param pieces:      (keys, hash codes, row ids) of the rows of the segment from every slice of the table
+        :param capacity:    number of buckets of the table
+        :param segment:     number of the segment
+        :param segments:    number of segments
+        :return:            (buckets, hash codes, keys, row ids) of the rows by bucket, hash code and row id
+        """
+        mask = capacity - 1
+        rows = sorted((h & mask, h, rid, key) for keys, hash_codes, rids in pieces
+                      for key, h, rid in zip(keys, hash_codes, rids))
+        return (array('q', map(itemgetter(0), rows)), array('q', map(itemgetter(1), rows)),
+                list(map(itemgetter(3), rows)), array('q', map(itemgetter(2), rows)))
+
+    def join_segments(self, segments, size):
+        """
+        Replaces the contents of the table by its segments.
+        Nodes are linked from the last one of every bucket, so the nodes of a hash code stay together.
+        :param segments:    results of build_segment() in the order of the segments
+        :param size:        number of rows of all segments
+        """
+        self.buckets = buckets = [None] * self.capacity_for(size)
+        self.old_buckets = None
+        node_class = self.Node
+        for slots, hash_codes, keys, rids in segments:
+            for slot, h, key, rid in zip(reversed(slots), reversed(hash_codes), reversed(keys), reversed(rids)):
+                buckets[slot] = node_class(h, key, rid, buckets[slot])
+        self.size = size
+
     def resize(self, factor=2.0):
         """
         Doubles the capacity of the the hash table.
+        In incremental mode only starts the migration of nodes to the new buckets.
 
         :param factor:  len(new_buckets) = len(old_buckets) * factor
         """
+        if self.old_buckets is not None:
+            # finishing the previous migration before starting a new one
+            self._migrate(len(self.old_buckets))
+
+        if factor > 1:
+            self.grow_count += 1
+        else:
+            self.shrink_count += 1
+
         old_buckets = self.buckets
         self.buckets = [None for i in range(int(len(self.buckets) * factor))]
 
-        for node in old_buckets:
-            if node is not None:
-                while node is not None:
-                    self.put(node.key, node.value, transfer=True)
-                    node = node.next_node
+        if self.incremental:
+            self.old_buckets = old_buckets
+            self.migrated = 0
+            self._migrate(self.migration_step)
+        else:
+            for node in old_buckets:
+                if node is not None:
+                    while node is not None:
+                        self.put(node.key, node.value, transfer=True)
+                        node = node.next_node
+
+    def _should_shrink(self, capacity):
+        """
+        Checks whether the table with the capacity is loaded low enough to be halved.
+        Halving keeps the load at most half of the growth threshold, so alternating puts and removes do not resize.
+        :param capacity:    current number of buckets
+        :return:            True if the table should be halved
+        """
+        return capacity // 2 >= self.min_capacity and self.size < capacity * self.load_factor * self.shrink_threshold
+
+    def _shrunk_capacity(self, capacity):
+        """
+        Returns the capacity after halving the table as long as it is loaded low enough.
+        :param capacity:    current capacity
+        :return:            new capacity
+        """
+        while self._should_shrink(capacity):
+            capacity //= 2
+        return capacity
 
-    def _get_node(self, hash_code, return_prev=False):
+    def _migrate(self, count):
+        """
+        Moves the nodes of the next count old buckets to the current buckets.
+        :param count:   number of old buckets to migrate
+        """
+        old_buckets = self.old_buckets
+        end = min(self.migrated + count, len(old_buckets))
+        for index in range(self.migrated, end):
+            node = old_buckets[index]
+            old_buckets[index] = None
+            while node is not None:
+                self.put(node.key, node.value, transfer=True)
+                node = node.next_node
+        self.migrated = end
+
+        if self.migrated == len(old_buckets):
+            self.old_buckets = None
+
+    def _remove_node(self, hash_code, value, buckets):
+        """
+        Removes the node with the hash_code and value from the given buckets.
+        :param hash_code:   hash_code value
+        :param value:       value of the node
+        :param buckets:     buckets of the current or the old version of the table
+        :return:            True if the node was found and removed
+        """
+        index = self.index_for(hash_code, buckets)
+        prev_node, node = self._get_node(hash_code, return_prev=True, buckets=buckets) or (None, None)
+
+        while node is not None and node.hash_code == hash_code:
+            if node.value == value:
+                if prev_node is None:
+                    # deletion of first node in the bucket
+                    buckets[index] = node.next_node
+                else:
+                    prev_node.next_node = node.next_node
+                self.size -= 1
+                return True
+            prev_node = node
+            node = node.next_node
+        return False
+
+    def _get_node(self, hash_code, return_prev=False, buckets=None):
         """
         Returns the first node in the hash table matching the hash_code
         :param hash_code:       hash_code value
         :param return_prev:     set True if you want to get the previous node
+        :param buckets:         buckets to search in, the current ones by default
         :return:                the node matching the hash_code, or the previous one in the bucket
         """
+        if buckets is None:
+            buckets = self.buckets
+
         # first node in the corresponding bucket
-        node = self.buckets[self.index_for(hash_code)]
+        node = buckets[self.index_for(hash_code, buckets)]
 
         if node is not None:
             prev_node = None
@@ -239,6 +671,335 @@ class HashTable:
                     result += " [{}]({})({}) ".format(node.key, node.hash_code, node.value)
                     node = node.next_node
             result += "\n"
+        if self.old_buckets is not None:
+            result += "Migrating {} of {} old buckets\n".format(len(self.old_buckets) - self.migrated,
+                                                                len(self.old_buckets))
+        return result
+
+
+class OpenAddressingHashTable:
+    """
+    Hash Table with linear probing over flat parallel arrays of hash codes, keys and values.
+    Values are non-negative integers (row ids), -1 marks an empty slot.
+    Hash codes are scrambled by a Fibonacci multiply, since linear probing packs consecutive hashes,
+    e.g. of sequential int keys, into a single cluster walked by every look-up.
+    """
+
+    EMPTY = -1
+    # 2^64 / golden ratio, odd, so the multiply is a bijection of 64-bit hash codes
+    FIBONACCI = 0x9E3779B97F4A7C15
+
+    def __init__(self, capacity=16, load_factor=0.5, shrink_threshold=0.25, min_capacity=None):
+        """
+        Hash Table constructor.
+        :param capacity:            initial number of slots, a power of two
+        :param load_factor:         load factor based on which hash table is resized
+        :param shrink_threshold:    the table is halved when its load drops below load_factor * shrink_threshold
+        :param min_capacity:        the table is never shrunk below this number of slots (initial capacity by default)
+        """
+        if not 0 < load_factor < 1:
+            raise ValueError("load_factor should be in (0, 1) to keep an empty slot ending every probe, "
+                             "got {}".format(load_factor))
+        if not 0 <= shrink_threshold < 0.5:
+            raise ValueError("shrink_threshold should be in [0, 0.5) to avoid resize thrashing, "
+                             "got {}".format(shrink_threshold))
+        self.hashes = array('q', [0]) * capacity
+        self.keys = [None] * capacity
+        self.values = array('q', [self.EMPTY]) * capacity
+        self.load_factor = load_factor
+        self.size = 0
+        self.shrink_threshold = shrink_threshold
+        self.min_capacity = capacity if min_capacity is None else min_capacity
+        self.grow_count = 0
+        self.shrink_count = 0
+
+    _should_shrink = HashTable._should_shrink
+    _shrunk_capacity = HashTable._shrunk_capacity
+
+    def hash_code(self, key):
+        """
+        Returns a hash code for a given key, its low bits mixed from all bits of hash(key).
+        :param key:     str on int value
+        :return:        non-negative hash code fitting the int64 array of hash codes
+        """
+        h = (hash(key) * self.FIBONACCI if key is not None else 0) & 0x7FFFFFFFFFFFFFFF
+        return h ^ (h >> 32)
+
+    def put(self, key, value):
+        """
+        Puts a new key-value pair to hash table.
+        :param key:         key of the item
+        :param value:       value
+        """
+        if self.size + 1 > len(self.values) * self.load_factor:
+            self.resize()
+        self._put(self.hash_code(key), key, value)
+        self.size += 1
+
+    def put_many(self, keys, values):
+        """
+        Puts many key-value pairs, deciding on the growth of the table once for the whole batch.
+        :param keys:    keys of the items
+        :param values:  values
+        """
+        self.reserve(self.size + len(keys))
+        hash_code = self.hash_code
+        for key, value in zip(keys, values):
+            self._put(hash_code(key), key, value)
+        self.size += len(keys)
+
+    def put_values(self, key, values):
+        """
+        Puts many values of one key, hashing the key once.
+        :param key:     key of the items
+        :param values:  values
+        """
+        self.reserve(self.size + len(values))
+        hash_code = self.hash_code(key)
+        for value in values:
+            self._put(hash_code, key, value)
+        self.size += len(values)
+
+    def get_values(self, key):
+        """
+        Returns a list of values stored with the key.
+        :param key:     key
+        :return:        a list of values
+        """
+        hash_code = self.hash_code(key)
+        hashes, keys, values = self.hashes, self.keys, self.values
+        mask = len(values) - 1
+        index = hash_code & mask
+
+        result = []
+        empty = self.EMPTY
+        value = values[index]
+        while value != empty:
+            if hashes[index] == hash_code and keys[index] == key:
+                result.append(value)
+            index = (index + 1) & mask
+            value = values[index]
+        return result if result else None
+
+    def get_values_many(self, keys):
+        """
+        Returns lists of values for many keys, computing the hash codes in one pass.
+        :param keys:    keys
+        :return:        list of results of get_values aligned with the keys
+        """
+        hash_codes = list(map(self.hash_code, keys))
+        hashes, stored_keys, values = self.hashes, self.keys, self.values
+        mask = len(values) - 1
+        empty = self.EMPTY
+        result = []
+        for key, h in zip(keys, hash_codes):
+            index = h & mask
+            found = []
+            value = values[index]
+            while value != empty:
+                if hashes[index] == h and stored_keys[index] == key:
+                    found.append(value)
+                index = (index + 1) & mask
+                value = values[index]
+            result.append(found if found else None)
+        return result
+
+    def remove(self, key, value):
+        """
+        Removes the key-value pair from the Hash Table.
+        :param key:     key of the pair
+        :param value:   value of the pair
+        """
+        # resize if load of slots has become low
+        if self._remove(self.hash_code(key), key, value) and self._should_shrink(len(self.values)):
+            self.resize(factor=0.5)
+
+    def remove_many(self, keys, values):
+        """
+        Removes many key-value pairs, deciding on the shrinking of the table once for the whole batch.
+        :param keys:    keys of the pairs
+        :param values:  values of the pairs
+        """
+        for key, value in zip(keys, values):
+            self._remove(self.hash_code(key), key, value)
+
+        capacity = self._shrunk_capacity(len(self.values))
+        if capacity < len(self.values):
+            self.resize(factor=capacity / len(self.values))
+
+    def _remove(self, hash_code, key, value):
+        """
+        Removes the pair from its slot closing the gap by backward shift.
+        :param hash_code:   hash code of the key
+        :param key:         key of the pair
+        :param value:       value of the pair
+        :return:            True if the pair was found and removed
+        """
+        hashes, keys, values = self.hashes, self.keys, self.values
+        mask = len(values) - 1
+        index = hash_code & mask
+
+        while values[index] != self.EMPTY:
+            if values[index] == value and hashes[index] == hash_code and keys[index] == key:
+                break
+            index = (index + 1) & mask
+        else:
+            return False
+
+        # backward shift deletion: moving the following slots of the cluster closer to their homes
+        hole = index
+        while True:
+            index = (index + 1) & mask
+            if values[index] == self.EMPTY:
+                break
+            home = hashes[index] & mask
+            if (hole - home) & mask < (index - home) & mask:
+                hashes[hole] = hashes[index]
+                keys[hole] = keys[index]
+                values[hole] = values[index]
+                hole = index
+        keys[hole] = None
+        values[hole] = self.EMPTY
+        self.size -= 1
+        return True
+
+    def reserve(self, rows):
+        """
+        Grows the table in advance so that putting the given number of rows does not resize it.
+        :param rows:    expected number of stored key-value pairs
+        """
+        capacity = self.capacity_for(rows)
+        if capacity > len(self.values):
+            self.resize(factor=capacity / len(self.values))
+
+    def capacity_for(self, rows):
+        """
+        Returns the number of slots holding the given number of rows without a resize.
+        :param rows:    expected number of stored key-value pairs
+        :return:        number of slots, at least the current one
+        """
+        capacity = len(self.values)
+        while rows > capacity * self.load_factor:
+            capacity *= 2
+        return capacity
+
+    def split_rows(self, keys, start, capacity, segments):
+        """
+        Hashes the rows of a slice of the table and splits them by segment, done by a worker of a parallel build.
+        Probes run on into the next slots, so a segment is a consecutive range of slots.
+        :param keys:        keys of the slice
+        :param start:       row id of the first row of the slice
+        :param capacity:    number of slots of the table
+        :param segments:    number of segments
+        :return:            list of (keys, hash codes, row ids) of the rows with home slots in every segment
+        """
+        pieces = [([], array('q'), array('q')) for _ in range(segments)]
+        hash_code = self.hash_code
+        mask = capacity - 1
+        for rid, key in enumerate(keys, start):
+            h = hash_code(key)
+            piece_keys, hash_codes, rids = pieces[(h & mask) * segments // capacity]
+            piece_keys.append(key)
+            hash_codes.append(h)
+            rids.append(rid)
+        return pieces
+
+    def build_segment(self, pieces, capacity, segment, segments):
+        """
+        Fills a range of slots of the table, done by a worker of a parallel build.
+        :param pieces:      (keys, hash codes, row ids) of the rows with home slots in the range from every slice
+        :param capacity:    number of slots of the table
+        :param segment:     number of the segment, made of the slots s with s * segments // capacity == segment
+        :param segments:    number of segments
+        :return:            hash codes, keys and values of the slots of the range,
+                            and (hash code, key, value) of the rows probing past its end
+        """
+        lo, hi = -(-capacity * segment // segments), -(-capacity * (segment + 1) // segments)
+        size = hi - lo
+        hashes = array('q', [0]) * size
+        keys = [None] * size
+        values = array('q', [self.EMPTY]) * size
+        overflow = []
+        mask = capacity - 1
+        for piece_keys, hash_codes, rids in pieces:
+            for key, h, rid in zip(piece_keys, hash_codes, rids):
+                index = (h & mask) - lo
+                while index < size and values[index] != self.EMPTY:
+                    index += 1
+                if index == size:
+                    overflow.append((h, key, rid))
+                else:
+                    hashes[index] = h
+                    keys[index] = key
+                    values[index] = rid
+        return hashes, keys, values, overflow
+
+    def join_segments(self, segments, size):
+        """
+        Replaces the contents of the table by the segments of consecutive ranges of slots.
+        Rows probing past the end of their segment take the first empty slots after it, as put() would place them.
+        :param segments:    results of build_segment() in the order of the ranges
+        :param size:        number of rows of all segments
+        """
+        self.hashes = array('q')
+        self.keys = []
+        self.values = array('q')
+        for hashes, keys, values, _ in segments:
+            self.hashes.extend(hashes)
+            self.keys.extend(keys)
+            self.values.extend(values)
+        for _, _, _, overflow in segments:
+            for h, key, value in overflow:
+                self._put(h, key, value)
+        self.size = size
+
+    def resize(self, factor=2.0):
+        """
+        Changes the number of slots of the hash table reusing the stored hash codes.
+        :param factor:  len(new_values) = len(old_values) * factor
+        """
+        if factor > 1:
+            self.grow_count += 1
+        else:
+            self.shrink_count += 1
+
+        hashes, keys, values = self.hashes, self.keys, self.values
+        capacity = int(len(values) * factor)
+        self.hashes = array('q', [0]) * capacity
+        self.keys = [None] * capacity
+        self.values = array('q', [self.EMPTY]) * capacity
+
+        for index in range(len(values)):
+            if values[index] != self.EMPTY:
+                self._put(hashes[index], keys[index], values[index])
+
+    def _put(self, hash_code, key, value):
+        """
+        Stores the pair in the first empty slot starting from the home slot of the hash code.
+        :param hash_code:   hash code of the key
+        :param key:         key of the item
+        :param value:       value
+        """
+        values = self.values
+        mask = len(values) - 1
+        index = hash_code & mask
+        while values[index] != self.EMPTY:
+            index = (index + 1) & mask
+        self.hashes[index] = hash_code
+        self.keys[index] = key
+        values[index] = value
+
+    def __str__(self):
+        """
+        Returns a string representation of the Hash Table
+        :return:    str value
+        """
+        result = ""
+        for i in range(len(self.values)):
+            result += "Slot {:2d}: ".format(i)
+            if self.values[i] != self.EMPTY:
+                result += " [{}]({})({}) ".format(self.keys[i], self.hashes[i], self.values[i])
+            result += "\n"
         return result
 
 
@@ -1,23 +1,117 @@
+import sys
+from array import array
+from itertools import compress, repeat
+from operator import eq
+from tables.columnar import key_column, append_key, set_key, shares_keys
+from indexes.storage import MappedIndex, group_rows, live_rows, read_index, write_index
+
+
 class NaiveIndex:
-    """ Naive Index based on sequential search """
+    """
+    Naive Index based on sequential search.
+    The vectorized mode compares the key column in bulk at the C level with index() of the column
+    and keeps the deleted rows in a bytearray mask, like a real sequential scan.
+    """
+
+    def __init__(self, table, vectorized=False):
+        self.keys = key_column(table)
+        self.keys_shared = shares_keys(table)
+        self.vectorized = vectorized
+        self.is_deleted = bytearray(len(self.keys))
+        self.deleted_count = 0
+
+    @classmethod
+    def from_batches(cls, batches, vectorized=False):
+        index = cls([], vectorized)
+        for batch in batches:
+            index.keys.extend(item.key() for item in batch)
+            index.is_deleted.extend(bytes(len(batch)))
+        return index
+
+    def save(self, path):
+        rids = [rid for rid, deleted in enumerate(self.is_deleted) if not deleted]
+        write_index(path, self.keys[:len(self.is_deleted)], group_rows(self.keys, rids))
 
-    def __init__(self, table):
-        self.keys = [item.key() for item in table]
-        self.is_deleted = [False for i in range(len(table))]
+    @classmethod
+    def load(cls, path, mapped=False, vectorized=False):
+        if mapped:
+            return MappedIndex(path)
+        keys, postings = read_index(path)
+        index = cls([], vectorized)
+        index.keys = keys
+        index.is_deleted = bytearray(not live for live in live_rows(postings, len(keys)))
+        index.deleted_count = index.is_deleted.count(1)
+        return index
 
     def look_up(self, key):
+        if self.vectorized:
+            return self._live(self._scan(key))
         result = []
-        for rid, k in enumerate(self.keys):
+        # rows appended to a shared column but not yet to this index are not scanned
+        for rid, k in zip(range(len(self.is_deleted)), self.keys):
             if not self.is_deleted[rid] and k == key:
                 result.append(rid)
         return result
 
+    def look_up_many(self, keys):
+        """ Answers all keys in a single scan of the table, returns a list of results aligned with the keys """
+        found = {key: [] for key in keys}
+        if self.vectorized:
+            # the membership test runs at the C level, only the matching rows reach the loop
+            matches = self._live(compress(range(len(self.is_deleted)), map(found.__contains__, self.keys)))
+            for rid in matches:
+                found[self.keys[rid]].append(rid)
+        else:
+            for rid, k in zip(range(len(self.is_deleted)), self.keys):
+                rids = found.get(k)
+                if rids is not None and not self.is_deleted[rid]:
+                    rids.append(rid)
+        return [list(found[key]) for key in keys]
+
     def insert(self, key):
-        self.keys.append(key)
-        self.is_deleted.append(False)
+        append_key(self.keys, len(self.is_deleted), key)
+        self.is_deleted.append(0)
+
+    def insert_many(self, keys):
+        for key in keys:
+            self.insert(key)
 
     def update(self, rid, key):
-        self.keys[rid] = key
+        set_key(self, rid, key)
 
     def delete(self, rid):
-        self.is_deleted[rid] = True
+        if not self.is_deleted[rid]:
+            self.is_deleted[rid] = 1
+            self.deleted_count += 1
+
+    def delete_many(self, rids):
+        for rid in rids:
+            self.delete(rid)
+
+    def _scan(self, key):
+        """
+        Finds all rows with the key, deleted ones included, resuming index() of the key column after every match.
+        Rows appended to a shared column by other indexes but not yet to this one are not scanned.
+        :param key:     interest of search
+        :return:        list of row ids
+        """
+        keys = self.keys
+        stop = len(self.is_deleted)
+        if isinstance(keys, array) and sys.version_info < (3, 10):
+            # index() of an array takes no bounds before Python 3.10
+            return list(compress(range(stop), map(eq, keys, repeat(key))))
+        rids = []
+        rid = -1
+        try:
+            while True:
+                rid = keys.index(key, rid + 1, stop)
+                rids.append(rid)
+        except ValueError:
+            return rids
+
+    def _live(self, rids):
+        """ Drops the deleted rows from the matching ones, returns a list of row ids """
+        if self.deleted_count:
+            is_deleted = self.is_deleted
+            return [rid for rid in rids if not is_deleted[rid]]
+        return list(rids)
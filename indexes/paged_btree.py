@@ -0,0 +1,544 @@
+import struct
+import tempfile
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from tables.columnar import key_column, append_key, set_key, shares_keys
+
+MAGIC = b'DBPT'
+LEAF = 1
+INTERNAL = 2
+INT_TAG = 0
+STR_TAG = 1
+NO_PAGE = -1
+
+# magic, page size, number of pages, root page, height
+_META = struct.Struct('<4sqqqq')
+# kind, number of entries, next leaf of a leaf or the first child of an internal node
+_PAGE_HEADER = struct.Struct('<BHq')
+_INT64 = struct.Struct('<q')
+_UINT16 = struct.Struct('<H')
+
+
+class PagedBTree:
+    """
+    Implements disk-resident B+Tree index: nodes are fixed-size pages of a file accessed through a buffer pool,
+    so only the pages in the pool are kept in memory.
+    Entries are (key, row id) pairs, which makes every entry unique and keeps pages free of posting lists.
+    """
+
+    def __init__(self, table, path=None, page_size=4096, pool_pages=256, fill_factor=1.0):
+        """
+        Paged B+Tree constructor.
+        :param table:           table with items (rows) upon which index is built
+        :param path:            path to the file of the tree, an anonymous temporary file if None
+        :param page_size:       size of a page in bytes
+        :param pool_pages:      maximum number of pages kept in memory by the buffer pool
+        :param fill_factor:     fraction of a page filled by the bulk load
+        """
+        self.page_size = page_size
+        self.fill_factor = fill_factor
+        self.keys = key_column(table)
+        self.keys_shared = shares_keys(table)
+        self.row_count = len(self.keys)
+        file = open(path, 'w+b') if path is not None else tempfile.TemporaryFile()
+        self.pool = BufferPool(file, page_size, pool_pages, _decode, _encode)
+        self.build_index(table)
+
+    @classmethod
+    def open(cls, path, table, pool_pages=256):
+        """
+        Opens a tree saved into the file by flush() or close().
+        :param path:        path to the file of the tree
+        :param table:       table with items (rows) upon which the tree was built
+        :param pool_pages:  maximum number of pages kept in memory by the buffer pool
+        :return:            Paged B+Tree
+        """
+        file = open(path, 'r+b')
+        magic, page_size, page_count, root, height = _META.unpack(file.read(_META.size))
+        if magic != MAGIC:
+            file.close()
+            raise ValueError("{} is not a paged B+Tree file".format(path))
+        index = cls.__new__(cls)
+        index.page_size = page_size
+        index.fill_factor = 1.0
+        index.keys = key_column(table)
+        index.keys_shared = shares_keys(table)
+        index.row_count = len(index.keys)
+        index.pool = BufferPool(file, page_size, pool_pages, _decode, _encode)
+        index.pool.page_count = page_count
+        index.root = root
+        index.height = height
+        return index
+
+    def build_index(self, table):
+        """
+        Bulk loads the tree bottom-up writing the pages in the key order.
+        :param table:   table with items (rows)
+        """
+        pool = self.pool
+        capacity = _PAGE_HEADER.size + int((self.page_size - _PAGE_HEADER.size) * self.fill_factor)
+        items = sorted(zip(self.keys, range(self.row_count)))
+
+        # every level is described by the pages of its nodes and the smallest item of each of them
+        pages, low_items = [], []
+        leaf, previous = PagedNode(True), None
+        for item in items:
+            size = self._entry_size(item[0])
+            if leaf.keys and leaf.size + size > capacity:
+                pages.append(pool.allocate(leaf))
+                low_items.append(leaf.keys[0])
+                if previous is not None:
+                    previous.next_leaf = pages[-1]
+                    pool.unpin(pages[-2], dirty=True)
+                leaf, previous = PagedNode(True), leaf
+            leaf.keys.append(item)
+            leaf.size += size
+        pages.append(pool.allocate(leaf))
+        low_items.append(leaf.keys[0] if leaf.keys else None)
+        if previous is not None:
+            previous.next_leaf = pages[-1]
+            pool.unpin(pages[-2], dirty=True)
+        pool.unpin(pages[-1], dirty=True)
+
+        self.height = 0
+        while len(pages) > 1:
+            parent_pages, parent_low_items = [], []
+            node = None
+            for page, low_item in zip(pages, low_items):
+                size = _item_size(low_item[0]) + _INT64.size
+                if node is not None and node.size + size > capacity:
+                    parent_pages.append(pool.allocate(node))
+                    pool.unpin(parent_pages[-1], dirty=True)
+                    node = None
+                if node is None:
+                    node = PagedNode(False)
+                    node.children.append(page)
+                    parent_low_items.append(low_item)
+                else:
+                    node.keys.append(low_item)
+                    node.children.append(page)
+                    node.size += size
+            parent_pages.append(pool.allocate(node))
+            pool.unpin(parent_pages[-1], dirty=True)
+            pages, low_items = parent_pages, parent_low_items
+            self.height += 1
+        self.root = pages[0]
+
+    def look_up(self, key):
+        """
+        Returns a list of row ids in the table matching the key
+        :param key:     interest of search
+        :return:        list of row ids matching items
+        """
+        rids = list(self.range(key, key))
+        return rids if rids else None
+
+    def look_up_many(self, keys):
+        """
+        Returns lists of row ids for many keys at once.
+        :param keys:    keys of interest
+        :return:        list of results of look_up aligned with the keys
+        """
+        return [self.look_up(key) for key in keys]
+
+    def range(self, lo=None, hi=None, inclusive=True):
+        """
+        Yields row ids of the items with keys between lo and hi in the key order.
+        :param lo:          lower bound of the keys, None for no bound
+        :param hi:          upper bound of the keys, None for no bound
+        :param inclusive:   whether the bounds are included, a bool or a pair of bools for (lo, hi)
+        :return:            generator of row ids
+        """
+        lo_inclusive, hi_inclusive = inclusive if isinstance(inclusive, tuple) else (inclusive, inclusive)
+        # row ids are non-negative, so (lo, -1) precedes and (lo, inf) follows all items with the key lo
+        start = None if lo is None else (lo, NO_PAGE) if lo_inclusive else (lo, float('inf'))
+        page = self._find_leaf(start)
+        while page != NO_PAGE:
+            leaf = self.pool.fetch(page)
+            index = bisect_left(leaf.keys, start) if start is not None else 0
+            rids = []
+            done = False
+            for key, rid in leaf.keys[index:]:
+                if hi is not None and (key > hi or (key == hi and not hi_inclusive)):
+                    done = True
+                    break
+                rids.append(rid)
+            page = leaf.next_leaf
+            # the page is released before yielding, so a paused scan does not hold the pool
+            self.pool.unpin(leaf.page)
+            yield from rids
+            if done:
+                return
+            start = None
+
+    def insert(self, *keys):
+        """
+        Inserts information about new items in the table to the index.
+        :param keys:     key of inserted item
+        """
+        self.insert_many(keys)
+
+    def insert_many(self, keys):
+        """
+        Inserts information about a batch of new items in the key order, so consecutive items hit the same pages.
+        :param keys:    keys of inserted items
+        """
+        start = self.row_count
+        for key in keys:
+            append_key(self.keys, self.row_count, key)
+            self.row_count += 1
+        for item in sorted(zip(self.keys[start:self.row_count], range(start, self.row_count))):
+            self._insert(item)
+
+    def update(self, rid, key):
+        """
+        Updates values of item at rid in the table and the index.
+        :param rid:     row id
+        :param key:     key of the item to be updated
+        """
+        old_key = self.keys[rid]
+        if old_key != key:
+            self._remove((old_key, rid))
+            set_key(self, rid, key)
+            self._insert((key, rid))
+
+    def delete(self, rid):
+        """
+        Deletes the item information from the index.
+        Pages are not merged, emptied leaves are skipped by the scans.
+        :param rid:     row id
+        """
+        self._remove((self.keys[rid], rid))
+
+    def delete_many(self, rids):
+        """
+        Deletes the information about a batch of items in the key order, so consecutive items hit the same pages.
+        :param rids:    row ids
+        """
+        for item in sorted((self.keys[rid], rid) for rid in rids):
+            self._remove(item)
+
+    def flush(self):
+        """ Writes the dirty pages and the meta page to the file """
+        self.pool.flush()
+        self.pool.write_meta(_META.pack(MAGIC, self.page_size, self.pool.page_count, self.root, self.height))
+
+    def close(self):
+        """ Flushes the tree and closes the file """
+        self.flush()
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _find_leaf(self, item, path=None):
+        """
+        Returns the page of the leaf which may contain the item.
+        :param item:    (key, row id) pair, None for the leftmost leaf
+        :param path:    list collecting the pages of the internal nodes on the way
+        :return:        page number
+        """
+        page = self.root
+        node = self.pool.fetch(page)
+        while not node.leaf:
+            if path is not None:
+                path.append(page)
+            child = node.children[bisect_right(node.keys, item) if item is not None else 0]
+            self.pool.unpin(page)
+            page = child
+            node = self.pool.fetch(page)
+        self.pool.unpin(page)
+        return page
+
+    def _insert(self, item):
+        """
+        Inserts the item into the leaf level, splitting the overflown pages.
+        :param item:    (key, row id) pair
+        """
+        size = self._entry_size(item[0])
+        path = []
+        page = self._find_leaf(item, path)
+        node = self.pool.fetch(page)
+        node.keys.insert(bisect_left(node.keys, item), item)
+        node.size += size
+
+        while node.size > self.page_size:
+            separator, right_page = self._split(node)
+            self.pool.unpin(page, dirty=True)
+            if not path:
+                root = PagedNode(False)
+                root.keys.append(separator)
+                root.children.extend((page, right_page))
+                root.size += _item_size(separator[0]) + _INT64.size
+                self.root = self.pool.allocate(root)
+                self.pool.unpin(self.root, dirty=True)
+                self.height += 1
+                return
+            page = path.pop()
+            node = self.pool.fetch(page)
+            index = bisect_right(node.keys, separator)
+            node.keys.insert(index, separator)
+            node.children.insert(index + 1, right_page)
+            node.size += _item_size(separator[0]) + _INT64.size
+        self.pool.unpin(page, dirty=True)
+
+    def _entry_size(self, key):
+        """
+        Returns the size of a leaf entry with the key, checking that a page holds at least four of them.
+        :param key:     int or str key
+        :return:        number of bytes
+        """
+        size = _item_size(key)
+        if size + _INT64.size > (self.page_size - _PAGE_HEADER.size) // 4:
+            raise ValueError("Key of {} bytes is too long for pages of {} bytes".format(size, self.page_size))
+        return size
+
+    def _split(self, node):
+        """
+        Moves the right half of the node into a new page.
+        :param node:    overflown node
+        :return:        separator (smallest item under the right half) and the page of the right half
+        """
+        middle = len(node.keys) // 2
+        right = PagedNode(node.leaf)
+        if node.leaf:
+            separator = node.keys[middle]
+            right.keys = node.keys[middle:]
+            del node.keys[middle:]
+            right.next_leaf = node.next_leaf
+        else:
+            separator = node.keys[middle]
+            right.keys = node.keys[middle + 1:]
+            right.children = node.children[middle + 1:]
+            del node.keys[middle:]
+            del node.children[middle + 1:]
+        node.size = _node_size(node)
+        right.size = _node_size(right)
+        right_page = self.pool.allocate(right)
+        self.pool.unpin(right_page, dirty=True)
+        if node.leaf:
+            node.next_leaf = right_page
+        return separator, right_page
+
+    def _remove(self, item):
+        """
+        Removes the item from the leaf level.
+        :param item:    (key, row id) pair
+        """
+        page = self._find_leaf(item)
+        node = self.pool.fetch(page)
+        index = bisect_left(node.keys, item)
+        if index < len(node.keys) and node.keys[index] == item:
+            del node.keys[index]
+            node.size -= _item_size(item[0])
+            self.pool.unpin(page, dirty=True)
+        else:
+            self.pool.unpin(page)
+
+
+class PagedNode:
+    """ Node of the Paged B+Tree decoded from its page """
+
+    def __init__(self, leaf):
+        self.leaf = leaf
+        self.keys = []
+        self.children = []
+        self.next_leaf = NO_PAGE
+        self.page = NO_PAGE
+        # size of the encoded node in bytes
+        self.size = _PAGE_HEADER.size
+
+
+class BufferPool:
+    """
+    Caches decoded pages of a file in a fixed number of frames with the LRU replacement.
+    Pages in use are pinned and are never evicted, modified pages are written back on eviction or flush.
+    """
+
+    def __init__(self, file, page_size, capacity, decode, encode):
+        """
+        Buffer pool constructor.
+        :param file:        binary file opened for reading and writing
+        :param page_size:   size of a page in bytes
+        :param capacity:    maximum number of pages kept in memory
+        :param decode:      function creating a page object from the bytes of the page
+        :param encode:      function returning the bytes of a page object
+        """
+        self.file = file
+        self.page_size = page_size
+        self.capacity = capacity
+        self.decode = decode
+        self.encode = encode
+        # page 0 is reserved for the meta page of the file owner
+        self.page_count = 1
+        # page number -> [page object, pin count, dirty], in the order of use
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def fetch(self, page):
+        """
+        Returns the page object pinning it, reads the page from the file on a miss.
+        :param page:    page number
+        :return:        page object
+        """
+        frame = self.frames.get(page)
+        if frame is not None:
+            self.hits += 1
+            self.frames.move_to_end(page)
+        else:
+            self.misses += 1
+            self._evict()
+            self.file.seek(page * self.page_size)
+            node = self.decode(self.file.read(self.page_size))
+            node.page = page
+            frame = self.frames[page] = [node, 0, False]
+        frame[1] += 1
+        return frame[0]
+
+    def unpin(self, page, dirty=False):
+        """
+        Releases the page fetched or allocated before.
+        :param page:    page number
+        :param dirty:   whether the page object was modified
+        """
+        frame = self.frames[page]
+        frame[1] -= 1
+        frame[2] = frame[2] or dirty
+
+    def allocate(self, node):
+        """
+        Adds a new page at the end of the file holding the page object, the page is returned pinned.
+        :param node:    page object
+        :return:        page number
+        """
+        self._evict()
+        page = self.page_count
+        self.page_count += 1
+        node.page = page
+        self.frames[page] = [node, 1, True]
+        return page
+
+    def flush(self):
+        """ Writes all dirty pages to the file """
+        for page, frame in self.frames.items():
+            if frame[2]:
+                self._write(page, frame[0])
+                frame[2] = False
+        self.file.flush()
+
+    def write_meta(self, data):
+        """
+        Writes the meta page of the file owner.
+        :param data:    bytes not longer than a page
+        """
+        self.file.seek(0)
+        self.file.write(data.ljust(self.page_size, b'\x00'))
+        self.file.flush()
+
+    def close(self):
+        """ Closes the file, dirty pages are expected to be flushed """
+        self.frames.clear()
+        self.file.close()
+
+    def _evict(self):
+        """ Frees a frame for a new page if the pool is full, writing back the evicted page if it is dirty """
+        if len(self.frames) < self.capacity:
+            return
+        for page, frame in self.frames.items():
+            if frame[1] == 0:
+                if frame[2]:
+                    self._write(page, frame[0])
+                del self.frames[page]
+                return
+        raise RuntimeError("All {} pages of the buffer pool are pinned".format(self.capacity))
+
+    def _write(self, page, node):
+        """ Writes the page object into its page of the file """
+        self.writes += 1
+        self.file.seek(page * self.page_size)
+        self.file.write(self.encode(node, self.page_size))
+
+
+def _item_size(key):
+    """
+    Returns the size of an encoded leaf entry with the key, internal entries take 8 more bytes for the child.
+    :param key:     int or str key
+    :return:        number of bytes
+    """
+    if type(key) is int:
+        return 1 + 8 + 8
+    if type(key) is str:
+        return 1 + 2 + len(key.encode('utf-8')) + 8
+    raise TypeError("Paged B+Tree supports int and str keys only, got {!r}".format(key))
+
+
+def _node_size(node):
+    """ Returns the size of the encoded node """
+    size = _PAGE_HEADER.size + sum(_item_size(key) for key, _ in node.keys)
+    return size if node.leaf else size + _INT64.size * len(node.keys)
+
+
+def _encode(node, page_size):
+    """
+    Encodes the node into a page.
+    :param node:        node
+    :param page_size:   size of a page in bytes
+    :return:            bytearray of the page size
+    """
+    data = bytearray(page_size)
+    link = node.next_leaf if node.leaf else node.children[0]
+    _PAGE_HEADER.pack_into(data, 0, LEAF if node.leaf else INTERNAL, len(node.keys), link)
+    position = _PAGE_HEADER.size
+    for i, (key, rid) in enumerate(node.keys):
+        if type(key) is int:
+            data[position] = INT_TAG
+            _INT64.pack_into(data, position + 1, key)
+            position += 9
+        else:
+            encoded = key.encode('utf-8')
+            data[position] = STR_TAG
+            _UINT16.pack_into(data, position + 1, len(encoded))
+            data[position + 3:position + 3 + len(encoded)] = encoded
+            position += 3 + len(encoded)
+        _INT64.pack_into(data, position, rid)
+        position += 8
+        if not node.leaf:
+            _INT64.pack_into(data, position, node.children[i + 1])
+            position += 8
+    return data
+
+
+def _decode(data):
+    """
+    Decodes the node from a page.
+    :param data:    bytes of the page
+    :return:        node
+    """
+    kind, count, link = _PAGE_HEADER.unpack_from(data, 0)
+    node = PagedNode(kind == LEAF)
+    if node.leaf:
+        node.next_leaf = link
+    else:
+        node.children.append(link)
+    position = _PAGE_HEADER.size
+    for _ in range(count):
+        if data[position] == INT_TAG:
+            key = _INT64.unpack_from(data, position + 1)[0]
+            position += 9
+        else:
+            length = _UINT16.unpack_from(data, position + 1)[0]
+            key = data[position + 3:position + 3 + length].decode('utf-8')
+            position += 3 + length
+        rid = _INT64.unpack_from(data, position)[0]
+        position += 8
+        node.keys.append((key, rid))
+        if not node.leaf:
+            node.children.append(_INT64.unpack_from(data, position)[0])
+            position += 8
+    node.size = position
+    return node
@@ -0,0 +1,217 @@
+"""
+Parallel construction of indexes in a process pool.
+
+The key column is copied once into shared memory, and the rows are split into contiguous slices,
+one per worker. Every worker reads only the keys of its slice and builds the part of the index
+over it with build_partition() of the index class, e.g. the bits of every key for the bitmap index.
+The parent combines the parts with from_partitions() of the index class.
+
+Parts of some indexes cannot be combined cheaply: runs of the slices would have to be merged and hash tables
+of the slices hashed again. Their classes have build_segment(), then build_partition() splits the rows of
+a slice by key range or by segment of the hash table as planned by plan_partitions() in the parent, and
+every worker of a second round builds one key range or segment from its rows of all slices.
+The parent only concatenates the key ranges or joins the segments.
+
+Building creates a lot of objects without reference cycles, so the garbage collector is paused meanwhile
+in the workers and in the parent. On platforms starting processes by spawn the pool re-imports the main module,
+so the build should be called under `if __name__ == "__main__":`.
+"""
+
+import gc
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import accumulate, repeat
+from tables.columnar import key_column, shares_keys
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8, the keys of every slice are pickled to its worker instead
+    shared_memory = None
+
+INT_KEYS = 0
+STR_KEYS = 1
+# slices start at multiples of this number of rows, so no word of a bitmap is shared by two slices
+SLICE_ALIGNMENT = 64
+
+
+def build_parallel(index_class, table, workers=None, pool=None, min_rows=10000, **options):
+    """
+    Builds an index over the table using a pool of processes.
+    :param index_class:     index class with build_partition() and from_partitions(), e.g. BTree, BPlusTree,
+                            HashIndex or BitmapIndex
+    :param table:           table with items (rows) with all int or all str keys
+    :param workers:         number of slices built in parallel, the number of CPUs by default
+    :param pool:            ProcessPoolExecutor reused between builds, a new one is started for the build if None
+    :param min_rows:        minimum number of rows per worker, smaller tables are built by fewer workers or sequentially
+    :param options:         keyword arguments of the index class, e.g. degree or engine
+    :return:                built index
+    """
+    if getattr(index_class, 'from_partitions', None) is None:
+        raise TypeError("{} cannot be built in parallel, it has no from_partitions()".format(index_class.__name__))
+    keys = key_column(table)
+    bounds = _slice_bounds(len(keys), max(1, min(workers or os.cpu_count() or 1, len(keys) // max(1, min_rows))))
+    if len(bounds) <= 2:
+        return index_class(table, **options)
+
+    key_type = _key_type(keys)
+    with _paused_gc():
+        if pool is None:
+            with ProcessPoolExecutor(len(bounds) - 1) as pool:
+                parts = _map_partitions(pool, index_class, keys, key_type, bounds, options)
+        else:
+            parts = _map_partitions(pool, index_class, keys, key_type, bounds, options)
+        index = index_class.from_partitions(keys, parts, **options)
+    index.keys_shared = shares_keys(table)
+    return index
+
+
+def _map_partitions(pool, index_class, keys, key_type, bounds, options):
+    """
+    Builds the parts of the index over all slices in the pool, and its segments if the index class has them.
+    :param pool:            ProcessPoolExecutor
+    :param index_class:     index class
+    :param keys:            keys of all rows
+    :param key_type:        INT_KEYS or STR_KEYS
+    :param bounds:          row ids starting the slices followed by the row count
+    :param options:         keyword arguments of the index class
+    :return:                list of the parts of the index in the order of the slices or segments
+    """
+    plan = None
+    if getattr(index_class, 'plan_partitions', None) is not None:
+        plan = index_class.plan_partitions(keys, len(bounds) - 1, **options)
+    if shared_memory is None:
+        slices = map(keys.__getitem__, map(slice, bounds, bounds[1:]))
+        parts = list(pool.map(_build_partition, repeat(index_class), slices, bounds, repeat(plan), repeat(options)))
+    else:
+        memory, layout = _share_keys(keys, key_type)
+        try:
+            parts = list(pool.map(_build_shared_partition, repeat(index_class), repeat(layout), bounds, bounds[1:],
+                                  repeat(plan), repeat(options)))
+        finally:
+            memory.close()
+            memory.unlink()
+
+    if getattr(index_class, 'build_segment', None) is None:
+        return parts
+    # the pieces of a key range or segment from all slices go to one worker
+    return list(pool.map(_build_segment, repeat(index_class), zip(*parts), range(len(parts[0])),
+                         repeat(plan), repeat(options)))
+
+
+def _build_partition(index_class, keys, start, plan, options):
+    """ Builds the part of the index over a slice of the keys, see build_partition() of the index classes """
+    with _paused_gc():
+        return index_class.build_partition(keys, start, plan, **options)
+
+
+def _build_shared_partition(index_class, layout, start, stop, plan, options):
+    """
+    Builds the part of the index over a slice reading its keys from the shared memory.
+    :param index_class:     index class
+    :param layout:          (name of the shared memory, key type, number of rows)
+    :param start:           row id of the first row of the slice
+    :param stop:            row id after the slice
+    :param plan:            result of plan_partitions() of the index class, None if it has none
+    :param options:         keyword arguments of the index class
+    :return:                part of the index, see build_partition() of the index classes
+    """
+    memory = shared_memory.SharedMemory(name=layout[0])
+    try:
+        keys = _read_keys(memory.buf, layout, start, stop)
+    finally:
+        memory.close()
+    return _build_partition(index_class, keys, start, plan, options)
+
+
+def _build_segment(index_class, pieces, segment, plan, options):
+    """ Builds a segment of the index from its pieces of all slices, see build_segment() of the index classes """
+    with _paused_gc():
+        return index_class.build_segment(pieces, segment, plan, **options)
+
+
+@contextmanager
+def _paused_gc():
+    """ Disables the garbage collector within the with block, unless it is disabled already """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _slice_bounds(row_count, workers):
+    """
+    Splits the rows into aligned slices of about the same size.
+    :param row_count:   number of rows
+    :param workers:     number of workers
+    :return:            row ids starting the non-empty slices followed by the row count
+    """
+    starts = sorted({row_count * i // workers // SLICE_ALIGNMENT * SLICE_ALIGNMENT for i in range(workers)})
+    return starts + [row_count] if row_count else [0]
+
+
+def _key_type(keys):
+    """
+    Checks that the keys can be shared.
+    :param keys:    keys of all rows
+    :return:        INT_KEYS or STR_KEYS
+    """
+    types = set(map(type, keys))
+    if types == {int}:
+        return INT_KEYS
+    if types == {str}:
+        return STR_KEYS
+    raise TypeError("Only tables with all int or all str keys can be built in parallel")
+
+
+def _share_keys(keys, key_type):
+    """
+    Copies the keys into a new block of shared memory.
+    Int keys are stored as int64 values, str keys as row_count + 1 int64 offsets followed by the utf-8 encoded keys.
+    :param keys:        keys of all rows
+    :param key_type:    INT_KEYS or STR_KEYS
+    :return:            SharedMemory, (name of the shared memory, key type, number of rows)
+    """
+    if key_type == INT_KEYS:
+        sections = [array('q', keys).tobytes()]
+    else:
+        encoded = list(map(str.encode, keys))
+        sections = [array('q', accumulate(map(len, encoded), initial=0)).tobytes(), b''.join(encoded)]
+
+    size = sum(len(section) for section in sections)
+    memory = shared_memory.SharedMemory(create=True, size=max(1, size))
+    position = 0
+    for section in sections:
+        memory.buf[position:position + len(section)] = section
+        position += len(section)
+    return memory, (memory.name, key_type, len(keys))
+
+
+def _read_keys(buffer, layout, start, stop):
+    """
+    Reads the keys of a slice of the rows from the shared memory.
+    :param buffer:  buffer of the shared memory
+    :param layout:  (name of the shared memory, key type, number of rows)
+    :param start:   row id of the first row of the slice
+    :param stop:    row id after the slice
+    :return:        array of int keys or list of str keys
+    """
+    _, key_type, row_count = layout
+    values = array('q')
+    if key_type == INT_KEYS:
+        with buffer[8 * start:8 * stop] as view:
+            values.frombytes(view)
+        return values
+
+    with buffer[8 * start:8 * (stop + 1)] as view:
+        values.frombytes(view)
+    blob_offset = 8 * (row_count + 1)
+    with buffer[blob_offset + values[0]:blob_offset + values[-1]] as view:
+        blob = bytes(view)
+    base = values[0]
+    return [blob[values[i] - base:values[i + 1] - base].decode('utf-8') for i in range(stop - start)]
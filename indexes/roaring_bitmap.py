@@ -0,0 +1,536 @@
+from array import array
+from bisect import bisect_left
+from indexes.bits import bit_positions, popcount
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+# an array container larger than this takes more space than a bitmap container
+ARRAY_LIMIT = 4096
+
+
+def _mask_of(values):
+    """
+    Returns an int with the bits of the values set.
+    :param values:  iterable of bit positions in a chunk
+    :return:        int
+    """
+    mask = bytearray(CHUNK_SIZE // 8)
+    for v in values:
+        mask[v >> 3] |= 1 << (v & 7)
+    return int.from_bytes(mask, 'little')
+
+
+def _from_int(x):
+    """
+    Creates the smallest container holding the bits of a chunk.
+    :param x:   bits of the chunk
+    :return:    container, or None for an empty chunk
+    """
+    count = popcount(x)
+    if count == 0:
+        return None
+    runs = popcount(x & ~(x << 1))
+    if 4 * runs <= min(2 * count, CHUNK_SIZE // 8):
+        starts = bit_positions(x & ~(x << 1))
+        ends = bit_positions(x & ~(x >> 1))
+        return RunContainer(array('H', [bound for run in zip(starts, ends) for bound in run]), count)
+    if count <= ARRAY_LIMIT:
+        return ArrayContainer(array('H', bit_positions(x)))
+    return BitmapContainer(x, count)
+
+
+def _from_values(values):
+    """
+    Creates the smallest container holding the sorted distinct values of a chunk.
+    :param values:  sorted list of low 16 bits
+    :return:        container, or None for an empty chunk
+    """
+    if not values:
+        return None
+    if len(values) > ARRAY_LIMIT:
+        return _from_int(_mask_of(values))
+    runs = 1
+    for i in range(1, len(values)):
+        if values[i] != values[i - 1] + 1:
+            runs += 1
+    if 4 * runs <= 2 * len(values):
+        return _from_int(_mask_of(values))
+    return ArrayContainer(array('H', values))
+
+
+class ArrayContainer:
+    """ Sorted array of the low 16 bits of the values in a sparse chunk. """
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    def count(self):
+        return len(self.values)
+
+    def to_int(self):
+        return _mask_of(self.values)
+
+    def row_ids(self):
+        return self.values
+
+    def contains(self, low):
+        index = bisect_left(self.values, low)
+        return index < len(self.values) and self.values[index] == low
+
+
+class BitmapContainer:
+    """ Uncompressed 2^16 bits of a dense chunk kept in an int. """
+    __slots__ = ('bits', 'cardinality')
+
+    def __init__(self, bits, cardinality):
+        self.bits = bits
+        self.cardinality = cardinality
+
+    def count(self):
+        return self.cardinality
+
+    def to_int(self):
+        return self.bits
+
+    def row_ids(self):
+        return bit_positions(self.bits)
+
+    def contains(self, low):
+        return (self.bits >> low) & 1 == 1
+
+
+class RunContainer:
+    """ Runs of consecutive values in a chunk as flat (first, last) pairs. """
+    __slots__ = ('runs', 'cardinality')
+
+    def __init__(self, runs, cardinality):
+        self.runs = runs
+        self.cardinality = cardinality
+
+    def count(self):
+        return self.cardinality
+
+    def to_int(self):
+        bits = 0
+        for i in range(0, len(self.runs), 2):
+            bits |= (1 << (self.runs[i + 1] + 1)) - (1 << self.runs[i])
+        return bits
+
+    def row_ids(self):
+        result = []
+        for i in range(0, len(self.runs), 2):
+            result.extend(range(self.runs[i], self.runs[i + 1] + 1))
+        return result
+
+    def contains(self, low):
+        index = bisect_left(self.runs, low)
+        # an even position is the start of a run, an odd one its end
+        return index < len(self.runs) and (self.runs[index] == low or index % 2 == 1)
+
+
+def _update_runs(container, low, value):
+    """
+    Returns a container with the low bit of a run container set to the value, the bit is known to differ.
+    :param container:   run container
+    :param low:         position in the chunk
+    :param value:       True to set the bit, False to clear it
+    :return:            container, or None for an empty chunk
+    """
+    runs = list(container.runs)
+    index = bisect_left(runs, low)
+    if value:
+        # low lies between the runs index // 2 - 1 and index // 2
+        joins_previous = index > 0 and runs[index - 1] == low - 1
+        joins_next = index < len(runs) and runs[index] == low + 1
+        if joins_previous and joins_next:
+            del runs[index - 1:index + 1]
+        elif joins_previous:
+            runs[index - 1] = low
+        elif joins_next:
+            runs[index] = low
+        else:
+            runs[index:index] = [low, low]
+    elif runs[index] == low and index % 2 == 0:
+        if runs[index + 1] == low:
+            del runs[index:index + 2]
+        else:
+            runs[index] = low + 1
+    elif runs[index] == low:
+        runs[index] = low - 1
+    else:
+        runs[index:index] = [low - 1, low + 1]
+
+    count = container.count() + (1 if value else -1)
+    if count == 0:
+        return None
+    if 4 * (len(runs) // 2) > min(2 * count, CHUNK_SIZE // 8):
+        # runs got fragmented, another container is smaller now
+        return _from_int(RunContainer(array('H', runs), count).to_int())
+    return RunContainer(array('H', runs), count)
+
+
+def _combine(a, b, operation):
+    """
+    Applies a bitwise operation to two containers of the same chunk.
+    :param a:           first container
+    :param b:           second container
+    :param operation:   one of '&', '|', '^', '-'
+    :return:            resulting container or None if it is empty
+    """
+    if isinstance(a, ArrayContainer) and isinstance(b, ArrayContainer):
+        left, right = set(a.values), set(b.values)
+        if operation == '&':
+            values = left & right
+        elif operation == '|':
+            values = left | right
+        elif operation == '^':
+            values = left ^ right
+        else:
+            values = left - right
+        return _from_values(sorted(values))
+
+    if operation == '&':
+        return _from_int(a.to_int() & b.to_int())
+    elif operation == '|':
+        return _from_int(a.to_int() | b.to_int())
+    elif operation == '^':
+        return _from_int(a.to_int() ^ b.to_int())
+    return _from_int(a.to_int() & ~b.to_int())
+
+
+def _concatenate(a, b):
+    """
+    Combines two containers of the same chunk, cheaply if all values of the second one follow the first one.
+    :param a:   first container
+    :param b:   second container
+    :return:    resulting container
+    """
+    if (isinstance(a, ArrayContainer) and isinstance(b, ArrayContainer)
+            and len(a.values) + len(b.values) <= ARRAY_LIMIT and a.values[-1] + 1 < b.values[0]):
+        # no run joins them and neither was smaller as runs, so the joined array is still the smallest
+        return ArrayContainer(a.values + b.values)
+    return _combine(a, b, '|')
+
+
+class RoaringBitmap:
+    """
+    Compressed bitmap in the style of Roaring: row ids are split into chunks of 2^16 by their high bits,
+    and every non-empty chunk is kept in an array, bitmap or run container, whichever is the smallest.
+    Containers are never modified in place, so results of operations may share them.
+    """
+    __slots__ = ('cardinality', 'containers', 'popcount')
+
+    def __init__(self, cardinality):
+        """
+        Bitmap constructor.
+        :param cardinality:     Number of rows in attribute/table
+        """
+        self.cardinality = cardinality
+        self.containers = dict()
+        self.popcount = 0  # number of bits set to 1
+
+    def get_row_ids(self):
+        """
+        Get Row ID's where bit is set to 1.
+        :return:    list of row_ids retrieved from bitmap index table
+        """
+        rids = []
+        for high in sorted(self.containers):
+            base = high << CHUNK_BITS
+            rids.extend(base + low for low in self.containers[high].row_ids())
+        return rids
+
+    def set_bit(self, k):
+        """
+        Set k-th bit to 1.
+        :param k:   k-th bit
+        :return:
+        """
+        if not self.test_bit(k):
+            self._update_chunk(k >> CHUNK_BITS, k & CHUNK_MASK, True)
+        if k >= self.cardinality:
+            self.cardinality = k + 1
+
+    def set_bits(self, ks):
+        """
+        Set all bits in ks to 1, building each touched container once.
+        :param ks:  iterable of bit positions
+        :return:
+        """
+        lows_by_high = dict()
+        for k in ks:
+            if k >= self.cardinality:
+                self.cardinality = k + 1
+            high = k >> CHUNK_BITS
+            if high in lows_by_high:
+                lows_by_high[high].append(k & CHUNK_MASK)
+            else:
+                lows_by_high[high] = [k & CHUNK_MASK]
+
+        for high, lows in lows_by_high.items():
+            container = self.containers.get(high)
+            if container is not None:
+                lows.extend(container.row_ids())
+                self.popcount -= container.count()
+            self.containers[high] = _from_values(sorted(set(lows)))
+            self.popcount += self.containers[high].count()
+
+    def set_mask(self, mask, offset=0):
+        """
+        Set the bits of an int mask shifted by the offset, building each touched container once.
+        :param mask:    int with the bits to set
+        :param offset:  position of the lowest bit of the mask
+        :return:
+        """
+        if not mask:
+            return
+        if offset + mask.bit_length() > self.cardinality:
+            self.cardinality = offset + mask.bit_length()
+        high = offset >> CHUNK_BITS
+        mask <<= offset & CHUNK_MASK
+        chunk_bits = (1 << CHUNK_SIZE) - 1
+        while mask:
+            bits = mask & chunk_bits
+            if bits:
+                container = self.containers.get(high)
+                if container is not None:
+                    bits |= container.to_int()
+                    self.popcount -= container.count()
+                self.containers[high] = _from_int(bits)
+                self.popcount += self.containers[high].count()
+            mask >>= CHUNK_SIZE
+            high += 1
+
+    @staticmethod
+    def part_of(rids, offset):
+        """
+        Returns the bits of row ids of a slice of the rows as a part of a bitmap, done by a worker of
+        a parallel build, so the worker builds the containers.
+        :param rids:    list of row ids relative to the start of the slice
+        :param offset:  row id of the first row of the slice
+        :return:        part for join_part()
+        """
+        part = RoaringBitmap(0)
+        part.set_bits([rid + offset for rid in rids])
+        return part
+
+    def join_part(self, part):
+        """
+        Set the bits of a part built by part_of(), taking over its containers.
+        Only a chunk with bits in both bitmaps is combined, e.g. the chunk split by the end of a slice.
+        :param part:    result of part_of()
+        :return:
+        """
+        containers = self.containers
+        for high, container in part.containers.items():
+            existing = containers.get(high)
+            if existing is not None:
+                self.popcount -= existing.count()
+                container = _concatenate(existing, container)
+            containers[high] = container
+            self.popcount += container.count()
+        if part.cardinality > self.cardinality:
+            self.cardinality = part.cardinality
+
+    def clear_bits(self, ks):
+        """
+        Set all bits in ks to 0, building each touched container once.
+        :param ks:  iterable of bit positions
+        :return:
+        """
+        lows_by_high = dict()
+        for k in ks:
+            high = k >> CHUNK_BITS
+            if high in lows_by_high:
+                lows_by_high[high].add(k & CHUNK_MASK)
+            else:
+                lows_by_high[high] = {k & CHUNK_MASK}
+
+        for high, lows in lows_by_high.items():
+            container = self.containers.get(high)
+            if container is None:
+                continue
+            self.popcount -= container.count()
+            updated = _from_values([low for low in container.row_ids() if low not in lows])
+            if updated is None:
+                del self.containers[high]
+            else:
+                self.containers[high] = updated
+                self.popcount += updated.count()
+
+    def clear_bit(self, k):
+        """
+        Set k-th bit to 0.
+        :param k:   k-th bit
+        :return:
+        """
+        if self.test_bit(k):
+            self._update_chunk(k >> CHUNK_BITS, k & CHUNK_MASK, False)
+
+    def test_bit(self, k):
+        """
+        Return k-th bit value.
+        :param k:   k-th bit
+        :return:
+        """
+        container = self.containers.get(k >> CHUNK_BITS)
+        return 1 if container is not None and container.contains(k & CHUNK_MASK) else 0
+
+    def _update_chunk(self, high, low, value):
+        """
+        Replaces the container of the chunk with one having the low bit set to the value.
+        :param high:    chunk number
+        :param low:     position in the chunk
+        :param value:   True to set the bit, False to clear it
+        """
+        container = self.containers.get(high)
+        if isinstance(container, ArrayContainer) or container is None:
+            values = list(container.values) if container is not None else []
+            if value:
+                values.insert(bisect_left(values, low), low)
+            else:
+                values.remove(low)
+            updated = _from_values(values)
+        elif isinstance(container, RunContainer):
+            updated = _update_runs(container, low, value)
+        else:
+            bits = container.bits | (1 << low) if value else container.bits & ~(1 << low)
+            count = container.count() + (1 if value else -1)
+            updated = BitmapContainer(bits, count) if count > ARRAY_LIMIT else _from_int(bits)
+
+        if updated is None:
+            del self.containers[high]
+        else:
+            self.containers[high] = updated
+        self.popcount += 1 if value else -1
+
+    def _product(self, containers, cardinality):
+        """
+        Wraps containers of the result of an operation into a new bitmap.
+        :param containers:      dict of the containers of the result
+        :param cardinality:     number of rows of the result
+        :return:                product of operation
+        """
+        product = RoaringBitmap(cardinality)
+        product.containers = containers
+        product.popcount = sum(container.count() for container in containers.values())
+        return product
+
+    def __or__(self, other):
+        """
+        Define logical OR(|) operator for objects of type RoaringBitmap.
+        :param other:   other bitmap to which you want to apply operation
+        :return:        product of operation
+        """
+        containers = dict(self.containers)
+        for high, container in other.containers.items():
+            mine = containers.get(high)
+            containers[high] = container if mine is None else _combine(mine, container, '|')
+        return self._product(containers, max(self.cardinality, other.cardinality))
+
+    def __xor__(self, other):
+        """
+        Define logical Exclusive OR(^) operator for objects of type RoaringBitmap.
+        :param other:   other bitmap to which you want to apply operation
+        :return:        product of operation
+        """
+        containers = dict(self.containers)
+        for high, container in other.containers.items():
+            mine = containers.get(high)
+            if mine is None:
+                containers[high] = container
+            else:
+                combined = _combine(mine, container, '^')
+                if combined is None:
+                    del containers[high]
+                else:
+                    containers[high] = combined
+        return self._product(containers, max(self.cardinality, other.cardinality))
+
+    def __and__(self, other):
+        """
+        Define logical AND(&) operator for objects of type RoaringBitmap.
+        :param other:   other bitmap to which you want to apply operation
+        :return:        product of operation
+        """
+        containers = dict()
+        for high, container in self.containers.items():
+            theirs = other.containers.get(high)
+            if theirs is not None:
+                combined = _combine(container, theirs, '&')
+                if combined is not None:
+                    containers[high] = combined
+        return self._product(containers, max(self.cardinality, other.cardinality))
+
+    def __sub__(self, other):
+        """
+        Define difference(-) operator for objects of type RoaringBitmap, bits of self not set in other.
+        :param other:   other bitmap to which you want to apply operation
+        :return:        product of operation
+        """
+        containers = dict()
+        for high, container in self.containers.items():
+            theirs = other.containers.get(high)
+            combined = container if theirs is None else _combine(container, theirs, '-')
+            if combined is not None:
+                containers[high] = combined
+        return self._product(containers, self.cardinality)
+
+    def __invert__(self):
+        """
+        Define logical NOT(~) operator for objects of type RoaringBitmap.
+        :return:        product of operation
+        """
+        containers = dict()
+        chunks = -(-self.cardinality // CHUNK_SIZE)
+        for high in range(chunks):
+            rows = min(CHUNK_SIZE, self.cardinality - (high << CHUNK_BITS))
+            universe = (1 << rows) - 1
+            container = self.containers.get(high)
+            if container is None:
+                inverted = RunContainer(array('H', [0, rows - 1]), rows)
+            else:
+                inverted = _from_int(~container.to_int() & universe)
+            if inverted is not None:
+                containers[high] = inverted
+        return self._product(containers, self.cardinality)
+
+    def resize(self):
+        """
+        Nothing to resize, containers are allocated per chunk on demand.
+        :return:
+        """
+
+    def extend(self, cardinality):
+        """
+        Extend the bitmap to the given number of rows.
+        :param cardinality:     new number of rows
+        :return:
+        """
+        self.cardinality = cardinality
+
+    def is_empty(self):
+        """
+        Checks whether Bitmap is empty or not.
+        :return:    whether bitmap empty or not
+        """
+        return not self.containers
+
+    def count(self):
+        """
+        Returns the number of bits set to 1.
+        :return:    number of set bits
+        """
+        return self.popcount
+
+    def __str__(self):
+        """
+        Returns a string representation of a bit array.
+        :return:
+        """
+        bits = ['0'] * self.cardinality
+        for rid in self.get_row_ids():
+            bits[rid] = '1'
+        return ''.join(reversed(bits))
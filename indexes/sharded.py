@@ -0,0 +1,310 @@
+"""
+Hash-partitioned index spanning several shards.
+
+Rows are routed to shards by the hash code of their keys, every shard is a separate index of any class
+over its own rows, numbered from 0 within the shard. The sharded index keeps the mapping between
+the row ids of the table and the row ids of the shards, scatters requests to the shards and gathers
+their results. Shards may run in separate processes, then a request is sent to all involved shards
+before any result is awaited, so the shards work on it in parallel.
+"""
+
+import multiprocessing
+import types
+from array import array
+from tables.item import Item
+from tables.columnar import key_column, append_key, set_key, shares_keys
+from indexes.hash_index import HashIndex, HashTable
+
+
+class ShardedIndex:
+    """ Index split into shards by the hash codes of the keys. """
+
+    def __init__(self, table, index_class=None, shards=4, processes=False, **options):
+        """
+        Sharded index constructor.
+        :param table:           table with items (rows) upon which index is built
+        :param index_class:     index class of the shards, HashIndex (default), BTree, BitmapIndex, etc.
+        :param shards:          number of shards
+        :param processes:       run every shard in a separate process
+        :param options:         keyword arguments of the index class
+        """
+        if shards < 1:
+            raise ValueError("Number of shards should be positive, got {}".format(shards))
+        self.keys = key_column(table)
+        self.keys_shared = shares_keys(table)
+        self.row_count = len(self.keys)
+        # shard and row id within the shard of every row of the table
+        self.row_shards = array('l')
+        self.local_rids = array('q')
+        # row ids in the table of the rows of every shard
+        self.global_rids = [array('q') for _ in range(shards)]
+
+        shard_keys = [[] for _ in range(shards)]
+        for rid in range(self.row_count):
+            key = self.keys[rid]
+            shard = self.shard_of(key)
+            self._place(rid, shard)
+            shard_keys[shard].append(key)
+
+        shard_class = ProcessShard if processes else LocalShard
+        self.shards = [shard_class(index_class or HashIndex, keys, options) for keys in shard_keys]
+        # processes build their shards at once and report when they are ready
+        try:
+            self._gather(range(shards))
+        except Exception:
+            self.close()
+            raise
+
+    def shard_of(self, key):
+        """
+        Returns the shard of the key.
+        :param key:     key
+        :return:        shard number
+        """
+        return HashTable.hash_code(self, key) % len(self.global_rids)
+
+    def look_up(self, key):
+        """
+        Returns a list of row ids in the table matching the key, only the shard of the key is searched.
+        :param key:     interest of search
+        :return:        list of row ids matching items
+        """
+        shard = self.shard_of(key)
+        return self._to_global(shard, self.shards[shard].call('look_up', key))
+
+    def look_up_many(self, keys):
+        """
+        Returns lists of row ids for many keys at once, every shard gets a single batch of its keys.
+        :param keys:    keys of interest
+        :return:        list of results of look_up aligned with the keys
+        """
+        keys_by_shard = dict()
+        for key in dict.fromkeys(keys):
+            keys_by_shard.setdefault(self.shard_of(key), []).append(key)
+
+        found = dict()
+        for shard, results in self._scatter((shard, 'look_up_many', shard_keys)
+                                            for shard, shard_keys in keys_by_shard.items()):
+            for key, rids in zip(keys_by_shard[shard], results):
+                found[key] = self._to_global(shard, rids)
+        return [list(found[key]) if found[key] is not None else None for key in keys]
+
+    def range(self, lo=None, hi=None, inclusive=True):
+        """
+        Returns row ids of the items with keys between lo and hi, searching all shards at once.
+        Shards should support range(), e.g. BPlusTree or BitSlicedIndex.
+        :param lo:          lower bound of the keys, None for no bound
+        :param hi:          upper bound of the keys, None for no bound
+        :param inclusive:   whether the bounds are included, a bool or a pair of bools for (lo, hi)
+        :return:            list of row ids in the key order
+        """
+        rids = []
+        for shard, results in self._scatter((shard, 'range', lo, hi, inclusive) for shard in range(len(self.shards))):
+            rids.extend(self._to_global(shard, results) or ())
+        rids.sort(key=lambda rid: (self.keys[rid], rid))
+        return rids
+
+    def insert(self, *keys):
+        """
+        Inserts information about new items in the table to the index.
+        :param keys:     key of inserted item
+        """
+        self.insert_many(keys)
+
+    def insert_many(self, keys):
+        """
+        Inserts information about a batch of new items, every shard gets a single batch of its keys.
+        :param keys:    keys of inserted items
+        """
+        keys_by_shard = dict()
+        for key in keys:
+            append_key(self.keys, self.row_count, key)
+            shard = self.shard_of(key)
+            self._place(self.row_count, shard)
+            keys_by_shard.setdefault(shard, []).append(key)
+            self.row_count += 1
+        self._scatter((shard, 'insert_many', shard_keys) for shard, shard_keys in keys_by_shard.items())
+
+    def update(self, rid, key):
+        """
+        Updates values of item at rid in the table and the index, moving the row if its shard changes.
+        :param rid:     row id
+        :param key:     key of the item to be updated
+        """
+        shard = self.row_shards[rid]
+        new_shard = self.shard_of(key)
+        if new_shard == shard:
+            self.shards[shard].call('update', self.local_rids[rid], key)
+        else:
+            self._scatter([(shard, 'delete', self.local_rids[rid]), (new_shard, 'insert_many', [key])])
+            self.row_shards[rid] = new_shard
+            self.local_rids[rid] = len(self.global_rids[new_shard])
+            self.global_rids[new_shard].append(rid)
+        set_key(self, rid, key)
+
+    def delete(self, rid):
+        """
+        Deletes the item information from the index.
+        :param rid:     row id
+        """
+        self.shards[self.row_shards[rid]].call('delete', self.local_rids[rid])
+
+    def delete_many(self, rids):
+        """
+        Deletes the information about a batch of items, every shard gets a single batch of its rows.
+        :param rids:    row ids
+        """
+        rids_by_shard = dict()
+        for rid in rids:
+            rids_by_shard.setdefault(self.row_shards[rid], []).append(self.local_rids[rid])
+        self._scatter((shard, 'delete_many', local_rids) for shard, local_rids in rids_by_shard.items())
+
+    def close(self):
+        """ Stops the processes of the shards """
+        for shard in self.shards:
+            shard.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _place(self, rid, shard):
+        """ Assigns the next row id of the shard to the row of the table """
+        self.row_shards.append(shard)
+        self.local_rids.append(len(self.global_rids[shard]))
+        self.global_rids[shard].append(rid)
+
+    def _scatter(self, requests):
+        """
+        Sends the requests to their shards first and then gathers the results.
+        :param requests:    iterable of (shard, method name, arguments...) tuples, at most one per shard
+        :return:            list of (shard, result) pairs in the order of the requests
+        """
+        shards = []
+        for shard, method, *args in requests:
+            self.shards[shard].send(method, *args)
+            shards.append(shard)
+        return self._gather(shards)
+
+    def _gather(self, shards):
+        """
+        Receives the results of the shards, all of them are received before an error of any shard is raised.
+        :param shards:  shard numbers
+        :return:        list of (shard, result) pairs
+        """
+        results = []
+        error = None
+        for shard in shards:
+            try:
+                results.append((shard, self.shards[shard].receive()))
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return results
+
+    def _to_global(self, shard, rids):
+        """ Translates row ids of the shard into row ids of the table, a missing result stays None """
+        if rids is None:
+            return None
+        global_rids = self.global_rids[shard]
+        return [global_rids[rid] for rid in rids]
+
+
+class LocalShard:
+    """ Shard whose index lives in the current process, a request is executed as soon as it is sent. """
+
+    def __init__(self, index_class, keys, options):
+        self.index = index_class([Item(key, None) for key in keys], **options)
+        self.result = None
+
+    def send(self, method, *args):
+        self.result = _execute(self.index, method, args)
+
+    def receive(self):
+        result, self.result = self.result, None
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def call(self, method, *args):
+        self.send(method, *args)
+        return self.receive()
+
+    def close(self):
+        pass
+
+
+class ProcessShard:
+    """ Shard whose index lives in a separate process, requests and results are passed through a pipe. """
+
+    def __init__(self, index_class, keys, options):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(child_connection, index_class, keys, options),
+                                               daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def send(self, method, *args):
+        self.connection.send((method, args))
+
+    def receive(self):
+        result = self.connection.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def call(self, method, *args):
+        self.send(method, *args)
+        return self.receive()
+
+    def close(self):
+        if not self.connection.closed:
+            try:
+                self.connection.send(None)
+            except OSError:
+                # the process has already stopped, e.g. after failing to build its index
+                pass
+            self.process.join()
+            self.connection.close()
+
+
+def _execute(index, method, args):
+    """
+    Calls a method of the index, a generator result is collected into a list and an error is returned.
+    :param index:   index of a shard
+    :param method:  method name
+    :param args:    arguments of the method
+    :return:        result of the method or the raised exception
+    """
+    try:
+        result = getattr(index, method)(*args)
+        return list(result) if isinstance(result, types.GeneratorType) else result
+    except Exception as e:
+        return e
+
+
+def _serve(connection, index_class, keys, options):
+    """
+    Builds the index of a shard and executes the requests coming through the connection until None is received.
+    :param connection:  connection to the process owning the sharded index
+    :param index_class: index class of the shard
+    :param keys:        keys of the rows of the shard
+    :param options:     keyword arguments of the index class
+    """
+    try:
+        index = index_class([Item(key, None) for key in keys], **options)
+    except Exception as e:
+        connection.send(e)
+        connection.close()
+        return
+    connection.send(None)
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        method, args = request
+        connection.send(_execute(index, method, args))
+    connection.close()
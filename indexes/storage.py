@@ -0,0 +1,417 @@
+"""
+Binary file format shared by all indexes.
+
+A file keeps the key column of the table and the posting list (row ids) of every key,
+so any index can be restored from it, and a directory of the keys, so look-ups can be
+served from the memory-mapped file by MappedIndex without reading the rest of it.
+
+Layout, all numbers are little-endian and sections start at page boundaries:
+    header      magic, version, directory layout, key type, counts and offsets of the sections
+    keys        int keys: row_count int64 values;
+                str keys: row_count + 1 int64 offsets followed by the utf-8 encoded keys
+    directory   hashed layout only: slot_count int64 entry numbers, -1 for an empty slot;
+                then entry_count entries (key rid, postings offset, postings size, encoding),
+                sorted by key in the sorted layout
+    postings    int64 row ids of a key, or a bitmap of row_count bits for frequent keys
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from itertools import count, groupby
+from operator import itemgetter
+from zlib import crc32
+from indexes.bits import bit_positions
+
+MAGIC = b'DBIX'
+VERSION = 1
+PAGE_SIZE = 4096
+
+# directory layouts
+SORTED = 0
+HASHED = 1
+
+# key types
+INT_KEYS = 0
+STR_KEYS = 1
+
+# encodings of posting lists
+ROW_IDS = 0
+BITMAP = 1
+
+_HEADER = struct.Struct('<4sHBBqqqqqq')
+_ENTRY = struct.Struct('<qqqq')
+_INT64 = struct.Struct('<q')
+_INT64_PAIR = struct.Struct('<qq')
+
+
+def write_index(path, keys, postings, layout=SORTED):
+    """
+    Writes the key column and the posting lists into the file.
+    :param path:        path to the file
+    :param keys:        keys of all rows, int or str
+    :param postings:    iterable of (key, row ids) pairs with non-empty lists of row ids
+    :param layout:      directory layout, SORTED for binary search or HASHED for hashing
+    """
+    row_count = len(keys)
+    key_type = _key_type(keys)
+    postings = [(key, rids) for key, rids in postings if len(rids)]
+    if layout == SORTED:
+        postings.sort(key=itemgetter(0))
+
+    # rows denser than one in 64 take less space as a bitmap
+    bitmap_size = (row_count + 7) // 8
+    entries = []
+    blobs = []
+    offset = 0
+    for key, rids in postings:
+        if 8 * len(rids) > bitmap_size:
+            mask = bytearray(bitmap_size)
+            for rid in rids:
+                mask[rid >> 3] |= 1 << (rid & 7)
+            blob, encoding = bytes(mask), BITMAP
+        else:
+            blob, encoding = _to_bytes(array('q', sorted(rids))), ROW_IDS
+        entries.append((rids[0], offset, len(blob), encoding))
+        blobs.append(blob)
+        offset += len(blob)
+
+    slots = array('q')
+    if layout == HASHED:
+        slot_count = 1
+        while slot_count < 2 * len(entries):
+            slot_count *= 2
+        slots = array('q', [-1]) * slot_count
+        for number, (key, _) in enumerate(postings):
+            slot = _stable_hash(key) & (slot_count - 1)
+            while slots[slot] != -1:
+                slot = (slot + 1) & (slot_count - 1)
+            slots[slot] = number
+
+    if key_type == INT_KEYS:
+        key_sections = [_to_bytes(array('q', keys))]
+    else:
+        encoded = [key.encode('utf-8') for key in keys]
+        bounds = array('q', [0])
+        for key in encoded:
+            bounds.append(bounds[-1] + len(key))
+        key_sections = [_to_bytes(bounds), b''.join(encoded)]
+
+    with open(path, 'wb') as f:
+        f.write(bytes(PAGE_SIZE))
+        keys_offset = f.tell()
+        for section in key_sections:
+            f.write(section)
+        directory_offset = _pad(f)
+        f.write(_to_bytes(slots))
+        f.write(b''.join(_ENTRY.pack(*entry) for entry in entries))
+        postings_offset = _pad(f)
+        for blob in blobs:
+            f.write(blob)
+
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, layout, key_type, row_count, len(entries), len(slots),
+                             keys_offset, directory_offset, postings_offset))
+
+
+class MappedIndex:
+    """
+    Read-only index served from a memory-mapped index file.
+    A look-up reads only the directory entries on its search path and the posting list of the key.
+    """
+
+    def __init__(self, path):
+        """
+        Mapped index constructor.
+        :param path:    path to a file written by save() of any index
+        """
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.layout, self.key_type, self.row_count, self.entry_count, self.slot_count,
+         self.keys_offset, self.directory_offset, self.postings_offset) = _HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.buffer.close()
+            raise ValueError("{} is not an index file of version {}".format(path, VERSION))
+        self.entries_offset = self.directory_offset + 8 * self.slot_count
+
+    def look_up(self, key):
+        """
+        Returns a list of row ids in the table matching the key
+        :param key:     interest of search
+        :return:        list of row ids matching items
+        """
+        if (type(key) is str) != (self.key_type == STR_KEYS):
+            return None
+        number = self._find(key)
+        return list(self._row_ids(number)) if number is not None else None
+
+    def look_up_many(self, keys):
+        """
+        Returns lists of row ids for many keys at once.
+        :param keys:    keys of interest
+        :return:        list of results of look_up aligned with the keys
+        """
+        return [self.look_up(key) for key in keys]
+
+    def key(self, rid):
+        """
+        Returns the key of the row.
+        :param rid:     row id
+        :return:        key
+        """
+        if self.key_type == INT_KEYS:
+            return _INT64.unpack_from(self.buffer, self.keys_offset + 8 * rid)[0]
+        start, end = _INT64_PAIR.unpack_from(self.buffer, self.keys_offset + 8 * rid)
+        blob_offset = self.keys_offset + 8 * (self.row_count + 1)
+        return self.buffer[blob_offset + start:blob_offset + end].decode('utf-8')
+
+    def keys(self):
+        """
+        Reads the whole key column.
+        :return:    list of keys of all rows
+        """
+        if self.key_type == INT_KEYS:
+            return list(_from_bytes(self.buffer[self.keys_offset:self.keys_offset + 8 * self.row_count]))
+        return [self.key(rid) for rid in range(self.row_count)]
+
+    def postings(self):
+        """
+        Yields the posting lists of all keys, in the key order for the sorted layout.
+        :return:    generator of (key, array of row ids) pairs
+        """
+        for number in range(self.entry_count):
+            rids = self._row_ids(number)
+            yield self.key(rids[0]), rids
+
+    def close(self):
+        """ Unmaps the file """
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.row_count
+
+    def _entry_key(self, number):
+        """ Returns the key of the directory entry """
+        return self.key(_INT64.unpack_from(self.buffer, self.entries_offset + _ENTRY.size * number)[0])
+
+    def _find(self, key):
+        """
+        Finds the directory entry of the key.
+        :param key:     key
+        :return:        entry number, None if the key is absent
+        """
+        if self.layout == HASHED:
+            mask = self.slot_count - 1
+            slot = _stable_hash(key) & mask
+            while True:
+                number = _INT64.unpack_from(self.buffer, self.directory_offset + 8 * slot)[0]
+                if number == -1:
+                    return None
+                if self._entry_key(number) == key:
+                    return number
+                slot = (slot + 1) & mask
+
+        lo, hi = 0, self.entry_count
+        while lo < hi:
+            middle = (lo + hi) // 2
+            if self._entry_key(middle) < key:
+                lo = middle + 1
+            else:
+                hi = middle
+        return lo if lo < self.entry_count and self._entry_key(lo) == key else None
+
+    def _row_ids(self, number):
+        """
+        Decodes the posting list of the directory entry.
+        :param number:  entry number
+        :return:        array of row ids in the ascending order
+        """
+        _, offset, size, encoding = _ENTRY.unpack_from(self.buffer, self.entries_offset + _ENTRY.size * number)
+        start = self.postings_offset + offset
+        blob = self.buffer[start:start + size]
+        if encoding == BITMAP:
+            return array('q', bit_positions(int.from_bytes(blob, 'little')))
+        return _from_bytes(blob)
+
+
+def read_index(path):
+    """
+    Reads the key column and the posting lists from the file.
+    :param path:    path to the file
+    :return:        list of keys, list of (key, array of row ids) pairs sorted by key
+    """
+    with MappedIndex(path) as mapped:
+        keys = mapped.keys()
+        postings = list(mapped.postings())
+    if mapped.layout != SORTED:
+        postings.sort(key=itemgetter(0))
+    return keys, postings
+
+
+def live_rows(postings, row_count):
+    """
+    Marks the rows present in the posting lists.
+    :param postings:    list of (key, row ids) pairs
+    :param row_count:   number of rows
+    :return:            bytearray with 1 for the present rows and 0 for the deleted ones
+    """
+    live = bytearray(row_count)
+    for _, rids in postings:
+        for rid in rids:
+            live[rid] = 1
+    return live
+
+
+def group_rows(keys, rids):
+    """
+    Groups the rows by their keys.
+    :param keys:    keys of all rows
+    :param rids:    row ids of the rows present in the index
+    :return:        list of (key, row ids) pairs
+    """
+    rids_by_key = dict()
+    for rid in rids:
+        key = keys[rid]
+        if key in rids_by_key:
+            rids_by_key[key].append(rid)
+        else:
+            rids_by_key[key] = [rid]
+    return list(rids_by_key.items())
+
+
+def sorted_run(keys, start=0):
+    """
+    Groups consecutive rows by their keys in the key order.
+    :param keys:    keys of the rows
+    :param start:   row id of the first row
+    :return:        (distinct keys in ascending order, array of row counts of the keys, array of row ids by key)
+    """
+    # the sort is stable, so the row ids of a key stay ascending
+    pairs = sorted(zip(keys, count(start)), key=itemgetter(0))
+    run_keys = []
+    counts = array('q')
+    for key, group in groupby(map(itemgetter(0), pairs)):
+        run_keys.append(key)
+        counts.append(len(list(group)))
+    return run_keys, counts, array('q', map(itemgetter(1), pairs))
+
+
+def sample_splitters(keys, parts, samples=64):
+    """
+    Chooses keys splitting the key domain into ranges with about the same number of rows.
+    A frequent key may be sampled as several splitters, then fewer ranges are made.
+    :param keys:        keys of all rows
+    :param parts:       number of ranges
+    :param samples:     number of sampled keys per range
+    :return:            sorted list of at most parts - 1 distinct keys, each starting a range
+    """
+    sample = sorted(set(keys[::max(1, len(keys) // (parts * samples))]))
+    if not sample:
+        return []
+    return sorted({sample[len(sample) * i // parts] for i in range(1, parts)} - {sample[0]})
+
+
+def split_run(run, splitters):
+    """
+    Splits a run into the key ranges started by the splitters.
+    :param run:         run made by sorted_run()
+    :param splitters:   sorted keys starting the ranges after the first one
+    :return:            list of len(splitters) + 1 runs
+    """
+    run_keys, counts, rids = run
+    bounds = [0] + [bisect_left(run_keys, splitter) for splitter in splitters] + [len(run_keys)]
+    runs = []
+    end = 0
+    for lo, hi in zip(bounds, bounds[1:]):
+        start, end = end, end + sum(counts[lo:hi])
+        runs.append((run_keys[lo:hi], counts[lo:hi], rids[start:end]))
+    return runs
+
+
+def merge_runs(runs):
+    """
+    Merges the runs of consecutive slices of rows into a single run.
+    :param runs:    runs made by sorted_run() in the order of their rows
+    :return:        merged run
+    """
+    run_keys = []
+    counts = array('q')
+    rids = array('q')
+    # merge() takes equal keys from the earlier runs first, so the row ids of a key stay ascending
+    for key, postings in groupby(merge(*map(run_postings, runs), key=itemgetter(0)), key=itemgetter(0)):
+        run_keys.append(key)
+        counts.append(len(rids))
+        for _, key_rids in postings:
+            rids.extend(key_rids)
+        counts[-1] = len(rids) - counts[-1]
+    return run_keys, counts, rids
+
+
+def run_postings(run):
+    """
+    Returns the posting lists of a run.
+    :param run:     run made by sorted_run()
+    :return:        iterator of (key, array of row ids) pairs sorted by key
+    """
+    run_keys, counts, rids = run
+    end = 0
+    for key, key_count in zip(run_keys, counts):
+        start, end = end, end + key_count
+        yield key, rids[start:end]
+
+
+def _key_type(keys):
+    """
+    Returns the type of the key column, which should consist of either int or str keys.
+    :param keys:    keys of all rows
+    :return:        INT_KEYS or STR_KEYS
+    """
+    if all(type(key) is int for key in keys):
+        return INT_KEYS
+    if all(type(key) is str for key in keys):
+        return STR_KEYS
+    raise TypeError("Only tables with all int or all str keys can be saved")
+
+
+def _stable_hash(key):
+    """
+    Returns a hash of the key that does not change between runs, unlike hash() of str.
+    :param key:     int or str key
+    :return:        non-negative int
+    """
+    if type(key) is str:
+        return crc32(key.encode('utf-8'))
+    h = (key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    return h ^ (h >> 32)
+
+
+def _pad(f):
+    """ Pads the file up to the page boundary, returns the new position """
+    f.write(bytes(-f.tell() % PAGE_SIZE))
+    return f.tell()
+
+
+def _to_bytes(values):
+    """ Returns little-endian bytes of an int64 array """
+    if sys.byteorder == 'big':
+        values = array('q', values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(blob):
+    """ Returns an int64 array from its little-endian bytes """
+    values = array('q')
+    values.frombytes(blob)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
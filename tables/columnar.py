@@ -0,0 +1,142 @@
+from array import array
+from sys import intern
+from tables.item import Item
+
+
+class ColumnarTable(object):
+    """
+    Table keeping keys and values in columns instead of a list of Item objects.
+    Integer keys are stored in a typed array, string keys are interned, values are dictionary-encoded.
+    Indexes built upon the table share its key column instead of copying the keys.
+    A shared column is never changed in place, whoever changes the key of a row copies the column first.
+    """
+
+    def __init__(self, items=(), key_typecode=None):
+        """
+        Columnar table constructor.
+        :param items:           iterable of items (rows) to fill the table with
+        :param key_typecode:    array typecode of the key column, e.g. 'q', inferred from the first key if None
+        """
+        items = iter(items)
+        first = next(items, None)
+        if key_typecode is None and first is not None and type(first.key()) is int:
+            key_typecode = 'q'
+        self.keys = array(key_typecode) if key_typecode is not None else []
+        self.keys_shared = False
+        # codes of the values in the dictionary of distinct values
+        self.codes = array('l')
+        self.dictionary = []
+        self._code_of = dict()
+        if first is not None:
+            self.append(first)
+        self.extend(items)
+
+    def append(self, item):
+        """
+        Appends an item to the table.
+        The key is not appended again if an index sharing the key column has already inserted it.
+        :param item:    item (row)
+        """
+        if len(self.keys) == len(self.codes):
+            key = item.key()
+            self.keys.append(intern(key) if type(key) is str else key)
+        self.codes.append(self._encode(item.value()))
+
+    def extend(self, items):
+        """
+        Appends items to the table.
+        :param items:   iterable of items (rows)
+        """
+        for item in items:
+            self.append(item)
+
+    def update(self, rid, item):
+        """
+        Replaces the item at rid, indexes sharing the key column keep the old key until they are updated.
+        :param rid:     row id
+        :param item:    new item (row)
+        """
+        key = item.key()
+        if key != self.keys[rid]:
+            set_key(self, rid, intern(key) if type(key) is str else key)
+        self.codes[rid] = self._encode(item.value())
+
+    def key(self, rid):
+        """ Returns the key of the row """
+        return self.keys[rid]
+
+    def value(self, rid):
+        """ Returns the value of the row """
+        return self.dictionary[self.codes[rid]]
+
+    def _encode(self, value):
+        """
+        Returns the code of the value, adding it to the dictionary if it is new.
+        :param value:   value of an item
+        :return:        integer code
+        """
+        code = self._code_of.get(value)
+        if code is None:
+            code = len(self.dictionary)
+            self.dictionary.append(intern(value) if type(value) is str else value)
+            self._code_of[value] = code
+        return code
+
+    def __getitem__(self, rid):
+        return Item(self.keys[rid], self.dictionary[self.codes[rid]])
+
+    def __iter__(self):
+        dictionary = self.dictionary
+        for key, code in zip(self.keys, self.codes):
+            yield Item(key, dictionary[code])
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def key_column(table):
+    """
+    Returns the key column for an index: the column of a columnar table is shared, keys of items are copied.
+    :param table:   ColumnarTable or list of items
+    :return:        list or array of keys
+    """
+    if isinstance(table, ColumnarTable):
+        table.keys_shared = True
+        return table.keys
+    return [item.key() for item in table]
+
+
+def shares_keys(table):
+    """
+    Checks whether key_column() shares the key column of the table instead of copying it.
+    :param table:   ColumnarTable or list of items
+    :return:        bool
+    """
+    return isinstance(table, ColumnarTable)
+
+
+def append_key(keys, rid, key):
+    """
+    Appends the key of a new row to the key column of an index.
+    A column shared with a table or other indexes may already hold the key, then it is not appended again.
+    :param keys:    key column
+    :param rid:     row id of the new row
+    :param key:     key of the row
+    """
+    if len(keys) == rid:
+        keys.append(key)
+
+
+def set_key(owner, rid, key):
+    """
+    Changes the key of a row in the key column of an index or a columnar table.
+    A shared column is copied by its owner before the change, so the table and the other indexes keep
+    the old key of the row, which they need to update the row on their own. The copy is made once per owner.
+    :param owner:   index or ColumnarTable with keys and keys_shared attributes
+    :param rid:     row id
+    :param key:     new key of the row
+    """
+    if owner.keys_shared:
+        owner.keys = owner.keys[:]
+        owner.keys_shared = False
+    owner.keys[rid] = key
@@ -1,5 +1,7 @@
 class Item(object):
     """Item class that contains two fields: key and data"""
+    __slots__ = ('_key', '_data')
+
     def __init__(self, _key, _data):
         self._key = _key
         self._data = _data
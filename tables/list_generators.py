@@ -1,6 +1,8 @@
+from itertools import islice
 from random import randint
 from uuid import uuid4
 from tables.item import Item
+from tables.columnar import ColumnarTable
 import csv
 
 
@@ -63,6 +65,47 @@ def output_list_to_file(lst, path):
             writer.writerow([item.key(), item.value()])
 
 
+def get_batches_from_file(path, batch_size=10000):
+    """
+    Reads items from the csv file lazily, batch by batch.
+    :param path:        path to the file
+    :param batch_size:  maximum number of items in a batch
+    :return:            generator of lists of items
+    """
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        while True:
+            batch = [Item(row[0], row[1]) for row in islice(reader, batch_size)]
+            if not batch:
+                return
+            yield batch
+
+
+def output_batches_to_file(batches, path):
+    """
+    Writes batches of items to the csv file as soon as they are produced.
+    :param batches:     iterable of lists of items
+    :param path:        path to the file
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        for batch in batches:
+            writer.writerows([item.key(), item.value()] for item in batch)
+
+
+def get_table_from_file(path, batch_size=10000):
+    """
+    Reads the csv file into a columnar table batch by batch, so the items of only one batch are kept at once.
+    :param path:        path to the file
+    :param batch_size:  maximum number of items in a batch
+    :return:            ColumnarTable
+    """
+    table = ColumnarTable()
+    for batch in get_batches_from_file(path, batch_size):
+        table.extend(batch)
+    return table
+
+
 def get_item_of_interest(list_of_items, item_index=None):
     """
     Picks n element from right half of list.
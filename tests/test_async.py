@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+import pytest
+
+from tables.item import Item
+from indexes.async_index import AsyncIndex
+from indexes.btree import BTree
+from indexes.bplus_tree import BPlusTree
+
+
+def make_table(count=100):
+    return [Item(key % 10, None) for key in range(count)]
+
+
+class BlockingIndex:
+    """ Index whose look-ups wait until the test releases them """
+
+    def __init__(self, index):
+        self.index = index
+        self.release = threading.Event()
+        self.batches = []
+
+    def look_up_many(self, keys):
+        self.batches.append(list(keys))
+        self.release.wait(5)
+        return self.index.look_up_many(keys)
+
+
+def test_look_ups_are_coalesced_into_batches():
+    index = AsyncIndex(BTree(make_table()))
+
+    async def main():
+        return await asyncio.gather(index.look_up(1), index.look_up(2), index.look_up(1), index.look_up(42))
+
+    one, two, one_again, missing = asyncio.run(main())
+    assert sorted(one) == sorted(one_again) == list(range(1, 100, 10))
+    assert sorted(two) == list(range(2, 100, 10))
+    assert missing is None
+    assert index.batch_count == 1
+    assert index.coalesced_count == 1
+
+
+def test_writes_are_seen_by_later_look_ups():
+    index = AsyncIndex(BTree(make_table()))
+
+    async def main():
+        await index.insert_many(iter([42, 42]))
+        await index.delete(2)
+        return await index.look_up_many([42, 2])
+
+    found, remaining = asyncio.run(main())
+    assert sorted(found) == [100, 101]
+    assert sorted(remaining) == list(range(12, 100, 10))
+
+
+def test_range_is_exposed_only_for_indexes_with_range():
+    assert not hasattr(AsyncIndex(BTree(make_table())), 'range')
+    index = AsyncIndex(BPlusTree(make_table()))
+    assert asyncio.run(index.range(3, 3)) == list(range(3, 100, 10))
+
+
+def test_cancelled_flush_cancels_waiting_look_ups():
+    blocking = BlockingIndex(BTree(make_table()))
+    index = AsyncIndex(blocking)
+
+    async def main():
+        running = asyncio.ensure_future(index.look_up(1))
+        while not blocking.batches:
+            await asyncio.sleep(0.01)
+        pending = asyncio.ensure_future(index.look_up(2))
+        await asyncio.sleep(0)
+        index._flush_task.cancel()
+        blocking.release.set()
+        for look_up in (running, pending):
+            with pytest.raises(asyncio.CancelledError):
+                await look_up
+        assert index._flush_task is None
+        # the next look-up starts a new flush
+        return await index.look_up(3)
+
+    assert sorted(asyncio.run(main())) == list(range(3, 100, 10))
@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from tables.columnar import ColumnarTable
+from tables.item import Item
+from tests.test_columnar import INDEXES, rows
+
+
+def check(index, reference):
+    for key, rids in reference.items():
+        assert rows(index, key) == sorted(rids)
+    assert index.look_up_many(list(reference)) == [index.look_up(key) for key in reference]
+
+
+@pytest.mark.parametrize('index_class', INDEXES)
+def test_batch_methods_accept_generators(index_class):
+    table = ColumnarTable(Item(key % 5, None) for key in range(20))
+    index = index_class(table)
+    index.insert_many(key for key in (7, 7, 8))
+    index.delete_many(rid for rid in range(0, 20, 5))
+
+    assert rows(index, 7) == [20, 21]
+    assert rows(index, 8) == [22]
+    assert rows(index, 0) == []
+    assert rows(index, 1) == [1, 6, 11, 16]
+
+
+@pytest.mark.parametrize('index_class', INDEXES)
+def test_batches_match_single_row_changes(index_class):
+    generator = random.Random(1)
+    keys = [generator.randrange(30) for _ in range(200)]
+    index = index_class(ColumnarTable(Item(key, None) for key in keys))
+    reference = {key: set() for key in range(40)}
+    for rid, key in enumerate(keys):
+        reference[key].add(rid)
+
+    alive = set(range(len(keys)))
+    for _ in range(5):
+        new_keys = [generator.randrange(40) for _ in range(30)]
+        index.insert_many(iter(new_keys))
+        for key in new_keys:
+            reference[key].add(len(keys))
+            alive.add(len(keys))
+            keys.append(key)
+
+        deleted = generator.sample(sorted(alive), 25)
+        index.delete_many(iter(deleted))
+        for rid in deleted:
+            reference[keys[rid]].discard(rid)
+            alive.discard(rid)
+        check(index, reference)
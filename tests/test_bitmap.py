@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from indexes.bitmap_index import Bitmap, IntBitmap
+from indexes.bits import bit_positions, popcount
+
+
+def make_bitmap(bitmap_class, cardinality, density, generator):
+    rows = {rid for rid in range(cardinality) if generator.random() < density}
+    bitmap = bitmap_class(cardinality)
+    bitmap.set_bits(sorted(rows))
+    return bitmap, rows
+
+
+def test_bit_helpers():
+    assert popcount(0) == 0
+    assert popcount((1 << 100) | 5) == 3
+    assert bit_positions(0) == []
+    assert bit_positions((1 << 100) | 5) == [0, 2, 100]
+
+
+@pytest.mark.parametrize('bitmap_class', [Bitmap, IntBitmap])
+@pytest.mark.parametrize('density', [0.005, 0.5])
+def test_operations_match_python_sets(bitmap_class, density):
+    generator = random.Random(5)
+    for size, other_size in [(0, 40), (33, 33), (1000, 64), (5000, 7001)]:
+        a, left = make_bitmap(bitmap_class, size, density, generator)
+        b, right = make_bitmap(bitmap_class, other_size, 0.3, generator)
+
+        assert a.get_row_ids() == sorted(left)
+        for product, rows in [(a & b, left & right), (a | b, left | right), (a ^ b, left ^ right), (a - b, left - right),
+                              (~a, set(range(size)) - left)]:
+            assert product.get_row_ids() == sorted(rows)
+            assert product.count() == len(rows)
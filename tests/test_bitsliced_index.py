@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from tables.item import Item
+from indexes.bitmap_index import Bitmap, IntBitmap
+from indexes.bitsliced_index import BitSlicedIndex
+from indexes.roaring_bitmap import RoaringBitmap
+
+BITMAP_CLASSES = [IntBitmap, Bitmap, RoaringBitmap]
+INCLUSIVE = [True, False, (True, False), (False, True)]
+
+
+def matching(keys, lo, hi, inclusive):
+    """ Returns the row ids of the keys between the bounds, computed by a scan """
+    lo_inclusive, hi_inclusive = inclusive if isinstance(inclusive, tuple) else (inclusive, inclusive)
+    return [rid for rid, key in enumerate(keys) if key is not None
+            and (lo is None or key > lo or lo_inclusive and key == lo)
+            and (hi is None or key < hi or hi_inclusive and key == hi)]
+
+
+def assert_queries_match(index, keys):
+    for lo, hi in [(None, None), (None, 10), (-7, None), (-7, 10), (3, 3), (20, 5), (-100, 100), (0, 0)]:
+        for inclusive in INCLUSIVE:
+            rids = matching(keys, lo, hi, inclusive)
+            assert index.range(lo, hi, inclusive) == rids
+            assert index.count(lo, hi, inclusive) == len(rids)
+            assert index.sum(lo, hi, inclusive) == sum(keys[rid] for rid in rids)
+
+
+def make_keys(seed):
+    generator = random.Random(seed)
+    return [generator.randrange(-20, 40) for _ in range(700)]
+
+
+@pytest.mark.parametrize('bitmap_class', BITMAP_CLASSES)
+def test_range_count_and_sum_match_a_scan(bitmap_class):
+    keys = make_keys(1)
+    index = BitSlicedIndex([Item(key, None) for key in keys], bitmap_class)
+
+    assert_queries_match(index, keys)
+    assert index.histogram([-20, 0, 20, 40]) == [sum(lo <= key < hi for key in keys)
+                                                for lo, hi in [(-20, 0), (0, 20), (20, 40)]]
+
+
+@pytest.mark.parametrize('bitmap_class', BITMAP_CLASSES)
+def test_range_count_and_sum_follow_changes(bitmap_class):
+    keys = make_keys(2)
+    index = BitSlicedIndex([Item(key, None) for key in keys], bitmap_class)
+
+    # a key below the smallest one moves the offset of the slices, a large one adds slices
+    index.insert_many([-50, 1000, 7])
+    index.update(3, -60)
+    index.update(4, 5)
+    index.delete_many([10, 11, 700])
+    index.delete(12)
+    keys += [-50, 1000, 7]
+    keys[3], keys[4] = -60, 5
+    for rid in (10, 11, 700, 12):
+        keys[rid] = None
+
+    assert_queries_match(index, keys)
+    assert index.sum() == sum(key for key in keys if key is not None)
+
+
+def test_rejects_keys_other_than_int():
+    index = BitSlicedIndex([Item(1, None)])
+    with pytest.raises(TypeError):
+        index.insert(1.5)
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from tables.item import Item
+from indexes.btree import BTree
+
+
+def levels(tree):
+    """ Returns the nodes of every level of the tree from the root down """
+    result = [[tree.root]]
+    while result[-1][0].right_most is not None:
+        result.append([node.child(i) for node in result[-1] for i in range(len(node.entries) + 1)])
+    return result
+
+
+def in_order(node):
+    """ Returns the keys and the row ids of the entries of the subtree in the key order """
+    pairs = []
+    for entry in node.entries:
+        if entry.left is not None:
+            pairs.extend(in_order(entry.left))
+        pairs.append((entry.key, list(entry.rids)))
+    if node.right_most is not None:
+        pairs.extend(in_order(node.right_most))
+    return pairs
+
+
+def make_table(size=2000):
+    generator = random.Random(4)
+    return [Item(generator.randrange(size // 3), None) for _ in range(size)]
+
+
+@pytest.mark.parametrize('degree', [3, 4, 9, 64])
+def test_bulk_load_matches_repeated_inserts(degree):
+    table = make_table()
+    bulk = BTree(table, degree=degree)
+    inserted = BTree([], degree=degree)
+    for item in table:
+        inserted.insert(item.key())
+
+    assert in_order(bulk.root) == in_order(inserted.root)
+    assert [key for key, _ in in_order(bulk.root)] == sorted({item.key() for item in table})
+    for key in range(-1, len(table) // 3 + 1):
+        assert bulk.look_up(key) == inserted.look_up(key)
+
+
+@pytest.mark.parametrize('degree', [3, 9, 64])
+@pytest.mark.parametrize('fill_factor', [0.5, 0.75, 1.0])
+def test_bulk_load_packs_nodes_by_fill_factor(degree, fill_factor):
+    bulk = BTree(make_table(), degree=degree, fill_factor=fill_factor)
+    capacity = max(1, int((degree - 1) * fill_factor))
+    tree_levels = levels(bulk)
+
+    assert len(tree_levels) == bulk.height + 1
+    for level in tree_levels:
+        assert all(len(node.entries) <= degree - 1 for node in level)
+    if capacity > bulk.min_entries:
+        # nodes below the root exceed the fill factor only when they would fall below the minimum otherwise
+        assert all(len(node.entries) <= capacity for level in tree_levels[1:] for node in level)
+    for level in tree_levels[1:]:
+        # siblings are packed evenly, so none falls below the minimum of a B-tree node
+        assert all(len(node.entries) >= bulk.min_entries for node in level)
+        assert max(map(len, (node.entries for node in level))) - min(map(len, (node.entries for node in level))) <= 1
+
+
+def test_half_filled_tree_takes_inserts_without_splits():
+    table = make_table()
+    bulk = BTree(table, degree=9, fill_factor=0.5)
+    leaves = len(levels(bulk)[-1])
+    assert leaves > len(levels(BTree(table, degree=9))[-1])
+    # a key between every two distinct keys lands in the leaves that have free room
+    bulk.insert_many([key + 0.5 for key in range(0, 20, 4)])
+
+    assert len(levels(bulk)[-1]) == leaves
+    assert bulk.look_up(4.5) == [len(table) + 1]
+
+
+def test_bulk_load_of_empty_table_takes_inserts():
+    tree = BTree([])
+    tree.insert(2, 1, 2)
+
+    assert tree.look_up(2) == [0, 2]
+    assert tree.look_up(1) == [1]
+    assert tree.look_up(3) is None
@@ -0,0 +1,102 @@
+from functools import partial
+
+import pytest
+
+from tables.columnar import ColumnarTable
+from tables.item import Item
+from indexes.naive_index import NaiveIndex
+from indexes.bitmap_index import BitmapIndex, IntBitmap
+from indexes.bitsliced_index import BitSlicedIndex
+from indexes.btree import BTree
+from indexes.bplus_tree import BPlusTree
+from indexes.hash_index import HashIndex
+from indexes.paged_btree import PagedBTree
+from indexes.roaring_bitmap import RoaringBitmap
+from indexes.concurrent import ConcurrentHashIndex, CopyOnWriteBitmapIndex
+from indexes.sharded import ShardedIndex
+
+INDEXES = [
+    NaiveIndex,
+    partial(NaiveIndex, vectorized=True),
+    BitmapIndex,
+    partial(BitmapIndex, bitmap_class=IntBitmap),
+    partial(BitmapIndex, bitmap_class=RoaringBitmap),
+    BitSlicedIndex,
+    BTree,
+    BPlusTree,
+    HashIndex,
+    PagedBTree,
+    ConcurrentHashIndex,
+    CopyOnWriteBitmapIndex,
+    ShardedIndex,
+]
+
+
+def rows(index, key):
+    return sorted(index.look_up(key) or [])
+
+
+def make_table():
+    return ColumnarTable(Item(key % 7, 'value {}'.format(key)) for key in range(50))
+
+
+def test_indexes_share_the_key_column():
+    table = make_table()
+    indexes = [index_class(table) for index_class in INDEXES]
+    for index in indexes:
+        assert index.keys is table.keys
+        assert rows(index, 3) == list(range(3, 50, 7))
+
+
+@pytest.mark.parametrize('table_first', [False, True])
+def test_update_of_several_indexes_over_one_table(table_first):
+    table = make_table()
+    indexes = [index_class(table) for index_class in INDEXES]
+    if table_first:
+        table.update(3, Item(99, 'updated'))
+    for index in indexes:
+        index.update(3, 99)
+    if not table_first:
+        table.update(3, Item(99, 'updated'))
+
+    assert table.key(3) == 99 and table.value(3) == 'updated'
+    for index in indexes:
+        assert rows(index, 99) == [3]
+        assert rows(index, 3) == list(range(10, 50, 7))
+
+
+def test_update_then_delete_and_insert_over_one_table():
+    table = make_table()
+    indexes = [index_class(table) for index_class in INDEXES]
+    for index in indexes:
+        index.update(3, 99)
+        index.update(10, 99)
+    for index in indexes:
+        index.delete(3)
+        index.insert(99)
+    table.append(Item(99, 'new'))
+
+    assert len(table) == 51
+    for index in indexes:
+        assert rows(index, 99) == [10, 50]
+        assert rows(index, 3) == list(range(17, 50, 7))
+
+
+def test_table_update_keeps_the_column_of_built_indexes():
+    table = make_table()
+    index = HashIndex(table)
+    table.update(0, Item(42, 'updated'))
+    assert index.keys is not table.keys
+    assert rows(index, 0) == list(range(0, 50, 7))
+    assert rows(HashIndex(table), 42) == [0]
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_naive_index_skips_rows_appended_to_the_table_first(vectorized):
+    table = make_table()
+    index = NaiveIndex(table, vectorized=vectorized)
+    table.append(Item(3, 'new'))
+    assert rows(index, 3) == list(range(3, 50, 7))
+    assert index.look_up_many([3, 4]) == [list(range(3, 50, 7)), list(range(4, 50, 7))]
+    index.insert(3)
+    assert rows(index, 3) == list(range(3, 50, 7)) + [50]
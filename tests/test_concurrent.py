@@ -0,0 +1,92 @@
+import threading
+
+from tables.item import Item
+from indexes.btree import BTree
+from indexes.bplus_tree import BPlusTree
+from indexes.hash_index import HashIndex
+from indexes.concurrent import OptimisticIndex, ConcurrentHashIndex, CopyOnWriteBitmapIndex
+from tests.test_columnar import rows
+
+
+def make_table(count=100):
+    return [Item(key % 10, None) for key in range(count)]
+
+
+def test_optimistic_index_exposes_range_of_the_wrapped_index():
+    assert not hasattr(OptimisticIndex(BTree(make_table())), 'range')
+    index = OptimisticIndex(BPlusTree(make_table()))
+    assert index.range(2, 3) == list(range(2, 100, 10)) + list(range(3, 100, 10))
+
+
+def test_optimistic_index_reads_during_a_write_wait_for_it():
+    index = OptimisticIndex(BTree(make_table()))
+    results = []
+    with index.writing() as tree:
+        assert index.version & 1
+        reader = threading.Thread(target=lambda: results.append(index.look_up(3)))
+        reader.start()
+        reader.join(0.1)
+        # the reader found a writer at work and waits for the lock
+        assert reader.is_alive()
+        tree.insert(3)
+    reader.join()
+    assert sorted(results[0]) == list(range(3, 100, 10)) + [100]
+    assert not index.version & 1
+
+
+def test_optimistic_index_under_concurrent_writes():
+    index = OptimisticIndex(BTree(make_table()))
+    errors = []
+
+    def write():
+        for _ in range(200):
+            index.insert_many([42, 43])
+
+    def read():
+        try:
+            for _ in range(200):
+                assert rows(index, 5) == list(range(5, 100, 10))
+        except AssertionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write) for _ in range(2)] + [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(rows(index, 42)) == 400
+
+
+def test_concurrent_hash_index_under_concurrent_writes():
+    index = ConcurrentHashIndex(make_table(), stripes=4)
+
+    def write(key):
+        for _ in range(100):
+            index.insert_many(iter([key, key]))
+
+    threads = [threading.Thread(target=write, args=(key,)) for key in range(20, 24)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert index.row_count == 900
+    assert sum(len(rows(index, key)) for key in range(20, 24)) == 800
+    # every row id was given to exactly one row
+    assert sorted(rid for key in range(24) for rid in rows(index, key)) == list(range(900))
+    reference = HashIndex([Item(index.keys[rid], None) for rid in range(900)])
+    for key in range(24):
+        assert rows(index, key) == rows(reference, key)
+
+
+def test_copy_on_write_bitmap_index_keeps_published_bitmaps():
+    index = CopyOnWriteBitmapIndex(make_table())
+    bitmap = index.bitmap_table[3]
+    published = bitmap.get_row_ids()
+    index.update(3, 4)
+    index.delete_many(iter([13, 23]))
+    index.insert(3)
+
+    assert bitmap.get_row_ids() == published
+    assert rows(index, 3) == [33, 43, 53, 63, 73, 83, 93, 100]
+    assert rows(index, 4) == [3] + list(range(4, 100, 10))
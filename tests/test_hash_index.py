@@ -0,0 +1,37 @@
+import pytest
+
+from tables.item import Item
+from indexes.hash_index import HashIndex, HashTable, OpenAddressingHashTable
+
+
+def longest_cluster(table):
+    """ Returns the length of the longest run of occupied slots, walked by a look-up in the worst case """
+    longest = length = 0
+    for value in table.values:
+        length = length + 1 if value != table.EMPTY else 0
+        longest = max(longest, length)
+    return longest
+
+
+@pytest.mark.parametrize('engine', [HashTable, OpenAddressingHashTable])
+def test_look_up_of_sequential_int_keys(engine):
+    index = HashIndex([Item(key, None) for key in range(4096)], engine=engine)
+    assert index.look_up_many(list(range(4096))) == [[key] for key in range(4096)]
+    assert index.look_up(4096) is None
+    if engine is OpenAddressingHashTable:
+        # sequential hash codes would fill one cluster of all 4096 keys
+        assert longest_cluster(index.hash_table) < 64
+
+
+def test_open_addressing_keeps_duplicates_and_removes_them():
+    index = HashIndex([Item(key % 3, None) for key in range(30)], engine=OpenAddressingHashTable)
+    index.delete_many([0, 3, 4])
+    assert sorted(index.look_up(0)) == list(range(6, 30, 3))
+    assert sorted(index.look_up(1)) == [1] + list(range(7, 30, 3))
+    assert index.look_up_many([None, 2]) == [None, index.look_up(2)]
+
+
+@pytest.mark.parametrize('load_factor', [0, 1.0, 1.5])
+def test_open_addressing_rejects_load_factor_leaving_no_empty_slot(load_factor):
+    with pytest.raises(ValueError):
+        OpenAddressingHashTable(capacity=8, load_factor=load_factor)
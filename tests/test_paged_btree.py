@@ -0,0 +1,98 @@
+import random
+import tempfile
+
+import pytest
+
+from tables.item import Item
+from indexes.paged_btree import BufferPool, PagedBTree
+from tests.test_columnar import rows
+
+PAGE_SIZE = 64
+
+
+class Page:
+    def __init__(self, data):
+        self.data = data
+
+
+def make_pool(capacity, pages=5):
+    """ Returns a buffer pool over a file of pages filled with their numbers """
+    file = tempfile.TemporaryFile()
+    for page in range(pages):
+        file.write(bytes([page]) * PAGE_SIZE)
+    pool = BufferPool(file, PAGE_SIZE, capacity, Page, lambda page, size: page.data)
+    pool.page_count = pages
+    return pool
+
+
+def read_page(pool, page):
+    pool.file.seek(page * PAGE_SIZE)
+    return pool.file.read(PAGE_SIZE)
+
+
+def test_buffer_pool_evicts_the_least_recently_used_page():
+    pool = make_pool(capacity=2)
+    for page in (1, 2, 1, 3):
+        pool.fetch(page)
+        pool.unpin(page)
+
+    assert list(pool.frames) == [1, 3]
+    assert (pool.hits, pool.misses) == (1, 3)
+
+
+def test_buffer_pool_writes_back_only_dirty_pages_on_eviction():
+    pool = make_pool(capacity=1)
+    pool.fetch(1).data = b'a' * PAGE_SIZE
+    pool.unpin(1)
+    pool.fetch(2).data = b'b' * PAGE_SIZE
+    pool.unpin(2, dirty=True)
+    pool.fetch(3)
+    pool.unpin(3)
+
+    assert read_page(pool, 1) == bytes([1]) * PAGE_SIZE
+    assert read_page(pool, 2) == b'b' * PAGE_SIZE
+    assert pool.writes == 1
+    assert pool.fetch(2).data == b'b' * PAGE_SIZE
+
+
+def test_buffer_pool_keeps_pinned_pages():
+    pool = make_pool(capacity=2)
+    pool.fetch(1)
+    pool.fetch(2)
+    pool.unpin(2)
+    pool.fetch(3)
+
+    assert list(pool.frames) == [1, 3]
+    with pytest.raises(RuntimeError):
+        pool.fetch(4)
+
+
+def make_table():
+    generator = random.Random(3)
+    return [Item(generator.randrange(400), None) for _ in range(3000)]
+
+
+def test_tree_larger_than_the_pool_answers_like_in_memory(tmp_path):
+    table = make_table()
+    path = str(tmp_path / 'tree.bin')
+    tree = PagedBTree(table, path, page_size=256, pool_pages=8)
+    tree.insert_many([7, 401, 7])
+    tree.delete_many(range(0, 3000, 5))
+    table += [Item(7, None), Item(401, None), Item(7, None)]
+    expected = {key: [] for key in range(402)}
+    for rid, key in enumerate(item.key() for item in table):
+        if rid >= 3000 or rid % 5:
+            expected[key].append(rid)
+
+    assert tree.pool.page_count > 8
+    assert len(tree.pool.frames) <= 8
+    assert tree.pool.writes > 0
+    for key in range(402):
+        assert rows(tree, key) == expected[key]
+    assert list(tree.range(10, 12)) == [rid for key in (10, 11, 12) for rid in expected[key]]
+    tree.close()
+
+    reopened = PagedBTree.open(path, table, pool_pages=4)
+    assert [rows(reopened, key) for key in range(402)] == [expected[key] for key in range(402)]
+    assert len(reopened.pool.frames) <= 4
+    reopened.close()
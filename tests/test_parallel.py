@@ -0,0 +1,53 @@
+import gc
+import random
+
+import pytest
+
+from tables.columnar import ColumnarTable
+from tables.item import Item
+from indexes.bitmap_index import BitmapIndex, IntBitmap
+from indexes.btree import BTree
+from indexes.bplus_tree import BPlusTree
+from indexes.hash_index import HashIndex, OpenAddressingHashTable
+from indexes.naive_index import NaiveIndex
+from indexes.parallel import build_parallel
+from indexes.roaring_bitmap import RoaringBitmap
+from tests.test_columnar import rows
+
+
+@pytest.mark.parametrize('index_class', [BTree, BPlusTree, HashIndex, BitmapIndex])
+@pytest.mark.parametrize('key_type', [int, str])
+def test_parallel_build_matches_sequential_build(index_class, key_type):
+    generator = random.Random(2)
+    table = ColumnarTable(Item(key_type(generator.randrange(50)), None) for _ in range(500))
+    index = build_parallel(index_class, table, workers=3, min_rows=1)
+    reference = index_class(table)
+
+    assert index.keys is table.keys
+    for key in map(key_type, range(52)):
+        assert rows(index, key) == rows(reference, key)
+
+
+@pytest.mark.parametrize('index_class, options', [
+    (BTree, {'degree': 4}),
+    (HashIndex, {'engine': OpenAddressingHashTable}),
+    (HashIndex, {'incremental': True}),
+    (BitmapIndex, {'bitmap_class': IntBitmap}),
+    (BitmapIndex, {'bitmap_class': RoaringBitmap}),
+])
+def test_parallel_build_passes_options(index_class, options):
+    generator = random.Random(3)
+    table = [Item(generator.randrange(-20, 80), None) for _ in range(1000)]
+    index = build_parallel(index_class, table, workers=4, min_rows=1, **options)
+    reference = index_class(table, **options)
+
+    for key in range(-21, 81):
+        assert rows(index, key) == rows(reference, key)
+    index.insert(80)
+    assert rows(index, 80) == [1000]
+    assert gc.isenabled()
+
+
+def test_parallel_build_rejects_indexes_without_from_postings():
+    with pytest.raises(TypeError):
+        build_parallel(NaiveIndex, [Item(1, None)])
@@ -0,0 +1,93 @@
+import random
+
+import pytest
+
+from indexes.roaring_bitmap import CHUNK_SIZE, ArrayContainer, BitmapContainer, RoaringBitmap, RunContainer
+
+CARDINALITY = 3 * CHUNK_SIZE + 100
+
+
+def make_rows(seed):
+    """ Returns row ids with a sparse, a dense and a run-length chunk, and a few rows in the partial last chunk """
+    generator = random.Random(seed)
+    rows = set(generator.sample(range(CHUNK_SIZE), 300))
+    rows.update(generator.sample(range(CHUNK_SIZE, 2 * CHUNK_SIZE), 20000))
+    start = 2 * CHUNK_SIZE + generator.randrange(1000)
+    rows.update(range(start, start + 30000))
+    rows.update(generator.sample(range(3 * CHUNK_SIZE, CARDINALITY), 10))
+    return rows
+
+
+def make_bitmap(rows):
+    bitmap = RoaringBitmap(CARDINALITY)
+    bitmap.set_bits(sorted(rows))
+    return bitmap
+
+
+def assert_matches(bitmap, rows):
+    assert bitmap.get_row_ids() == sorted(rows)
+    assert bitmap.count() == len(rows)
+    assert bitmap.is_empty() == (not rows)
+
+
+def test_containers_are_chosen_by_density():
+    bitmap = make_bitmap(make_rows(1))
+
+    assert isinstance(bitmap.containers[0], ArrayContainer)
+    assert isinstance(bitmap.containers[1], BitmapContainer)
+    assert isinstance(bitmap.containers[2], RunContainer)
+
+
+@pytest.mark.parametrize('seeds', [(1, 2), (3, 3), (4, 5)])
+def test_operations_match_python_sets(seeds):
+    left, right = map(make_rows, seeds)
+    a, b = make_bitmap(left), make_bitmap(right)
+
+    assert_matches(a & b, left & right)
+    assert_matches(a | b, left | right)
+    assert_matches(a ^ b, left ^ right)
+    assert_matches(a - b, left - right)
+    assert_matches(~a, set(range(CARDINALITY)) - left)
+    # operations never modify their operands
+    assert_matches(a, left)
+    assert_matches(b, right)
+
+
+def test_single_bit_updates_match_python_sets():
+    generator = random.Random(6)
+    rows = make_rows(6)
+    bitmap = make_bitmap(rows)
+    for k in generator.sample(range(CARDINALITY), 3000):
+        if generator.random() < 0.5:
+            bitmap.set_bit(k)
+            rows.add(k)
+        else:
+            bitmap.clear_bit(k)
+            rows.discard(k)
+        assert bitmap.test_bit(k) == (k in rows)
+
+    assert_matches(bitmap, rows)
+
+
+def test_batch_updates_match_python_sets():
+    generator = random.Random(7)
+    rows = make_rows(7)
+    bitmap = make_bitmap(rows)
+    added = generator.sample(range(CARDINALITY), 5000)
+    removed = generator.sample(range(CARDINALITY), 40000)
+
+    bitmap.set_bits(added)
+    bitmap.clear_bits(removed)
+
+    assert_matches(bitmap, (rows | set(added)) - set(removed))
+
+
+def test_parts_of_slices_join_into_the_bitmap():
+    rows = make_rows(8)
+    bounds = [0, 1000, CHUNK_SIZE + 64, 2 * CHUNK_SIZE + 500, CARDINALITY]
+    bitmap = RoaringBitmap(CARDINALITY)
+    for start, stop in zip(bounds, bounds[1:]):
+        bitmap.join_part(RoaringBitmap.part_of([rid - start for rid in sorted(rows) if start <= rid < stop], start))
+
+    assert_matches(bitmap, rows)
+    assert_matches(bitmap ^ make_bitmap(rows), set())
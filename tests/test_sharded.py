@@ -0,0 +1,57 @@
+import pytest
+
+from tables.item import Item
+from indexes.bplus_tree import BPlusTree
+from indexes.hash_index import HashIndex
+from indexes.naive_index import NaiveIndex
+from indexes.sharded import ShardedIndex
+from tests.test_columnar import rows
+
+
+def make_table():
+    return [Item(key % 13, None) for key in range(100)]
+
+
+@pytest.mark.parametrize('index_class', [NaiveIndex, HashIndex, BPlusTree])
+def test_sharded_index_returns_what_its_shards_return(index_class):
+    table = make_table()
+    index = ShardedIndex(table, index_class, shards=3)
+    reference = index_class(table)
+
+    assert index.look_up(99) == reference.look_up(99)
+    assert index.look_up_many([99, 1]) == [reference.look_up(99), reference.look_up(1)]
+    for key in range(13):
+        assert rows(index, key) == rows(reference, key)
+
+
+def test_sharded_index_routes_rows_by_the_shard_of_their_key():
+    index = ShardedIndex(make_table(), shards=4)
+
+    for rid, key in enumerate(index.keys):
+        shard = index.shard_of(key)
+        assert index.row_shards[rid] == shard
+        assert index.global_rids[shard][index.local_rids[rid]] == rid
+        assert index.shards[shard].call('look_up', key) is not None
+
+
+def test_sharded_index_moves_updated_rows_between_shards():
+    index = ShardedIndex(make_table(), shards=4)
+    key = next(key for key in range(13, 50) if index.shard_of(key) != index.shard_of(0))
+
+    index.update(0, key)
+    index.insert(0)
+
+    assert index.row_shards[0] == index.shard_of(key)
+    assert rows(index, key) == [0]
+    assert rows(index, 0) == list(range(13, 100, 13)) + [100]
+
+
+def test_sharded_index_in_processes_matches_local_shards():
+    table = make_table()
+    with ShardedIndex(table, BPlusTree, shards=2, processes=True) as index:
+        local = ShardedIndex(table, BPlusTree, shards=2)
+        index.delete_many([1, 14])
+        local.delete_many([1, 14])
+
+        assert index.look_up_many(list(range(14))) == local.look_up_many(list(range(14)))
+        assert index.range(3, 5) == local.range(3, 5)
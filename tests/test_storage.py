@@ -0,0 +1,70 @@
+import pytest
+
+from tables.item import Item
+from indexes.bitmap_index import BitmapIndex
+from indexes.bitsliced_index import BitSlicedIndex
+from indexes.bplus_tree import BPlusTree
+from indexes.btree import BTree
+from indexes.hash_index import HashIndex
+from indexes.naive_index import NaiveIndex
+from indexes.storage import HASHED, SORTED, MappedIndex, read_index, write_index
+from tests.test_columnar import rows
+
+INDEXES = [NaiveIndex, BitmapIndex, BitSlicedIndex, BTree, BPlusTree, HashIndex]
+
+
+def make_keys(key_type):
+    # key 0 is frequent enough for its rows to be stored as a bitmap
+    keys = [0 if rid % 3 == 0 else rid % 17 for rid in range(300)]
+    return keys if key_type is int else ['kľúč {}'.format(key) for key in keys]
+
+
+def probes(key_type):
+    return list(map(key_type, range(18))) if key_type is int else ['kľúč {}'.format(key) for key in range(18)]
+
+
+@pytest.mark.parametrize('index_class', INDEXES)
+@pytest.mark.parametrize('key_type', [int, str])
+def test_save_load_and_mapped_round_trip(index_class, key_type, tmp_path):
+    if index_class is BitSlicedIndex and key_type is str:
+        pytest.skip("bit-sliced index takes int keys only")
+    keys = make_keys(key_type)
+    index = index_class([Item(key, None) for key in keys])
+    index.delete_many([0, 5, 6])
+    path = str(tmp_path / 'index.bin')
+    index.save(path)
+
+    loaded = index_class.load(path)
+    with index_class.load(path, mapped=True) as mapped:
+        assert isinstance(mapped, MappedIndex)
+        assert mapped.keys() == keys
+        for key in probes(key_type):
+            assert rows(loaded, key) == rows(index, key)
+            assert rows(mapped, key) == rows(index, key)
+        assert [sorted(rids or []) for rids in mapped.look_up_many(probes(key_type)[:3])] == \
+            [rows(index, key) for key in probes(key_type)[:3]]
+    # a loaded index takes changes like a built one
+    loaded.insert(keys[1])
+    assert rows(loaded, keys[1]) == rows(index, keys[1]) + [300]
+
+
+@pytest.mark.parametrize('layout', [SORTED, HASHED])
+def test_file_of_one_index_loads_into_another(layout, tmp_path):
+    keys = make_keys(int)
+    postings = [(key, [rid for rid, other in enumerate(keys) if other == key]) for key in set(keys)]
+    path = str(tmp_path / 'index.bin')
+    write_index(path, keys, postings, layout)
+
+    loaded_keys, loaded_postings = read_index(path)
+    assert loaded_keys == keys
+    assert [(key, list(rids)) for key, rids in loaded_postings] == sorted(postings)
+    for index_class in INDEXES:
+        index = index_class.load(path)
+        assert [rows(index, key) for key in range(18)] == [sorted(dict(postings).get(key, [])) for key in range(18)]
+
+
+def test_mapped_index_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(bytes(8192))
+    with pytest.raises(ValueError):
+        MappedIndex(str(path))